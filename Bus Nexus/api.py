@@ -0,0 +1,183 @@
+"""Headless JSON API for search and booking, alongside the Streamlit UI.
+
+Serves the same busnexus.database functions as the pages without a Streamlit script
+run per request. Run from the "Bus Nexus" directory, e.g.:
+
+    BUSNEXUS_API_SECRET=... uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Every handler is async; the blocking MySQL calls run on the threadpool and share
+the process-wide connection pool, so a slow query never blocks the event loop.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from busnexus.capture import start_capture
+from busnexus.connection import database_session
+from busnexus.lifecycle import start_lifecycle
+from busnexus.outbox import start_tailer
+from busnexus.database import (
+    login_user, get_search_results, get_fare_calendar, get_trip_details,
+    quote_fare, add_booking, get_booking, get_booking_history, cancel_booking
+)
+from busnexus.errors import DatabaseError
+
+logger = logging.getLogger("busnexus.api")
+
+API_SECRET = os.getenv("BUSNEXUS_API_SECRET")
+if not API_SECRET:
+    # Tokens then only validate in this process and die with it
+    logger.warning("BUSNEXUS_API_SECRET is not set; using a random per-process secret")
+    API_SECRET = secrets.token_hex(32)
+TOKEN_TTL = timedelta(hours=int(os.getenv("BUSNEXUS_API_TOKEN_TTL_HOURS", "12")))
+# Same rule as the passenger dashboard
+CANCELLATION_WINDOW = timedelta(hours=24)
+MAX_PAGE_SIZE = 100
+# Days either side of the date a fare calendar may cover
+MAX_CALENDAR_DAYS = 15
+
+app = FastAPI(title="BusNexus API")
+# Record query traffic for benchmarks/replay.py when BUSNEXUS_QUERY_CAPTURE is set
+start_capture()
+# Follow other processes' changes so this process's caches are invalidated
+start_tailer()
+# Move trips through boarding, departed and completed when BUSNEXUS_LIFECYCLE_SECONDS is set;
+# otherwise python -m busnexus.lifecycle does
+start_lifecycle()
+
+@app.exception_handler(DatabaseError)
+async def database_error(request: Request, exc: DatabaseError):
+    logger.error("Database error on %s: %s", request.url.path, exc)
+    return JSONResponse(status_code=503, content={'detail': "Database is temporarily unavailable"})
+
+# Bearer tokens: base64("user_id:role:expiry") + "." + HMAC-SHA256 signature
+def _sign(payload):
+    return hmac.new(API_SECRET.encode("utf-8"), payload, hashlib.sha256).hexdigest()
+
+def issue_token(user):
+    expires = int(time.time() + TOKEN_TTL.total_seconds())
+    payload = f"{user['user_id']}:{user['role']}:{expires}".encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii") + "." + _sign(payload)
+
+def current_user(authorization: Optional[str] = Header(None)):
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    try:
+        encoded, signature = authorization[len("Bearer "):].split(".", 1)
+        payload = base64.urlsafe_b64decode(encoded.encode("ascii"))
+        user_id, role, expires = payload.decode("utf-8").split(":")
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Malformed token")
+    if not hmac.compare_digest(signature, _sign(payload)) or int(expires) < time.time():
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return {'user_id': int(user_id), 'role': role}
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+
+class QuoteRequest(BaseModel):
+    trip_id: int
+    num_seats: int = Field(ge=1)
+    promo_code: Optional[str] = Field(None, max_length=30)
+
+class BookingRequest(BaseModel):
+    trip_id: int
+    num_seats: int = Field(ge=1)
+    # Charge a quote from POST /quotes; without one the current fare is charged
+    quote_id: Optional[int] = None
+
+@app.post("/auth/login")
+async def login(body: LoginRequest):
+    success, result = await run_in_threadpool(login_user, body.email, body.password)
+    if not success:
+        raise HTTPException(status_code=401, detail=result)
+    return {'token': issue_token(result), 'user': result}
+
+@app.get("/search")
+async def search(origin: str, destination: str, travel_date: date, bus_type: Optional[str] = None,
+                 min_fare: Optional[float] = Query(None, ge=0), max_fare: Optional[float] = Query(None, ge=0)):
+    results = await run_in_threadpool(
+        get_search_results, origin, destination, travel_date, bus_type, min_fare, max_fare
+    )
+    return {'results': results}
+
+@app.get("/fare-calendar")
+async def fare_calendar(origin: str, destination: str, travel_date: date,
+                        days: int = Query(3, ge=0, le=MAX_CALENDAR_DAYS), bus_type: Optional[str] = None):
+    calendar = await run_in_threadpool(get_fare_calendar, origin, destination, travel_date, days, bus_type)
+    return {'days': calendar}
+
+@app.get("/trips/{trip_id}")
+async def trip_details(trip_id: int):
+    trip = await run_in_threadpool(get_trip_details, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip
+
+def _as_user(user, function, *args):
+    # After a user's own booking or cancellation their reads stay on the primary for a while
+    with database_session(f"user:{user['user_id']}"):
+        return function(*args)
+
+@app.post("/quotes", status_code=201)
+async def create_quote(body: QuoteRequest, user=Depends(current_user)):
+    success, result = await run_in_threadpool(
+        quote_fare, user['user_id'], body.trip_id, body.num_seats, body.promo_code
+    )
+    if not success:
+        raise HTTPException(status_code=409, detail=result)
+    return result
+
+@app.post("/bookings", status_code=201)
+async def create_booking(body: BookingRequest, user=Depends(current_user),
+                         idempotency_key: Optional[str] = Header(None, max_length=64)):
+    # Clients retrying a request send the same Idempotency-Key and get the original booking back;
+    # keys are per user, and a key reused for a different trip or seat count gets a 409
+    success, result = await run_in_threadpool(
+        _as_user, user, add_booking, user['user_id'], body.trip_id, body.num_seats, None, "booked", idempotency_key,
+        body.quote_id
+    )
+    if not success:
+        raise HTTPException(status_code=409, detail=result)
+    return {'booking_id': result}
+
+@app.get("/bookings")
+async def booking_history(user=Depends(current_user),
+                          before_datetime: Optional[datetime] = None, before_id: Optional[int] = None,
+                          limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), include_archived: bool = False):
+    before = (before_datetime, before_id) if before_datetime and before_id else None
+    bookings = await run_in_threadpool(
+        _as_user, user, get_booking_history, user['user_id'], before, limit + 1, include_archived
+    )
+    # One extra row tells whether there is a next page
+    next_cursor = None
+    if len(bookings) > limit:
+        last = bookings[limit - 1]
+        next_cursor = {'before_datetime': last['booking_datetime'], 'before_id': last['booking_id']}
+    return {'bookings': bookings[:limit], 'next': next_cursor}
+
+@app.post("/bookings/{booking_id}/cancel")
+async def cancel(booking_id: int, user=Depends(current_user)):
+    booking = await run_in_threadpool(get_booking, booking_id)
+    if not booking or booking['user_id'] != user['user_id']:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if booking['booking_status'] != 'booked':
+        raise HTTPException(status_code=409, detail="Only active bookings can be cancelled")
+    if booking['departure_datetime'] <= datetime.now() + CANCELLATION_WINDOW:
+        raise HTTPException(status_code=409, detail="Bookings can only be cancelled up to 24 hours before departure")
+    success, message = await run_in_threadpool(_as_user, user, cancel_booking, booking_id)
+    if not success:
+        raise HTTPException(status_code=409, detail=message)
+    return {'booking_id': booking_id, 'message': message}
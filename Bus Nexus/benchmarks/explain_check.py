@@ -0,0 +1,278 @@
+"""EXPLAIN plan regression check for every statement busnexus.database runs.
+
+Each case calls one data-layer function with arguments drawn from the dataset,
+records the statements it ran and asks the optimizer for their plans. INSERTs
+are not explained. A case fails when one of its statements:
+
+- full-scans a large table (a full index scan counts too), or
+- sorts or groups a large table through a filesort or temporary table,
+
+unless that table is listed for the case in ALLOWED_SCANS. Plans are also
+compared with the engine's entry in explain_snapshot.json. A changed access
+type or index is reported. With --strict it also fails the run. A row
+estimate grown more than ROWS_GROWTH_LIMIT times always fails.
+
+Run from the "Bus Nexus" directory against a database filled by
+benchmarks.generate_dataset; pending migrations are applied first. The
+booking and cancel cases book one seat on a future trip and cancel it again,
+and the delete cases only target rows still in use, so nothing is deleted:
+
+    python -m benchmarks.explain_check --database-url sqlite:///busnexus-bench.db
+    python -m benchmarks.explain_check --update      # accept the current plans as the snapshot
+
+The exit status is 1 when any case fails.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+from busnexus import database, lifecycle, reminders
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure, get_config, explain, query_with_params
+from busnexus.instrumentation import add_listener, remove_listener, fingerprint
+from busnexus.schema import create_schema
+from busnexus.search_cache import configure_search_cache
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), "explain_snapshot.json")
+# Tables with at least this many rows must not be scanned or sorted wholesale
+LARGE_TABLE_ROWS = 100000
+# A row estimate may grow this much before it counts as a regression
+ROWS_GROWTH_LIMIT = 10
+TABLES = ["users", "driver", "bus", "route", "trip", "booking", "ticket",
+          "trip_archive", "booking_archive", "ticket_archive"]
+
+# (case, table) -> why scanning that table is accepted. Dashboard aggregates read every
+# booking by design; anything else they touch must still go through an index.
+ALLOWED_SCANS = {
+    ("get_total_bookings", "booking"): "dashboard total over all bookings",
+    ("get_daily_revenue", "booking"): "revenue per day over all bookings",
+    ("get_daily_revenue_range", "booking"): "no index on booking_datetime alone; range is a filter on the scan",
+    ("get_route_popularity", "booking"): "popularity over all bookings",
+    ("get_route_popularity", "trip"): "groups every booked trip by corridor",
+    ("get_popular_destinations", "booking"): "popularity over all bookings",
+    ("get_popular_destinations", "trip"): "groups every booked trip by destination",
+    ("get_all_trips_including_past", "trip"): "walks idx_trip_departure in order and stops at the page limit",
+    ("get_all_trips_archived", "trip"): "walks idx_trip_departure in order and stops at the page limit",
+    ("get_all_trips_archived", "trip_archive"): "walks idx_trip_archive_departure in order and stops at the page limit",
+    ("get_daily_revenue_historical", "booking"): "no index on booking_datetime alone; range is a filter on the scan",
+}
+
+_TABLE_REFERENCE = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|GROUP|ORDER|LIMIT|LEFT|RIGHT|INNER|SET|USING)\b)(\w+))?",
+    re.IGNORECASE
+)
+
+def table_aliases(query):
+    """Alias (or bare table name) -> table name for every table in query"""
+    aliases = {}
+    for table, alias in _TABLE_REFERENCE.findall(query):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+def load_sample():
+    now = datetime.now()
+    trip = query_with_params("""
+    SELECT t.trip_id, t.bus_id, t.route_id, b.driver_id, t.departure_datetime, r.origin, r.destination
+    FROM trip t
+    JOIN bus b ON t.bus_id = b.bus_id
+    JOIN route r ON t.route_id = r.route_id
+    WHERE t.status = 'scheduled' AND t.departure_datetime > %s AND t.seats_available > 0
+    ORDER BY t.departure_datetime
+    LIMIT 1
+    """, (now + timedelta(days=2),))
+    if not trip:
+        sys.exit("No bookable future trips; fill the database with benchmarks.generate_dataset first")
+    user = query_with_params("""
+    SELECT u.user_id, u.email
+    FROM users u
+    WHERE u.role = 'passenger'
+    ORDER BY u.user_id
+    LIMIT 1
+    """)[0]
+    return {'trip': trip[0], 'user': user, 'today': now.date()}
+
+def build_cases(sample):
+    """Case name -> callable running the function under test; later cases use earlier results"""
+    trip, user, today = sample['trip'], sample['user'], sample['today']
+    state = {}
+
+    def book():
+        success, booking_id = database.add_booking(user['user_id'], trip['trip_id'], 1)
+        if not success:
+            raise RuntimeError(f"Booking for the explain run failed: {booking_id}")
+        state['booking_id'] = booking_id
+
+    def history_page_2():
+        first_page = database.get_booking_history(user['user_id'], None, 20)
+        last = first_page[-1]
+        database.get_booking_history(user['user_id'], (last['booking_datetime'], last['booking_id']), 20)
+
+    def trips_page_2():
+        first_page = database.get_all_trips(False, None, 20)
+        last = first_page[-1]
+        database.get_all_trips(False, (last['departure_datetime'], last['trip_id']), 20)
+
+    return {
+        'register_user_existing_email': lambda: database.register_user("A", "B", user['email'], "0", "x"),
+        'login_user': lambda: database.login_user(user['email'], "password"),
+        'get_search_results': lambda: database.get_search_results(
+            trip['origin'], trip['destination'], trip['departure_datetime'].date()),
+        'get_fare_calendar': lambda: database.get_fare_calendar(
+            trip['origin'], trip['destination'], trip['departure_datetime'].date(), days=7),
+        'get_trip_details': lambda: database.get_trip_details(trip['trip_id']),
+        'get_booking_by_idempotency_key': lambda: database.get_booking_by_idempotency_key(user['user_id'], "explain-check"),
+        'quote_fare': lambda: database.quote_fare(user['user_id'], trip['trip_id'], 1),
+        'add_booking': book,
+        'get_booking_history': lambda: database.get_booking_history(user['user_id'], None, 20),
+        'get_booking_history_page_2': history_page_2,
+        'get_booking_history_archived': lambda: database.get_booking_history(
+            user['user_id'], None, 20, include_archived=True),
+        'get_booking': lambda: database.get_booking(state['booking_id']),
+        'get_booking_tickets': lambda: database.get_booking_tickets(state['booking_id']),
+        'get_tickets_for_bookings': lambda: database.get_tickets_for_bookings([state['booking_id'], 1, 2]),
+        'cancel_booking': lambda: database.cancel_booking(state['booking_id']),
+        'get_all_buses': lambda: database.get_all_buses(20, 20),
+        'bus_no_exists': lambda: database.bus_no_exists("BN-00001"),
+        'delete_bus_in_use': lambda: database.delete_bus(trip['bus_id']),
+        'get_all_routes': lambda: database.get_all_routes(),
+        'delete_route_in_use': lambda: database.delete_route(trip['route_id']),
+        'get_all_trips': lambda: database.get_all_trips(False, None, 20),
+        'get_all_trips_page_2': trips_page_2,
+        'get_all_trips_including_past': lambda: database.get_all_trips(True, None, 20),
+        'get_all_trips_archived': lambda: database.get_all_trips(True, None, 20, include_archived=True),
+        'get_total_bookings': lambda: database.get_total_bookings(),
+        'get_daily_revenue': lambda: database.get_daily_revenue(),
+        'get_daily_revenue_range': lambda: database.get_daily_revenue(today - timedelta(days=30), today),
+        'get_daily_revenue_historical': lambda: database.get_daily_revenue(
+            today - timedelta(days=365), today, include_archived=True),
+        'get_route_popularity': lambda: database.get_route_popularity(),
+        'get_popular_destinations': lambda: database.get_popular_destinations(),
+        'get_distinct_origins': lambda: database.get_distinct_origins(),
+        'get_distinct_destinations': lambda: database.get_distinct_destinations(),
+        'get_all_drivers': lambda: database.get_all_drivers(None, 20),
+        'delete_driver_in_use': lambda: database.delete_driver(trip['driver_id']),
+        'advance_trips': lambda: lifecycle.advance_trips(),
+        'due_reminders': lambda: reminders.due_bookings(datetime.now(), datetime.now() + timedelta(hours=1)),
+    }
+
+def capture_statements(case):
+    """Run case and return the distinct (query, params) pairs it executed, in order"""
+    statements = {}
+
+    def listener(record, key):
+        if key not in statements:
+            statements[key] = (record.query, record.params)
+
+    add_listener(listener)
+    try:
+        case()
+    finally:
+        remove_listener(listener)
+    return list(statements.values())
+
+def check_plan(case_name, query, plan, table_rows):
+    problems = []
+    aliases = table_aliases(query)
+    large = []
+    for step in plan:
+        table = aliases.get(step['table'], step['table'])
+        if table_rows.get(table, 0) < LARGE_TABLE_ROWS or (case_name, table) in ALLOWED_SCANS:
+            continue
+        large.append(table)
+        if step['access'] in ("full_scan", "index_scan"):
+            problems.append(f"{step['access'].replace('_', ' ')} of {table} ({table_rows[table]:,} rows)")
+    # Engines report a sort or temporary table on whichever step starts it, often a small
+    # table driving the join, but it holds rows from every table joined after it
+    if large and any(step['filesort'] for step in plan):
+        problems.append(f"filesort over {', '.join(large)}")
+    if large and any(step['temporary'] for step in plan):
+        problems.append(f"temporary table over {', '.join(large)}")
+    return problems
+
+def compare_with_snapshot(plan, snapshot_plan):
+    """(changes, regressions) between a plan and its snapshot"""
+    changes = []
+    regressions = []
+    shape = [(step['table'], step['access'], step['key'], step['filesort'], step['temporary']) for step in plan]
+    snapshot_shape = [(step['table'], step['access'], step['key'], step['filesort'], step['temporary'])
+                      for step in snapshot_plan]
+    if shape != snapshot_shape:
+        changes.append(f"plan changed from {snapshot_shape} to {shape}")
+    for step, snapshot_step in zip(plan, snapshot_plan):
+        if step['rows'] and snapshot_step['rows'] and step['rows'] > snapshot_step['rows'] * ROWS_GROWTH_LIMIT:
+            regressions.append(f"row estimate for {step['table']} grew from {snapshot_step['rows']:,} "
+                               f"to {step['rows']:,}")
+    return changes, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--update", action="store_true", help="Write the current plans to the snapshot")
+    parser.add_argument("--strict", action="store_true", help="Also fail when a plan differs from the snapshot")
+    parser.add_argument("--case", action="append", help="Only run these cases (the booking cases always run)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+    engine = get_config().engine
+    create_schema()
+    # Every case must reach the database to be explained
+    configure_search_cache(None)
+
+    snapshot = {}
+    if os.path.exists(SNAPSHOT_FILE):
+        with open(SNAPSHOT_FILE, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    engine_snapshot = snapshot.get(engine, {})
+
+    table_rows = {table: query_with_params(f"SELECT COUNT(*) AS n FROM {table}")[0]['n'] for table in TABLES}
+    cases = build_cases(load_sample())
+    required = {"add_booking", "cancel_booking"}
+
+    results = {}
+    failed = False
+    for name, case in cases.items():
+        if args.case and name not in args.case and name not in required:
+            continue
+        entries = []
+        for query, params in capture_statements(case):
+            if query.lstrip().upper().startswith("INSERT"):
+                continue
+            plan = explain(query, params)
+            key = fingerprint(query)
+            problems = check_plan(name, query, plan, table_rows)
+            changes = []
+            snapshot_plan = next((entry['plan'] for entry in engine_snapshot.get(name, [])
+                                  if entry['statement'] == key), None)
+            if snapshot_plan is not None:
+                changes, regressions = compare_with_snapshot(plan, snapshot_plan)
+                problems += regressions
+                if args.strict:
+                    problems += changes
+            elif engine_snapshot:
+                changes.append("statement is not in the snapshot")
+            entries.append({'statement': key, 'plan': plan})
+
+            status = "FAIL" if problems else ("CHANGED" if changes else "ok")
+            failed = failed or bool(problems)
+            print(f"{status:<8} {name}: {key[:110]}")
+            for line in problems + [change for change in changes if change not in problems]:
+                print(f"         - {line}")
+        results[name] = entries
+
+    if args.update:
+        snapshot[engine] = {**engine_snapshot, **results}
+        with open(SNAPSHOT_FILE, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Snapshot for {engine} written to {SNAPSHOT_FILE}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
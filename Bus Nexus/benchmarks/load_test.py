@@ -0,0 +1,313 @@
+"""Concurrent search, booking and cancellation load test with a seat invariant check.
+
+Drives get_search_results, get_trip_details, add_booking and cancel_booking
+from many threads (or processes) against a database filled by
+benchmarks.generate_dataset, then checks every trip the run touched:
+seats_available must equal the bus capacity minus the tickets of active
+bookings, and no trip may hold more live tickets than seats. Results are
+written as JSON so runs can be compared across commits. Run from the
+"Bus Nexus" directory:
+
+    python -m benchmarks.load_test --mix browse --workers 32 --duration 60
+    python -m benchmarks.load_test --mix flash_sale --workers 64 --processes --output flash.json
+    python -m benchmarks.load_test --mix cancel_storm --workers 32 --database-url sqlite:///busnexus-bench.db
+
+Mixes:
+    browse        mostly searches and trip details, some bookings and cancellations
+    flash_sale    every worker books seats on one trip until it sells out
+    cancel_storm  workers cancel existing bookings on future trips, some of them twice
+                  (a user double-clicking), with a little search and booking traffic
+
+The exit status is 1 when the invariant check fails.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from busnexus import database
+from busnexus.config import DatabaseConfig
+from busnexus.connection import DB_TRANSACTION_RETRIES, configure, get_config, query_with_params
+
+# Operation weights per mix
+MIXES = {
+    "browse": {"search": 60, "trip_details": 25, "book": 12, "cancel": 3},
+    "flash_sale": {"book": 90, "trip_details": 10},
+    "cancel_storm": {"cancel": 85, "search": 10, "book": 5},
+}
+SAMPLE_TRIPS = 5000
+SAMPLE_USERS = 1000
+STORM_BOOKINGS = 20000
+INVARIANT_CHUNK = 500
+# Violations listed in the JSON output; the counts cover all of them
+MAX_REPORTED_VIOLATIONS = 20
+
+def load_sample(mix, flash_trip_id):
+    """Trips, search keys, users and (for cancel_storm) bookings the workers draw from"""
+    now = datetime.now()
+    trips = query_with_params("""
+    SELECT t.trip_id, t.seats_available, r.origin, r.destination, t.departure_datetime
+    FROM trip t
+    JOIN route r ON t.route_id = r.route_id
+    WHERE t.status = 'scheduled' AND t.departure_datetime > %s
+    ORDER BY t.departure_datetime, t.trip_id
+    LIMIT %s
+    """, (now, SAMPLE_TRIPS))
+    if not trips:
+        sys.exit("No future scheduled trips; fill the database with benchmarks.generate_dataset first")
+    users = [row['user_id'] for row in query_with_params(
+        "SELECT user_id FROM users WHERE role = 'passenger' ORDER BY user_id LIMIT %s", (SAMPLE_USERS,)
+    )]
+    sample = {
+        'trip_ids': [trip['trip_id'] for trip in trips],
+        'searches': sorted({(trip['origin'], trip['destination'], trip['departure_datetime'].strftime("%Y-%m-%d"))
+                            for trip in trips}),
+        'user_ids': users,
+        'flash_trip_id': flash_trip_id or max(trips, key=lambda trip: trip['seats_available'])['trip_id'],
+        'storm_booking_ids': [],
+    }
+    if mix == "cancel_storm":
+        sample['storm_booking_ids'] = [row['booking_id'] for row in query_with_params("""
+        SELECT b.booking_id
+        FROM booking b
+        JOIN trip t ON b.trip_id = t.trip_id
+        WHERE b.booking_status = 'booked' AND t.status = 'scheduled' AND t.departure_datetime > %s
+        ORDER BY b.booking_id DESC
+        LIMIT %s
+        """, (now, STORM_BOOKINGS))]
+    return sample
+
+class Worker:
+    def __init__(self, index, mix, sample, deadline, seed, duplicate_cancel_rate, storm_booking_ids):
+        self.rng = random.Random(seed * 1000 + index)
+        self.mix = mix
+        self.sample = sample
+        self.deadline = deadline
+        self.duplicate_cancel_rate = duplicate_cancel_rate
+        self.storm_booking_ids = storm_booking_ids
+        self.operations, self.weights = zip(*MIXES[mix].items())
+        self.latencies = {operation: [] for operation in self.operations}
+        self.outcomes = {operation: {'ok': 0, 'rejected': 0, 'error': 0} for operation in self.operations}
+        self.my_bookings = []
+        self.cancelled = []
+        self.touched_trips = set()
+
+    def run(self):
+        while time.time() < self.deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                outcome = getattr(self, operation)()
+            except Exception:
+                outcome = 'error'
+            self.latencies[operation].append(time.perf_counter() - start)
+            self.outcomes[operation][outcome] += 1
+        return self
+
+    def _trip_id(self):
+        if self.mix == "flash_sale":
+            return self.sample['flash_trip_id']
+        return self.rng.choice(self.sample['trip_ids'])
+
+    def search(self):
+        origin, destination, travel_date = self.rng.choice(self.sample['searches'])
+        database.get_search_results(origin, destination, travel_date)
+        return 'ok'
+
+    def trip_details(self):
+        return 'ok' if database.get_trip_details(self._trip_id()) else 'rejected'
+
+    def book(self):
+        trip_id = self._trip_id()
+        seats = self.rng.choice([1, 1, 1, 2, 2, 3])
+        self.touched_trips.add(trip_id)
+        success, result = database.add_booking(self.rng.choice(self.sample['user_ids']), trip_id, seats)
+        if success:
+            self.my_bookings.append(result)
+            return 'ok'
+        return 'rejected' if result == "Insufficient seats available" else 'error'
+
+    def cancel(self):
+        if self.cancelled and self.rng.random() < self.duplicate_cancel_rate:
+            booking_id = self.rng.choice(self.cancelled)
+        elif self.storm_booking_ids:
+            booking_id = self.storm_booking_ids.pop()
+        elif self.my_bookings:
+            booking_id = self.my_bookings.pop()
+        else:
+            return 'rejected'
+        booking = database.get_booking(booking_id)
+        if booking:
+            self.touched_trips.add(booking['trip_id'])
+        success, _ = database.cancel_booking(booking_id)
+        if success:
+            self.cancelled.append(booking_id)
+            return 'ok'
+        return 'rejected'
+
+    def result(self):
+        return {
+            'latencies': self.latencies,
+            'outcomes': self.outcomes,
+            'touched_trips': sorted(self.touched_trips),
+        }
+
+def retry_counts():
+    return {labels[0][1]: value for labels, value in DB_TRANSACTION_RETRIES.samples()}
+
+def _run_process(args):
+    # Runs in a worker process: connect with the parent's settings and report plain data back
+    database_url, index, mix, sample, deadline, seed, duplicate_cancel_rate, storm_booking_ids = args
+    if database_url:
+        configure(DatabaseConfig.from_dsn(database_url))
+    result = Worker(index, mix, sample, deadline, seed, duplicate_cancel_rate, storm_booking_ids).run().result()
+    result['retries'] = retry_counts()
+    return result
+
+def run_workers(args, sample):
+    deadline = time.time() + args.duration
+    storm = sample['storm_booking_ids']
+    # Each worker cancels its own slice, so every booking is cancelled once before any repeats
+    slices = [storm[index::args.workers] for index in range(args.workers)]
+    if args.processes:
+        jobs = [(args.database_url, index, args.mix, sample, deadline, args.seed, args.duplicate_cancel_rate,
+                 slices[index]) for index in range(args.workers)]
+        with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+            return pool.map(_run_process, jobs)
+
+    before = retry_counts()
+    workers = [Worker(index, args.mix, sample, deadline, args.seed, args.duplicate_cancel_rate, slices[index])
+               for index in range(args.workers)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = [worker.result() for worker in workers]
+    after = retry_counts()
+    results[0]['retries'] = {reason: count - before.get(reason, 0) for reason, count in after.items()}
+    return results
+
+def check_invariants(trip_ids):
+    """Compare seats_available with capacity minus live tickets on every given trip"""
+    oversold = mismatched = 0
+    violations = []
+    trip_ids = sorted(trip_ids)
+    for chunk_start in range(0, len(trip_ids), INVARIANT_CHUNK):
+        chunk = trip_ids[chunk_start:chunk_start + INVARIANT_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        rows = query_with_params(f"""
+        SELECT
+            t.trip_id, t.seats_available, b.capacity,
+            (SELECT COUNT(*)
+             FROM ticket k
+             JOIN booking bk ON k.booking_id = bk.booking_id
+             WHERE bk.trip_id = t.trip_id AND bk.booking_status IN ('booked', 'completed')) AS live_tickets
+        FROM trip t
+        JOIN bus b ON t.bus_id = b.bus_id
+        WHERE t.trip_id IN ({placeholders})
+        """, tuple(chunk))
+        for row in rows:
+            is_oversold = row['live_tickets'] > row['capacity'] or row['seats_available'] < 0
+            is_mismatched = row['seats_available'] != row['capacity'] - row['live_tickets']
+            oversold += is_oversold
+            mismatched += is_mismatched
+            if (is_oversold or is_mismatched) and len(violations) < MAX_REPORTED_VIOLATIONS:
+                violations.append(row)
+    return {
+        'trips_checked': len(trip_ids),
+        'oversold': oversold,
+        'mismatched': mismatched,
+        'violations': violations,
+        'passed': oversold == 0 and mismatched == 0,
+    }
+
+def summarize(args, results, invariants, elapsed):
+    operations = {}
+    for operation in MIXES[args.mix]:
+        samples = [latency for result in results for latency in result['latencies'][operation]]
+        outcomes = {key: sum(result['outcomes'][operation][key] for result in results)
+                    for key in ('ok', 'rejected', 'error')}
+        summary = {'count': len(samples), **outcomes}
+        if len(samples) > 1:
+            quantiles = statistics.quantiles(samples, n=100)
+            summary.update({
+                'p50_ms': round(quantiles[49] * 1000, 3),
+                'p95_ms': round(quantiles[94] * 1000, 3),
+                'p99_ms': round(quantiles[98] * 1000, 3),
+                'max_ms': round(max(samples) * 1000, 3),
+            })
+        operations[operation] = summary
+
+    retries = {}
+    for result in results:
+        for reason, count in result.get('retries', {}).items():
+            retries[reason] = retries.get(reason, 0) + count
+
+    total = sum(summary['count'] for summary in operations.values())
+    return {
+        'label': args.label,
+        'started_at': datetime.now().isoformat(timespec="seconds"),
+        'engine': get_config().engine,
+        'mix': args.mix,
+        'workers': args.workers,
+        'mode': "processes" if args.processes else "threads",
+        'duration_s': round(elapsed, 2),
+        'seed': args.seed,
+        'operations_total': total,
+        'throughput_ops_s': round(total / elapsed, 1) if elapsed else 0,
+        'operations': operations,
+        'transaction_retries': retries,
+        'invariants': invariants,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL; must be a file or server database")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="browse")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--processes", action="store_true", help="One process per worker instead of threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trip-id", type=int, help="flash_sale target; default the sampled trip with most free seats")
+    parser.add_argument("--duplicate-cancel-rate", type=float, default=0.1,
+                        help="Share of cancellations that repeat one the worker already made")
+    parser.add_argument("--label", default=git_revision(), help="Stored in the JSON; defaults to the git revision")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+    if get_config().in_memory:
+        parser.error("an in-memory database holds no dataset; use a file or server database")
+
+    sample = load_sample(args.mix, args.trip_id)
+    started = time.perf_counter()
+    results = run_workers(args, sample)
+    elapsed = time.perf_counter() - started
+
+    touched = set().union(*(result['touched_trips'] for result in results))
+    report = summarize(args, results, check_invariants(touched), elapsed)
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0 if report['invariants']['passed'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Search latency with dynamic pricing on and off.
+
+Runs the same get_search_results calls, over corridor-days sampled from an
+existing dataset (benchmarks.generate_dataset), once with each fare mode:
+base fares only, dynamic pricing with a cold price table (every search prices
+its whole result in one numpy pass) and dynamic pricing with a warm one.
+With --cache the search cache is on, which leaves pricing as most of the
+work of a repeated search. Nothing is written. Run from the "Bus Nexus"
+directory:
+
+    python -m benchmarks.pricing_search --database-url sqlite:////tmp/busnexus-bench.db
+    python -m benchmarks.pricing_search --cache
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+
+from busnexus import database, pricing
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure, query_with_params
+from busnexus.search_cache import configure_search_cache, LocalStore
+
+def sample_searches(count, seed):
+    """(origin, destination, travel date) of count future trips, picked at random"""
+    query = """
+    SELECT r.origin, r.destination, t.departure_datetime
+    FROM trip t
+    JOIN route r ON t.route_id = r.route_id
+    WHERE t.departure_datetime >= %s AND t.status = 'scheduled'
+    ORDER BY t.departure_datetime
+    LIMIT %s
+    """
+    rows = query_with_params(query, (datetime.now(), count * 20))
+    rng = random.Random(seed)
+    return [(row['origin'], row['destination'], row['departure_datetime'].date())
+            for row in rng.sample(rows, min(count, len(rows)))]
+
+def run(searches, dynamic, warm):
+    pricing.DYNAMIC_PRICING = dynamic
+    if warm:
+        for search in searches:
+            database.get_search_results(*search)
+    latencies = []
+    rows = 0
+    for search in searches:
+        if dynamic and not warm:
+            pricing._price_table = pricing.PriceTable()
+        start = time.perf_counter()
+        rows += len(database.get_search_results(*search))
+        latencies.append(time.perf_counter() - start)
+    return latencies, rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="Serve repeated searches from the in-process search cache")
+    args = parser.parse_args()
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+    configure_search_cache(LocalStore() if args.cache else None)
+
+    searches = sample_searches(args.searches, args.seed)
+    # One untimed pass so every mode reads from the same warm page cache
+    run(searches, False, False)
+    modes = [("base fare", False, False), ("dynamic, cold", True, False), ("dynamic, warm", True, True)]
+    for name, dynamic, warm in modes:
+        latencies, rows = run(searches, dynamic, warm)
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{name:<14} n={len(latencies):<5} rows/search={rows / len(latencies):6.1f} "
+              f"p50={quantiles[49] * 1000:7.3f}ms p95={quantiles[94] * 1000:7.3f}ms p99={quantiles[98] * 1000:7.3f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Departure-reminder throughput: scheduler ticks plus SMTP delivery, in reminders per hour.
+
+Replays --hours of scheduler ticks, --tick seconds apart, starting at --start,
+against an existing dataset (benchmarks.generate_dataset), and sends every
+queued reminder to a minimal SMTP server started in this process, which
+accepts and discards the mail. The target is 100,000 reminders per hour. Run
+from the "Bus Nexus" directory on a copy of the database, since the reminders
+stay in the notification table:
+
+    python -m benchmarks.reminder_throughput --database-url sqlite:////tmp/copy.db --start "2026-10-01 00:00"
+"""
+import argparse
+import json
+import smtplib
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure, query_with_params
+from busnexus import notifications
+from busnexus.reminders import ReminderScheduler, REMINDER_OFFSETS
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Speaks enough SMTP for smtplib.SMTP.send_message and counts the messages it accepts"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, SMTPHandler)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 localhost")
+            elif command in (b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                self.reply("250 OK")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+def run(start, hours, tick, batch_size, port):
+    scheduler = ReminderScheduler()
+    connect = lambda: smtplib.SMTP("127.0.0.1", port, timeout=30)
+    due = queued = sent = 0
+    tick_seconds = send_seconds = 0.0
+    for step in range(int(hours * 3600 / tick) + 1):
+        now = start + timedelta(seconds=step * tick)
+        began = time.perf_counter()
+        for rows, added in scheduler.tick(now).values():
+            due += rows
+            queued += added
+        tick_seconds += time.perf_counter() - began
+        began = time.perf_counter()
+        sent += notifications.send_pending(batch_size, connect=connect)
+        send_seconds += time.perf_counter() - began
+    return {'due': due, 'queued': queued, 'sent': sent,
+            'tick_seconds': round(tick_seconds, 3), 'send_seconds': round(send_seconds, 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL; use a copy")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="Simulated time of the first tick")
+    parser.add_argument("--hours", type=float, default=1.0, help="Simulated hours of ticks")
+    parser.add_argument("--tick", type=float, default=60.0, help="Simulated seconds between ticks")
+    parser.add_argument("--batch-size", type=int, default=notifications.SEND_BATCH_SIZE,
+                        help="Messages sent per SMTP connection")
+    args = parser.parse_args()
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        result = run(args.start, args.hours, args.tick, args.batch_size, server.server_address[1])
+    finally:
+        server.shutdown()
+
+    elapsed = result['tick_seconds'] + result['send_seconds']
+    result.update({
+        'offsets': [label for label, _ in REMINDER_OFFSETS],
+        'simulated_hours': args.hours,
+        'smtp_accepted': server.messages,
+        'reminders_per_hour': round(result['sent'] / elapsed * 3600) if elapsed else None,
+        'backlog': query_with_params("SELECT COUNT(*) as backlog FROM notification WHERE status = 'pending'")[0]['backlog'],
+    })
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
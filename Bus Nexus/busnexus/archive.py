@@ -0,0 +1,265 @@
+"""Monthly archival of trips, with their bookings and tickets, out of the hot tables.
+
+Trips that departed in a closed month (older than ARCHIVE_KEEP_MONTHS whole
+months) move to trip_archive, booking_archive and ticket_archive (migration
+0007_archive_tables), so searches, bookings and the dashboard aggregates only
+ever touch recent and future rows. A trip moves together with its bookings and
+tickets, in batches of ARCHIVE_BATCH_SIZE trips, one transaction per batch, so
+no booking is ever separated from its trip and a failed batch leaves nothing
+half moved. Each finished month is recorded in archive_month. Each run also
+deletes fare quotes that expired without being booked.
+
+Native partitioning does not fit: MySQL cannot partition InnoDB tables that
+have foreign keys, and SQLite has no partitioning at all. The archive tables
+work the same on both engines.
+
+Reads include the archive only when asked for historical data; see the
+include_archived arguments in busnexus.database and is_historical() here. Run
+the archiver from cron (or with --every) in the "Bus Nexus" directory:
+
+    python -m busnexus.archive                       # move every closed month
+    python -m busnexus.archive --dry-run             # count what would move
+    python -m busnexus.archive --every 86400         # keep running, once a day
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, date
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import (
+    configure, query_with_params, execute_query,
+    acquire_connection, release_connection, execute_in_transaction, retry_transaction
+)
+from busnexus.errors import BusNexusError
+from busnexus.metrics import counter
+from busnexus import pricing
+
+# Whole months, before the current one, that stay in the hot tables
+ARCHIVE_KEEP_MONTHS = int(os.getenv("BUSNEXUS_ARCHIVE_KEEP_MONTHS", "3"))
+# Trips moved per transaction, with all their bookings and tickets
+ARCHIVE_BATCH_SIZE = int(os.getenv("BUSNEXUS_ARCHIVE_BATCH_SIZE", "500"))
+# Seconds a process keeps using the archive boundary it last read
+ARCHIVE_BOUNDARY_CACHE_SECONDS = 60.0
+
+# Table names for queries written with {trip}, {booking} and {ticket}
+HOT_TABLES = {'trip': "trip", 'booking': "booking", 'ticket': "ticket"}
+ARCHIVE_TABLES = {'trip': "trip_archive", 'booking': "booking_archive", 'ticket': "ticket_archive"}
+
+TRIP_COLUMNS = "trip_id, bus_id, route_id, departure_datetime, arrival_datetime, seats_available, status"
+BOOKING_COLUMNS = ("booking_id, user_id, trip_id, total_fare, payment_status, booking_status, "
+                   "booking_datetime, idempotency_key")
+TICKET_COLUMNS = "ticket_id, booking_id, seat_no, pickup_point, drop_point"
+
+ARCHIVED_ROWS = counter("busnexus_archived_rows_total", "Rows moved to the archive tables by table", ["table"])
+
+# Months
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def closed_before(keep_months=ARCHIVE_KEEP_MONTHS, now=None):
+    """First day of the oldest month kept in the hot tables; trips departing earlier are archived"""
+    return add_months(month_start(now or datetime.now()), -keep_months)
+
+# Where the archive ends, for the reads
+_boundary = None
+_boundary_read_at = None
+_boundary_lock = threading.Lock()
+
+def archived_before():
+    """
+    Start of the first month that was not archived, or None when nothing is.
+
+    Every trip departing before it is in trip_archive; a few may be newer (a trip
+    scheduled into a month after it was archived), which the archiver's next run
+    moves too.
+    """
+    global _boundary, _boundary_read_at
+    with _boundary_lock:
+        if _boundary_read_at is None or time.monotonic() - _boundary_read_at >= ARCHIVE_BOUNDARY_CACHE_SECONDS:
+            result = query_with_params("SELECT month FROM archive_month ORDER BY month DESC LIMIT 1")
+            _boundary = add_months(result[0]['month'], 1) if result else None
+            _boundary_read_at = time.monotonic()
+        return _boundary
+
+def is_historical(start):
+    """True when a range beginning at start (a date or datetime; None for the beginning of time) reaches archived months"""
+    boundary = archived_before()
+    if boundary is None:
+        return False
+    if start is None:
+        return True
+    return (start.date() if isinstance(start, datetime) else start) < boundary
+
+# Moving rows
+@retry_transaction
+def _archive_trips(trip_ids):
+    """Move trips and their bookings and tickets to the archive in one transaction; rows moved by table"""
+    placeholders = ", ".join(["%s"] * len(trip_ids))
+    params = tuple(trip_ids)
+    booking_ids = f"SELECT booking_id FROM booking WHERE trip_id IN ({placeholders})"
+    statements = [
+        # Lock the trips first. A booking made meanwhile would be deleted below without
+        # having been copied; bookings update or reference their trip's row, so they wait
+        (None, f"UPDATE trip SET status = status WHERE trip_id IN ({placeholders})"),
+        ("ticket", f"INSERT INTO ticket_archive ({TICKET_COLUMNS}) "
+                   f"SELECT {TICKET_COLUMNS} FROM ticket WHERE booking_id IN ({booking_ids})"),
+        ("booking", f"INSERT INTO booking_archive ({BOOKING_COLUMNS}) "
+                    f"SELECT {BOOKING_COLUMNS} FROM booking WHERE trip_id IN ({placeholders})"),
+        ("trip", f"INSERT INTO trip_archive ({TRIP_COLUMNS}) "
+                 f"SELECT {TRIP_COLUMNS} FROM trip WHERE trip_id IN ({placeholders})"),
+        # Children first, so no foreign key is left pointing at a deleted row
+        (None, f"DELETE FROM ticket WHERE booking_id IN ({booking_ids})"),
+        (None, f"DELETE FROM booking WHERE trip_id IN ({placeholders})"),
+        (None, f"DELETE FROM trip WHERE trip_id IN ({placeholders})"),
+    ]
+
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    moved = {}
+    try:
+        for table, statement in statements:
+            execute_in_transaction(cursor, statement, params)
+            if table:
+                moved[table] = cursor.rowcount
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+def _record_month(month, moved):
+    existing = query_with_params("SELECT month FROM archive_month WHERE month = %s", (month,))
+    if existing:
+        # A trip scheduled into the month after it was archived, moved on a later run
+        query = """
+        UPDATE archive_month
+        SET trips = trips + %s, bookings = bookings + %s, tickets = tickets + %s, archived_at = %s
+        WHERE month = %s
+        """
+        execute_query(query, (moved['trip'], moved['booking'], moved['ticket'], datetime.now(), month))
+    else:
+        query = """
+        INSERT INTO archive_month (month, trips, bookings, tickets, archived_at)
+        VALUES (%s, %s, %s, %s, %s)
+        """
+        execute_query(query, (month, moved['trip'], moved['booking'], moved['ticket'], datetime.now()))
+
+def _count_month(start, end):
+    query = """
+    SELECT
+        COUNT(DISTINCT t.trip_id) as trip_count,
+        COUNT(DISTINCT b.booking_id) as booking_count,
+        COUNT(tk.ticket_id) as ticket_count
+    FROM
+        trip t
+    LEFT JOIN
+        booking b ON b.trip_id = t.trip_id
+    LEFT JOIN
+        ticket tk ON tk.booking_id = b.booking_id
+    WHERE
+        t.departure_datetime >= %s AND t.departure_datetime < %s
+    """
+    row = query_with_params(query, (start, end))[0]
+    return {'trip': row['trip_count'], 'booking': row['booking_count'], 'ticket': row['ticket_count']}
+
+def archive_month(month, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """
+    Move every trip departing in month, with its bookings and tickets, to the archive.
+
+    Args:
+        month (date): First day of the month.
+        batch_size (int): Trips moved per transaction.
+        dry_run (bool): Only count the rows that would move.
+
+    Returns:
+        dict: Rows moved (or to move) by table: trip, booking and ticket.
+    """
+    start = datetime.combine(month, datetime.min.time())
+    end = datetime.combine(add_months(month, 1), datetime.min.time())
+    if dry_run:
+        return _count_month(start, end)
+
+    query = """
+    SELECT trip_id
+    FROM trip
+    WHERE departure_datetime >= %s AND departure_datetime < %s
+    ORDER BY departure_datetime
+    LIMIT %s
+    """
+    moved = {'trip': 0, 'booking': 0, 'ticket': 0}
+    while True:
+        trips = query_with_params(query, (start, end, batch_size))
+        if not trips:
+            break
+        batch = _archive_trips([trip['trip_id'] for trip in trips])
+        for table, count in batch.items():
+            moved[table] += count
+            ARCHIVED_ROWS.labels(table=table).inc(count)
+    _record_month(month, moved)
+    return moved
+
+def archive_closed_months(keep_months=ARCHIVE_KEEP_MONTHS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False, log=None):
+    """
+    Archive every month, from the oldest trip in the hot tables, that closed keep_months ago.
+
+    Returns:
+        list: (month, rows moved by table) for each month handled, oldest first.
+    """
+    global _boundary_read_at
+    cutoff = closed_before(keep_months)
+    oldest = query_with_params("SELECT departure_datetime FROM trip ORDER BY departure_datetime LIMIT 1")
+    if not oldest:
+        return []
+
+    handled = []
+    month = month_start(oldest[0]['departure_datetime'])
+    while month < cutoff:
+        moved = archive_month(month, batch_size, dry_run)
+        handled.append((month, moved))
+        if log:
+            log(f"{month:%Y-%m}: {moved['trip']} trips, {moved['booking']} bookings, {moved['ticket']} tickets"
+                f"{' to archive' if dry_run else ' archived'}")
+        month = add_months(month, 1)
+    # This process reads the new boundary straight away; others within ARCHIVE_BOUNDARY_CACHE_SECONDS
+    _boundary_read_at = None
+    return handled
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS,
+                        help="Whole months before the current one to keep in the hot tables")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Trips moved per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Count the rows that would move without moving them")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="Keep running, archiving again after this long")
+    args = parser.parse_args(argv)
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    while True:
+        try:
+            handled = archive_closed_months(args.keep_months, args.batch_size, args.dry_run, log=print)
+            if not args.dry_run:
+                pricing.purge_expired_quotes()
+            print(f"{len(handled)} month(s) {'to archive' if args.dry_run else 'archived'} "
+                  f"before {closed_before(args.keep_months):%Y-%m}")
+        except BusNexusError as e:
+            print(f"error: {e}", file=sys.stderr)
+            if not args.every:
+                return 1
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    sys.exit(main())
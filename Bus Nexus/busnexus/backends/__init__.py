@@ -0,0 +1,27 @@
+"""Storage engines behind busnexus.connection.
+
+A backend owns the connection pool for one DatabaseConfig and hands out
+connections that behave like mysql-connector connections for the subset of the
+API the data layer uses:
+
+    conn.cursor(dictionary=False, buffered=True)
+    conn.start_transaction(), conn.commit(), conn.rollback()
+    conn.unread_result, conn.consume_results()
+    conn.close()                      returns the connection to the pool
+    cursor.execute(query, params), cursor.executemany(query, seq_of_params)
+    cursor.fetchone(), fetchmany(size), fetchall()
+    cursor.lastrowid, rowcount, column_names, close()
+
+Queries are written once, in MySQL's dialect with %s placeholders; a backend
+translates whatever its engine needs. Driver modules are imported only when
+their engine is configured, so SQLite works without mysql-connector installed.
+"""
+from busnexus.backends.base import Backend
+
+def create_backend(config):
+    """Return the backend for config.engine"""
+    if config.engine == "sqlite":
+        from busnexus.backends.sqlite import SQLiteBackend
+        return SQLiteBackend(config)
+    from busnexus.backends.mysql import MySQLBackend
+    return MySQLBackend(config)
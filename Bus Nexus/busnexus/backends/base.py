@@ -0,0 +1,82 @@
+from busnexus.errors import DatabaseError, DuplicateKeyError
+
+class Backend:
+    """Connection pool and dialect of one storage engine"""
+
+    # Engine name, as used in DatabaseConfig.engine
+    name = None
+    # Base class of the driver's exceptions
+    Error = Exception
+    # Fragments substituted into the DDL in busnexus.schema
+    ddl_tokens = {}
+    # Catalog queries used by migrations; each returns a row when the object exists
+    table_exists_query = None       # (table,)
+    column_exists_query = None      # (table, column)
+    index_exists_query = None       # (table, index)
+    # Start of an INSERT that skips rows colliding with a unique key instead of failing
+    insert_ignore = None
+    # End of a SELECT that locks the rows it reads until the transaction ends
+    lock_rows = ""
+    # Error code of a statement that gave up waiting for another transaction's lock
+    lock_timeout_errno = None
+    # Error codes after which the whole transaction can simply be run again, by reason
+    transient_errors = {}
+
+    def __init__(self, config):
+        self.config = config
+        self.pool_size = config.pool_size
+
+    def get_connection(self, timeout):
+        """Borrow a pooled connection, raising PoolTimeoutError if none frees up in time"""
+        raise NotImplementedError
+
+    def is_duplicate_key(self, error):
+        return False
+
+    def database_error(self, error, query=None):
+        """Wrap a driver exception in the matching busnexus error"""
+        error_class = DuplicateKeyError if self.is_duplicate_key(error) else DatabaseError
+        return error_class(str(error), query=query, errno=self.error_code(error))
+
+    def error_code(self, error):
+        return getattr(error, "errno", None)
+
+    def transient_reason(self, errno):
+        """Why a transaction that failed with errno is worth retrying, or None if it is not"""
+        return self.transient_errors.get(errno)
+
+    def render_ddl(self, statement):
+        return statement.format(**self.ddl_tokens)
+
+    def create_index_sql(self, name, table, columns, unique=False, online=False):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        return f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"
+
+    def drop_index_sql(self, name, table, online=False):
+        return f"DROP INDEX {name}"
+
+    def online_ddl_session(self, lock_wait_timeout):
+        """Statements that stop online DDL from queueing behind long transactions"""
+        return []
+
+    def bulk_load_session(self, enabled=True):
+        """Statements that switch per-row checks off (or back on) for a trusted bulk load"""
+        return []
+
+    def analyze_statements(self, tables):
+        """Statements that refresh the optimizer's statistics after a bulk change"""
+        return []
+
+    def explain(self, cursor, query, params=None):
+        """
+        The optimizer's plan for query, one dict per table access in execution order.
+
+        Each step has table (as named or aliased in the query), access (one of
+        full_scan, index_scan, range, lookup or other), key (the index used, or None),
+        rows (the optimizer's row estimate, None where the engine gives none) and
+        filesort / temporary flags for sorting or grouping through a temporary structure.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close every idle pooled connection"""
@@ -0,0 +1,239 @@
+"""Embedded SQLite engine, for running the app, workers and benchmarks without a server.
+
+Dialect differences from MySQL handled here:
+
+- %s placeholders (and %% escapes) are rewritten to SQLite's ? form.
+- DATETIME, DATE and DECIMAL columns come back as datetime, date and Decimal,
+  like they do from mysql-connector. Computed columns such as
+  DATE(booking_datetime) come back as 'YYYY-MM-DD' strings.
+- DATE() exists in both engines and compares correctly against date strings
+  because datetimes are stored as 'YYYY-MM-DD HH:MM:SS' text.
+- Statements outside start_transaction() run in an implicit transaction that
+  ends at commit() or rollback(), as with mysql-connector's autocommit=False.
+  Transactions begin IMMEDIATE, taking the write lock up front, so two
+  read-then-write transactions cannot deadlock on a lock upgrade.
+
+A file database gets one connection per pool slot in WAL mode, so readers do
+not block the single writer. An in-memory database exists only inside its
+connection, so its pool has exactly one.
+"""
+import queue
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from busnexus.backends.base import Backend
+from busnexus.errors import PoolTimeoutError
+
+# Seconds a statement waits for another connection's write lock before failing
+BUSY_TIMEOUT = 10.0
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+
+@lru_cache(maxsize=1024)
+def translate(query):
+    """Rewrite a query from mysql-connector's paramstyle to SQLite's"""
+    return _PLACEHOLDER.sub(lambda match: "?" if match.group(1) == "s" else "%", query)
+
+# Store values the way MySQL's DATETIME, DATE and DECIMAL columns hold them
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" ", timespec="seconds"))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+
+# "SCAN t", "SEARCH t USING INDEX idx (a=?)", "SCAN t USING COVERING INDEX idx", "SEARCH t USING INTEGER PRIMARY KEY (rowid=?)"
+_PLAN_STEP = re.compile(
+    r"^(SCAN|SEARCH) (\w+)(?: AS \w+)?"
+    r"(?: USING (?:(AUTOMATIC )?(?:COVERING |PARTIAL )*INDEX (\w+)?|(?:INTEGER )?PRIMARY KEY))?"
+)
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, query, params=None):
+        self._cursor.execute(translate(query), params or ())
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(translate(query), seq_of_params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    def __init__(self, backend, raw):
+        self._backend = backend
+        self._raw = raw
+        # SQLite cursors read lazily, so there is never a result to drain
+        self.unread_result = False
+
+    def cursor(self, dictionary=False, buffered=True):
+        return SQLiteCursor(self._raw.cursor(), dictionary)
+
+    def start_transaction(self):
+        if not self._raw.in_transaction:
+            self._raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        # Like a pooled mysql-connector connection: end any open transaction and go back to the pool
+        self._raw.rollback()
+        self._backend._release(self)
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    Error = sqlite3.Error
+    ddl_tokens = {
+        "pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "table_options": "",
+    }
+    table_exists_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s"
+    column_exists_query = "SELECT 1 FROM pragma_table_info(%s) WHERE name = %s"
+    index_exists_query = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s"
+    insert_ignore = "INSERT OR IGNORE INTO"
+    # BEGIN IMMEDIATE already holds the database's write lock for the whole transaction
+    lock_rows = ""
+    # SQLITE_BUSY, raised once BUSY_TIMEOUT runs out
+    lock_timeout_errno = 5
+    transient_errors = {5: "busy", 6: "locked"}
+
+    def __init__(self, config):
+        super().__init__(config)
+        if config.in_memory:
+            self.pool_size = 1
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        try:
+            raw = sqlite3.connect(
+                self.config.database, timeout=BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+                isolation_level="IMMEDIATE", check_same_thread=False
+            )
+            raw.execute("PRAGMA foreign_keys = ON")
+            if not self.config.in_memory:
+                raw.execute("PRAGMA journal_mode = WAL")
+                raw.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.Error as e:
+            raise self.database_error(e) from e
+        return SQLiteConnection(self, raw)
+
+    def get_connection(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeoutError("Timed out waiting for a free database connection")
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    def is_duplicate_key(self, error):
+        return (isinstance(error, sqlite3.IntegrityError)
+                and str(error).startswith("UNIQUE constraint failed"))
+
+    def error_code(self, error):
+        return getattr(error, "sqlite_errorcode", None)
+
+    def transient_reason(self, errno):
+        # Extended result codes such as SQLITE_BUSY_SNAPSHOT keep the primary code in the low byte
+        return self.transient_errors.get(errno & 0xFF) if errno is not None else None
+
+    def bulk_load_session(self, enabled=True):
+        # Without fsyncs an OS crash mid-load can corrupt the file; acceptable for regenerable data
+        if enabled:
+            return ["PRAGMA foreign_keys = OFF", "PRAGMA synchronous = OFF"]
+        return ["PRAGMA foreign_keys = ON", "PRAGMA synchronous = NORMAL"]
+
+    def explain(self, cursor, query, params=None):
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        steps = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            match = _PLAN_STEP.match(detail)
+            if match:
+                operation, table, automatic, index = match.groups()
+                if automatic:
+                    # SQLite built a throwaway index, which means scanning the whole table first
+                    access, key = "full_scan", None
+                elif operation == "SEARCH":
+                    access = "range" if ">" in detail or "<" in detail else "lookup"
+                    key = index or ("PRIMARY" if "PRIMARY KEY" in detail else None)
+                elif " USING " in detail:
+                    access, key = "index_scan", index
+                else:
+                    access, key = "full_scan", None
+                steps.append({'table': table, 'access': access, 'key': key, 'rows': None,
+                              'filesort': False, 'temporary': False})
+            elif detail.startswith("USE TEMP B-TREE") and steps:
+                # Reported after the joins; charge it to the driving table like MySQL does
+                flag = "filesort" if detail.endswith("ORDER BY") else "temporary"
+                steps[0][flag] = True
+        return steps
+
+    def analyze_statements(self, tables):
+        return ["ANALYZE"]
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn._raw.close()
@@ -0,0 +1,261 @@
+"""Capture of executed statements to a compact binary log, for replay.
+
+Every statement recorded by busnexus.instrumentation (query_with_params,
+execute_query, transactions) is appended with its parameters, start time,
+connection wait, execution time, row count and thread. benchmarks/replay.py
+re-executes a capture against another schema, index set or engine and
+compares the latencies per query fingerprint.
+
+Capturing is opt-in: set BUSNEXUS_QUERY_CAPTURE to a file path and the
+Streamlit app (on its first run) and the API (on import) start it. "{pid}" in the
+path is replaced with the process id, which keeps the files of several API
+workers apart. The log holds real parameter values (emails, password
+hashes), so treat it like a database dump.
+
+File layout, little-endian:
+
+    header      MAGIC, format version (H), capture start as a Unix time (d)
+    statement   b"Q", statement id (I), length (I), UTF-8 query text
+    execution   b"E", statement id (I), offset from the start in seconds (d),
+                wait ms (f), execution ms (f), rows (i), thread (I), failed (B),
+                parameter count (H), then one tagged value per parameter
+
+A statement's text is written once, before its first execution.
+"""
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from busnexus.instrumentation import add_listener, remove_listener
+
+logger = logging.getLogger("busnexus.capture")
+
+CAPTURE_FILE = os.getenv("BUSNEXUS_QUERY_CAPTURE")
+# Capturing stops, with a warning, once a file reaches this size
+CAPTURE_MAX_BYTES = int(float(os.getenv("BUSNEXUS_QUERY_CAPTURE_MAX_MB", "512")) * 1024 * 1024)
+
+MAGIC = b"BNQCAP"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<6sHd")
+_STATEMENT = struct.Struct("<II")
+_EXECUTION = struct.Struct("<IdffiIBH")
+_LENGTH = struct.Struct("<I")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+
+# Parameter tags; dates, decimals and integers too large for 64 bits travel as text
+_NONE, _TRUE, _FALSE, _INT_TAG, _FLOAT_TAG = b"N", b"T", b"F", b"i", b"f"
+_BIG_INT, _DECIMAL, _STR, _BYTES, _DATETIME, _DATE = b"I", b"d", b"s", b"b", b"t", b"D"
+
+def _encode_text(tag, text):
+    data = text.encode("utf-8")
+    return tag + _LENGTH.pack(len(data)) + data
+
+def _encode_param(value):
+    if value is None:
+        return _NONE
+    if isinstance(value, bool):
+        return _TRUE if value else _FALSE
+    if isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            return _INT_TAG + _INT.pack(value)
+        return _encode_text(_BIG_INT, str(value))
+    if isinstance(value, float):
+        return _FLOAT_TAG + _FLOAT.pack(value)
+    if isinstance(value, Decimal):
+        return _encode_text(_DECIMAL, str(value))
+    if isinstance(value, datetime):
+        return _encode_text(_DATETIME, value.isoformat())
+    if isinstance(value, date):
+        return _encode_text(_DATE, value.isoformat())
+    if isinstance(value, (bytes, bytearray)):
+        return _BYTES + _LENGTH.pack(len(value)) + bytes(value)
+    return _encode_text(_STR, str(value))
+
+class CaptureWriter:
+    """Appends executions to a capture file; safe to share between threads"""
+
+    def __init__(self, path, max_bytes=CAPTURE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._statements = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._file = open(path, "wb", buffering=1024 * 1024)
+        self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.started_at))
+        self.size = _HEADER.size
+        self.dropped = 0
+
+    def write(self, record):
+        # The listener runs once the statement has finished
+        offset = time.perf_counter() - self._start - record.exec_time - record.wait_time
+        params = record.params or ()
+        if isinstance(params, dict):
+            # Named parameters cannot be replayed positionally; busnexus itself never uses them
+            self.dropped += 1
+            return
+        encoded = b"".join(_encode_param(value) for value in params)
+        thread = threading.get_ident()
+        with self._lock:
+            if self._file is None:
+                return
+            chunks = []
+            statement_id = self._statements.get(record.query)
+            if statement_id is None:
+                statement_id = self._statements[record.query] = len(self._statements)
+                query = record.query.encode("utf-8")
+                chunks.append(b"Q" + _STATEMENT.pack(statement_id, len(query)) + query)
+            thread_id = self._threads.setdefault(thread, len(self._threads))
+            chunks.append(b"E" + _EXECUTION.pack(
+                statement_id, offset, record.wait_time * 1000, record.exec_time * 1000,
+                max(record.rows, -1), thread_id, record.error is not None, len(params)
+            ) + encoded)
+            data = b"".join(chunks)
+            if self.size + len(data) > self.max_bytes:
+                logger.warning("Query capture %s reached %d bytes; capturing stopped", self.path, self.size)
+                self._close()
+                return
+            self._file.write(data)
+            self.size += len(data)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+class CapturedStatement:
+    """One execution read back from a capture file"""
+
+    def __init__(self, query, params, started_at, wait_time, exec_time, rows, thread, failed):
+        self.query = query
+        self.params = params
+        self.started_at = started_at
+        self.wait_time = wait_time
+        self.exec_time = exec_time
+        self.rows = rows
+        self.thread = thread
+        self.failed = failed
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size):
+        if self.pos + size > len(self.data):
+            raise EOFError
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def unpack(self, layout):
+        return layout.unpack(self.take(layout.size))
+
+    def text(self):
+        return self.take(self.unpack(_LENGTH)[0]).decode("utf-8")
+
+    def param(self):
+        tag = self.take(1)
+        if tag == _NONE:
+            return None
+        if tag in (_TRUE, _FALSE):
+            return tag == _TRUE
+        if tag == _INT_TAG:
+            return self.unpack(_INT)[0]
+        if tag == _FLOAT_TAG:
+            return self.unpack(_FLOAT)[0]
+        if tag == _BYTES:
+            return self.take(self.unpack(_LENGTH)[0])
+        text = self.text()
+        if tag == _BIG_INT:
+            return int(text)
+        if tag == _DECIMAL:
+            return Decimal(text)
+        if tag == _DATETIME:
+            return datetime.fromisoformat(text)
+        if tag == _DATE:
+            return date.fromisoformat(text)
+        return text
+
+def read_capture(path):
+    """
+    Read the executions in a capture file, in the order they finished.
+
+    A record cut short by a crash or the size limit ends the capture silently.
+
+    Args:
+        path (str): File written by a CaptureWriter.
+
+    Returns:
+        generator: CapturedStatement objects; started_at is a Unix time.
+    """
+    with open(path, "rb") as f:
+        reader = _Reader(f.read())
+    magic, version, started_at = reader.unpack(_HEADER)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} query capture")
+    statements = {}
+    while reader.pos < len(reader.data):
+        try:
+            kind = reader.take(1)
+            if kind == b"Q":
+                statement_id, length = reader.unpack(_STATEMENT)
+                statements[statement_id] = reader.take(length).decode("utf-8")
+                continue
+            statement_id, offset, wait_ms, exec_ms, rows, thread, failed, count = reader.unpack(_EXECUTION)
+            params = tuple(reader.param() for _ in range(count))
+        except EOFError:
+            return
+        yield CapturedStatement(
+            statements[statement_id], params or None, started_at + offset,
+            wait_ms / 1000, exec_ms / 1000, rows, thread, bool(failed)
+        )
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _capture(record, fingerprint):
+    writer = _writer
+    if writer is not None:
+        writer.write(record)
+
+def start_capture(path=None):
+    """Capture every statement to path (default BUSNEXUS_QUERY_CAPTURE); safe to call on every rerun,
+    only the first call starts it, and nothing happens when no path is set"""
+    global _writer
+    path = path or CAPTURE_FILE
+    with _writer_lock:
+        if _writer is not None or not path:
+            return _writer
+        path = path.replace("{pid}", str(os.getpid()))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _writer = CaptureWriter(path)
+        add_listener(_capture)
+        # Flush what is buffered when the process exits without stopping the capture
+        atexit.register(stop_capture)
+        logger.info("Capturing queries to %s", path)
+        return _writer
+
+def stop_capture():
+    """Stop capturing and flush the file"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            return
+        remove_listener(_capture)
+        _writer.close()
+        _writer = None
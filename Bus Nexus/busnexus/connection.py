@@ -0,0 +1,467 @@
+import contextvars
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from busnexus.backends import create_backend
+from busnexus.config import DatabaseConfig
+from busnexus.errors import DatabaseError
+from busnexus.instrumentation import observe, record_query, add_listener, QueryRecord
+from busnexus.metrics import counter, gauge, histogram
+
+DB_QUERIES = counter("busnexus_db_queries_total", "Statements executed by outcome", ["outcome"])
+DB_POOL_SIZE = gauge("busnexus_db_pool_size", "Connections in the connection pool")
+DB_POOL_IN_USE = gauge("busnexus_db_pool_in_use", "Pooled connections currently borrowed")
+DB_POOL_WAIT_SECONDS = histogram(
+    "busnexus_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float("inf"))
+)
+
+DB_TRANSACTION_RETRIES = counter(
+    "busnexus_db_transaction_retries_total", "Transactions rerun after a deadlock or lock timeout", ["reason"]
+)
+
+# Attempts at a transaction that keeps losing deadlocks or lock waits before giving up
+TRANSACTION_ATTEMPTS = 3
+
+# Read replicas: a replica further behind than this (seconds) is skipped
+REPLICA_MAX_LAG = float(os.getenv("BUSNEXUS_REPLICA_MAX_LAG", "5"))
+# After a write, the session's replica-eligible reads go to the primary this long;
+# keep it above REPLICA_MAX_LAG so a session never reads from before its own write
+READ_YOUR_WRITES_SECONDS = float(os.getenv("BUSNEXUS_READ_YOUR_WRITES_SECONDS", "15"))
+# Seconds between heartbeat writes on the primary and between lag checks of a replica
+HEARTBEAT_INTERVAL = 1.0
+LAG_CHECK_INTERVAL = 1.0
+# A replica whose read failed is left alone this long
+REPLICA_RETRY_SECONDS = 10.0
+
+DB_READS = counter(
+    "busnexus_db_reads_total", "Replica-eligible reads by where they ran and why", ["target", "reason"]
+)
+DB_REPLICA_LAG_SECONDS = gauge(
+    "busnexus_db_replica_lag_seconds", "Replication lag measured through the heartbeat table", ["replica"]
+)
+
+def _count_query(record, fingerprint):
+    DB_QUERIES.labels(outcome="error" if record.error is not None else "ok").inc()
+
+add_listener(_count_query)
+
+# Configuration and backend (with its connection pool) shared by every thread in this process
+_config = None
+_backend = None
+_backend_lock = threading.Lock()
+
+def configure(config=None):
+    """Use config (a DatabaseConfig) for new connections; None re-reads the environment"""
+    global _config, _backend, _replicas
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        if _replicas is not None:
+            for replica in _replicas:
+                replica.backend.close()
+        _config = config
+        _backend = None
+        _replicas = None
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = DatabaseConfig.from_env()
+    return _config
+
+def get_backend():
+    """The storage backend for the configured engine, creating its pool on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(get_config())
+                DB_POOL_SIZE.set(_backend.pool_size)
+    return _backend
+
+def acquire_connection(backend=None):
+    """Borrow a connection from the pool (the primary's unless a replica's backend is given),
+    waiting up to the pool timeout for one to free up"""
+    backend = backend or get_backend()
+    with DB_POOL_WAIT_SECONDS.time():
+        conn = backend.get_connection(backend.config.pool_timeout)
+    DB_POOL_IN_USE.inc()
+    return conn
+
+def release_connection(conn):
+    # Closing a pooled connection hands it back to the pool
+    conn.close()
+    DB_POOL_IN_USE.dec()
+
+@contextmanager
+def pooled_connection(backend=None):
+    """Borrow a connection from the pool and return it when the block exits"""
+    conn = acquire_connection(backend)
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+# Read replicas
+#
+# Reads marked replica=True go to a replica when one is configured, healthy and
+# within REPLICA_MAX_LAG; everything else, writes and transactions included,
+# goes to the primary. Lag is measured without replication privileges: the
+# primary's replication_heartbeat row (migration 0006) is rewritten every
+# HEARTBEAT_INTERVAL and a replica's lag is how old its copy of that row is.
+# The same works with two SQLite files and any process that copies one to the other.
+#
+# Read-your-writes: a write pins the current session to the primary for
+# READ_YOUR_WRITES_SECONDS. Wrap a user's calls in database_session(key) to
+# share the pin across threads and requests; outside a session the pin
+# applies to the current thread or task.
+class Replica:
+    def __init__(self, config):
+        self.config = config
+        self.name = config.database if config.engine == "sqlite" else f"{config.host}:{config.port}"
+        self.backend = create_backend(config)
+        self.lag = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self._check_lock = threading.Lock()
+
+    def check_lag(self):
+        """Refresh the measured lag at most every LAG_CHECK_INTERVAL; None when unknown"""
+        now = time.monotonic()
+        if now - self.checked_at < LAG_CHECK_INTERVAL or not self._check_lock.acquire(blocking=False):
+            return self.lag
+        try:
+            self.checked_at = now
+            with pooled_connection(self.backend) as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT beat_at FROM replication_heartbeat WHERE heartbeat_id = 1")
+                    row = cursor.fetchone()
+                    conn.commit()
+                finally:
+                    cursor.close()
+            self.lag = max((datetime.now() - row[0]).total_seconds(), 0.0) if row else None
+        except (self.backend.Error, DatabaseError):
+            self.lag = None
+        finally:
+            self._check_lock.release()
+        if self.lag is not None:
+            DB_REPLICA_LAG_SECONDS.labels(replica=self.name).set(self.lag)
+        return self.lag
+
+    def usable(self):
+        if time.monotonic() < self.down_until:
+            return False
+        lag = self.check_lag()
+        return lag is not None and lag <= REPLICA_MAX_LAG
+
+_replicas = None
+# Round-robin over the replicas; next() on a count is atomic under the GIL
+_replica_turns = itertools.count()
+_heartbeat_started = False
+
+def get_replicas():
+    """Replicas from the configuration, creating their pools and the heartbeat writer on first use"""
+    global _replicas, _heartbeat_started
+    if _replicas is None:
+        with _backend_lock:
+            if _replicas is None:
+                replicas = [Replica(config) for config in get_config().replicas]
+                if replicas and not _heartbeat_started:
+                    _heartbeat_started = True
+                    threading.Thread(target=_write_heartbeats, name="busnexus-heartbeat", daemon=True).start()
+                _replicas = replicas
+    return _replicas
+
+def _write_heartbeats():
+    # Runs unobserved so the query statistics only show the application's statements
+    while True:
+        try:
+            backend = get_backend()
+            with pooled_connection(backend) as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(
+                        "UPDATE replication_heartbeat SET beat_at = %s WHERE heartbeat_id = 1", (datetime.now(),)
+                    )
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except Exception:
+            pass
+        time.sleep(HEARTBEAT_INTERVAL)
+
+_session = contextvars.ContextVar("busnexus_session", default=None)
+_context_pinned_until = contextvars.ContextVar("busnexus_pinned_until", default=0.0)
+_pinned_sessions = {}
+_pinned_lock = threading.Lock()
+
+@contextmanager
+def database_session(key):
+    """Attribute the calls in the block to one user session (e.g. a Streamlit session or a user id)"""
+    token = _session.set(key)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+def _note_write():
+    until = time.monotonic() + READ_YOUR_WRITES_SECONDS
+    key = _session.get()
+    if key is None:
+        _context_pinned_until.set(until)
+        return
+    with _pinned_lock:
+        _pinned_sessions[key] = until
+        if len(_pinned_sessions) > 10000:
+            now = time.monotonic()
+            for stale in [k for k, deadline in _pinned_sessions.items() if deadline < now]:
+                del _pinned_sessions[stale]
+
+# Statements that only read; anything else run in a transaction pins the session
+READ_ONLY_STATEMENTS = ("SELECT", "SHOW", "EXPLAIN")
+
+def _is_write(query):
+    words = query.split(None, 1)
+    return not words or words[0].upper() not in READ_ONLY_STATEMENTS
+
+def _pinned_to_primary():
+    now = time.monotonic()
+    if _context_pinned_until.get() > now:
+        return True
+    key = _session.get()
+    return key is not None and _pinned_sessions.get(key, 0.0) > now
+
+def _read_target(replica):
+    """The Replica a read should use, or None for the primary"""
+    if not replica:
+        return None
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    if _pinned_to_primary():
+        DB_READS.labels(target="primary", reason="read_your_writes").inc()
+        return None
+    turn = next(_replica_turns)
+    for offset in range(len(replicas)):
+        candidate = replicas[(turn + offset) % len(replicas)]
+        if candidate.usable():
+            DB_READS.labels(target="replica", reason="healthy").inc()
+            return candidate
+    DB_READS.labels(target="primary", reason="replicas_lagging").inc()
+    return None
+
+# Ask the optimizer how it would run a statement, without running it
+def explain(query, params=None):
+    """Plan steps of query as described by Backend.explain"""
+    backend = get_backend()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            return backend.explain(cursor, query, params)
+        except backend.Error as e:
+            raise backend.database_error(e, query) from e
+        finally:
+            cursor.close()
+
+# Execute query with params and return the rows as dicts
+def query_with_params(query, params=None, replica=False):
+    """Run a query and return its rows as dicts; replica=True lets a healthy read replica answer it"""
+    target = _read_target(replica)
+    if target is not None:
+        try:
+            return _query_rows(target.backend, query, params)
+        except DatabaseError:
+            # Leave the replica alone for a while and answer from the primary
+            target.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+            DB_READS.labels(target="primary", reason="replica_failed").inc()
+    return _query_rows(get_backend(), query, params)
+
+def _query_rows(backend, query, params):
+    start = time.perf_counter()
+    conn = acquire_connection(backend)
+    wait_time = time.perf_counter() - start
+    cursor = conn.cursor(dictionary=True)
+    try:
+        with observe(query, params, wait_time) as record:
+            cursor.execute(query, params)
+            result = cursor.fetchall()
+            record.rows = len(result)
+        conn.commit()
+        return result
+    except backend.Error as e:
+        conn.rollback()
+        raise backend.database_error(e, query) from e
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+# Stream the rows of a query without loading the whole result set
+def stream_query(query, params=None, batch_size=1000, replica=False):
+    """
+    Yield the rows of a query as dicts, reading them from the server in batches.
+
+    The query runs on an unbuffered cursor, so rows stay on the server until fetched and
+    memory use is bounded by batch_size. A pooled connection is held only while the
+    generator is being iterated and is returned as soon as it is exhausted or closed.
+
+    Args:
+        query (str): SELECT statement to run.
+        params (tuple, optional): Query parameters.
+        batch_size (int): Number of rows fetched from the server per round-trip.
+        replica (bool): Let a healthy read replica answer the query.
+
+    Yields:
+        dict: One row per result record.
+    """
+    target = _read_target(replica)
+    backend = target.backend if target is not None else get_backend()
+    start = time.perf_counter()
+    with pooled_connection(backend) as conn:
+        # Only time spent in the database counts, not time the caller spends on each row
+        record = QueryRecord(query, params, time.perf_counter() - start)
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        try:
+            with record.timed():
+                cursor.execute(query, params)
+            while True:
+                with record.timed():
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                record.rows += len(rows)
+                yield from rows
+        except backend.Error as e:
+            record.error = e
+            raise backend.database_error(e, query) from e
+        finally:
+            record_query(record)
+            # Discard rows left unread when iteration stopped early so the
+            # connection goes back to the pool clean
+            if conn.unread_result:
+                conn.consume_results()
+            cursor.close()
+
+# Run a query straight into a dataframe
+def query_dataframe(query, params=None, dtypes=None, batch_size=10000, replica=False):
+    """
+    Run a query and build a DataFrame column by column, without a dict per row.
+
+    Rows are fetched as tuples in batches and each batch is transposed into one typed
+    numpy array per column, so pandas neither sees per-row dicts nor has to re-infer
+    the declared columns.
+
+    Args:
+        query (str): SELECT statement to run.
+        params (tuple, optional): Query parameters.
+        dtypes (dict, optional): Column name -> numpy dtype, e.g. 'int64' for ids, 'float64'
+            for DECIMAL amounts and 'datetime64[ns]' for dates. Undeclared columns are inferred.
+        batch_size (int): Number of rows fetched from the server per round-trip.
+        replica (bool): Let a healthy read replica answer the query.
+
+    Returns:
+        DataFrame: The result set.
+    """
+    # Imported here so that importing the data layer stays fast for workers and CLIs
+    import numpy as np
+    import pandas as pd
+
+    dtypes = dtypes or {}
+    target = _read_target(replica)
+    backend = target.backend if target is not None else get_backend()
+    start = time.perf_counter()
+    with pooled_connection(backend) as conn:
+        wait_time = time.perf_counter() - start
+        cursor = conn.cursor(buffered=False)
+        try:
+            with observe(query, params, wait_time) as record:
+                cursor.execute(query, params)
+                columns = cursor.column_names
+                chunks = [[] for _ in columns]
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    record.rows += len(rows)
+                    for chunk, column, values in zip(chunks, columns, zip(*rows)):
+                        dtype = dtypes.get(column, object)
+                        if np.dtype(dtype).kind == "M":
+                            # numpy casts datetime objects one at a time; pandas parses the array in one pass
+                            chunk.append(pd.to_datetime(np.array(values, dtype=object)).to_numpy(dtype))
+                        else:
+                            chunk.append(np.array(values, dtype=dtype))
+        except backend.Error as e:
+            raise backend.database_error(e, query) from e
+        finally:
+            if conn.unread_result:
+                conn.consume_results()
+            cursor.close()
+
+    data = {}
+    for chunk, column in zip(chunks, columns):
+        dtype = dtypes.get(column, object)
+        data[column] = np.concatenate(chunk) if chunk else np.array([], dtype=dtype)
+    return pd.DataFrame(data, copy=False).infer_objects()
+
+# Execute an insert/update query and return (True, lastrowid)
+def execute_query(query, params=None):
+    backend = get_backend()
+    start = time.perf_counter()
+    conn = acquire_connection()
+    wait_time = time.perf_counter() - start
+    cursor = conn.cursor()
+    try:
+        with observe(query, params, wait_time) as record:
+            cursor.execute(query, params)
+            record.rows = cursor.rowcount
+        conn.commit()
+        _note_write()
+        return True, cursor.lastrowid
+    except backend.Error as e:
+        conn.rollback()
+        raise backend.database_error(e, query) from e
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+# Execute one statement of a multi-statement transaction, timed like any other query
+def execute_in_transaction(cursor, query, params=None):
+    backend = get_backend()
+    if _is_write(query):
+        _note_write()
+    try:
+        with observe(query, params) as record:
+            cursor.execute(query, params)
+            record.rows = cursor.rowcount
+    except backend.Error as e:
+        raise backend.database_error(e, query) from e
+
+# Rerun a transaction the engine aborted to break a deadlock or lock wait
+def retry_transaction(transaction):
+    """
+    Decorator for a function that runs one complete transaction on its own connection.
+
+    When the engine aborts it with a deadlock or a lock timeout nothing was committed,
+    so the whole function is called again, up to TRANSACTION_ATTEMPTS times, after a
+    short jittered backoff so the colliding transactions do not meet again. Every
+    rerun is counted in busnexus_db_transaction_retries_total by reason.
+    """
+    @wraps(transaction)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, TRANSACTION_ATTEMPTS + 1):
+            try:
+                return transaction(*args, **kwargs)
+            except DatabaseError as e:
+                reason = get_backend().transient_reason(e.errno)
+                if reason is None or attempt == TRANSACTION_ATTEMPTS:
+                    raise
+                DB_TRANSACTION_RETRIES.labels(reason=reason).inc()
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return wrapper
@@ -0,0 +1,1142 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import hashlib
+import re
+import secrets
+
+from busnexus.connection import (
+    query_with_params, execute_query, query_dataframe,
+    acquire_connection, release_connection, execute_in_transaction, retry_transaction
+)
+from busnexus.errors import DuplicateKeyError
+from busnexus.metrics import counter, histogram
+from busnexus import archive, outbox, pricing, search_cache
+
+# Metrics exported on the Prometheus endpoint
+SEARCHES = counter("busnexus_searches_total", "Bus searches run")
+SEARCH_SECONDS = histogram("busnexus_search_duration_seconds", "Time to run a bus search")
+BOOKINGS = counter("busnexus_bookings_total", "Booking attempts by result", ["result"])
+BOOKED_SEATS = counter("busnexus_booked_seats_total", "Seats sold by successful bookings")
+BOOKING_SECONDS = histogram("busnexus_booking_duration_seconds", "Time to run a booking transaction")
+CANCELLATIONS = counter("busnexus_cancellations_total", "Cancellation attempts by result", ["result"])
+LOGINS = counter("busnexus_logins_total", "Login attempts by result", ["result"])
+
+# Password hashing utility
+def hash_password(password):
+    """Hash a password for storing."""
+    salt = secrets.token_hex(8)
+    h = hashlib.sha256()
+    h.update(salt.encode('utf-8'))
+    h.update(password.encode('utf-8'))
+    return f"{salt}${h.hexdigest()}"
+
+# Password verification
+def verify_password(stored_password, provided_password):
+    """Verify a stored password against one provided by user"""
+    salt, hash = stored_password.split('$')
+    h = hashlib.sha256()
+    h.update(salt.encode('utf-8'))
+    h.update(provided_password.encode('utf-8'))
+    return h.hexdigest() == hash
+
+# User authentication functions
+def register_user(first_name, last_name, email, phone, password, role='passenger'):
+    # Check if email already exists
+    check_query = "SELECT user_id FROM users WHERE email = %s"
+    existing_user = query_with_params(check_query, (email,))
+    
+    if existing_user:
+        return False, "Email already registered"
+    
+    hashed_password = hash_password(password)
+    
+    insert_query = """
+    INSERT INTO users (first_name, last_name, email, phone, role, password)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    
+    success, user_id = execute_query(
+        insert_query, 
+        (first_name, last_name, email, phone, role, hashed_password)
+    )
+    
+    if success:
+        return True, user_id
+    else:
+        return False, "Registration failed"
+
+def login_user(email, password):
+    query = "SELECT user_id, first_name, last_name, email, role, password FROM users WHERE email = %s"
+    result = query_with_params(query, (email,))
+    
+    if not result:
+        LOGINS.labels(result="unknown_email").inc()
+        return False, "Email not found"
+    
+    user = result[0]
+    
+    if verify_password(user['password'], password):
+        LOGINS.labels(result="success").inc()
+        # Remove password from returned user object
+        user.pop('password', None)
+        return True, user
+    else:
+        LOGINS.labels(result="invalid_password").inc()
+        return False, "Invalid password"
+
+# Midnight at the start of a date given as a date, a datetime or a "YYYY-MM-DD" string.
+# Filters compare the raw DATETIME column against day boundaries instead of wrapping
+# it in DATE(), which would hide the column from its index.
+def _day_start(value):
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d")
+    return datetime(value.year, value.month, value.day)
+
+# Queries over archived rows (busnexus.archive) are written with {trip}, {booking} and
+# {ticket} for the table names. Without include_archived they run on the hot tables
+# only; with it the same SELECT runs again on the archive tables and the two are
+# combined with UNION ALL.
+def _with_archive(query, params, include_archived):
+    hot = query.format(**archive.HOT_TABLES)
+    if not include_archived:
+        return hot, params
+    return f"{hot} UNION ALL {query.format(**archive.ARCHIVE_TABLES)}", params + params
+
+# A keyset page over hot and archived rows. Each side is ordered and limited on its own,
+# so both stop early on their indexes, and the merged rows are ordered and limited again.
+def _page_with_archive(query, params, order_by, limit, include_archived):
+    page = f"{query} ORDER BY {order_by}"
+    if limit:
+        page += " LIMIT %s"
+        params = params + [limit]
+    if not include_archived:
+        return page.format(**archive.HOT_TABLES), params
+    # The merged rows are ordered by column name, without the table aliases
+    merged_order = re.sub(r"\b\w+\.", "", order_by)
+    merged = (f"SELECT * FROM ({page.format(**archive.HOT_TABLES)}) AS hot_rows UNION ALL "
+              f"SELECT * FROM ({page.format(**archive.ARCHIVE_TABLES)}) AS archived_rows "
+              f"ORDER BY {merged_order}")
+    params = params + params
+    if limit:
+        merged += " LIMIT %s"
+        params.append(limit)
+    return merged, params
+
+# Bus search functions
+@SEARCH_SECONDS.time()
+def get_search_results(origin, destination, travel_date, bus_type=None, min_fare=None, max_fare=None):
+    """
+    Find scheduled trips with free seats on a corridor, through the search cache.
+    
+    Args:
+        origin (str): Origin city.
+        destination (str): Destination city.
+        travel_date (str or date): Day of departure.
+        bus_type (str, optional): Only buses of this type.
+        min_fare (float, optional): Lowest current fare per seat.
+        max_fare (float, optional): Highest current fare per seat.
+    
+    Returns:
+        list: Trip rows with bus, route and fare details; 'fare' is the current fare per seat
+            (busnexus.pricing), 'base_fare' the route's.
+    """
+    query = """
+    SELECT 
+        t.trip_id, b.bus_no, b.bus_type, b.capacity,
+        t.departure_datetime, t.arrival_datetime,
+        t.seats_available, r.origin, r.destination, 
+        r.base_fare
+    FROM 
+        trip t
+    JOIN 
+        route r ON t.route_id = r.route_id
+    JOIN 
+        bus b ON t.bus_id = b.bus_id
+    WHERE 
+        r.origin = %s
+        AND r.destination = %s
+        AND t.departure_datetime >= %s
+        AND t.departure_datetime < %s
+        AND t.seats_available > 0
+        AND t.status = 'scheduled'
+    """
+    
+    day_start = _day_start(travel_date)
+    params = [origin, destination, day_start, day_start + timedelta(days=1)]
+    
+    if bus_type:
+        query += " AND b.bus_type = %s"
+        params.append(bus_type)
+    
+    SEARCHES.inc()
+    results = search_cache.cached_search(
+        origin, destination, day_start.date(), [bus_type],
+        lambda: query_with_params(query, tuple(params), replica=True)
+    )
+    # Fares change with load and time, so they are priced on every search rather than cached,
+    # and the fare filters apply to the priced rows
+    pricing.apply_prices(results)
+    return [
+        result for result in results
+        if (min_fare is None or result['fare'] >= Decimal(str(min_fare)))
+        and (max_fare is None or result['fare'] <= Decimal(str(max_fare)))
+    ]
+
+# Fare calendar: the days around a search date, for passengers flexible on the day
+def get_fare_calendar(origin, destination, travel_date, days=3, bus_type=None):
+    """
+    Lowest fare, departures and seats left on a corridor for each day within days of travel_date.
+    
+    The trips of the whole window come from one range query on the corridor's
+    scheduled trips (idx_trip_route_status_departure); fares are dynamic, so the
+    trips are priced (busnexus.pricing) and grouped by day here.
+    
+    Args:
+        origin (str): Origin city.
+        destination (str): Destination city.
+        travel_date (str or date): Day in the middle of the window.
+        days (int): Days before and after travel_date to include; days already past are left out.
+        bus_type (str, optional): Only buses of this type.
+    
+    Returns:
+        list: One dict per day in order, with date, departures, seats_available and
+            lowest_fare (None on days without a bookable trip).
+    """
+    query = """
+    SELECT 
+        t.trip_id, b.bus_type, b.capacity, t.departure_datetime,
+        t.seats_available, r.base_fare
+    FROM 
+        trip t
+    JOIN 
+        route r ON t.route_id = r.route_id
+    JOIN 
+        bus b ON t.bus_id = b.bus_id
+    WHERE 
+        r.origin = %s
+        AND r.destination = %s
+        AND t.departure_datetime >= %s
+        AND t.departure_datetime < %s
+        AND t.seats_available > 0
+        AND t.status = 'scheduled'
+    """
+    center = _day_start(travel_date)
+    first_day = max(center - timedelta(days=days), _day_start(datetime.now()))
+    end = center + timedelta(days=days + 1)
+    # Today's trips that have departed or are boarding are no longer scheduled
+    params = [origin, destination, first_day, end]
+    if bus_type:
+        query += " AND b.bus_type = %s"
+        params.append(bus_type)
+    
+    trips = pricing.apply_prices(query_with_params(query, tuple(params), replica=True))
+    calendar = {}
+    day = first_day
+    while day < end:
+        calendar[day.date()] = {'date': day.date(), 'departures': 0, 'seats_available': 0, 'lowest_fare': None}
+        day += timedelta(days=1)
+    for trip in trips:
+        entry = calendar[trip['departure_datetime'].date()]
+        entry['departures'] += 1
+        entry['seats_available'] += trip['seats_available']
+        if entry['lowest_fare'] is None or trip['fare'] < entry['lowest_fare']:
+            entry['lowest_fare'] = trip['fare']
+    return list(calendar.values())
+
+# Searches cached for a trip's corridor and day are dropped once a change to its
+# seats or schedule has committed; callers that did not read the route look it up
+def _invalidate_trip_searches(trip_id, trip=None):
+    if trip is None:
+        query = """
+        SELECT r.origin, r.destination, t.departure_datetime
+        FROM trip t
+        JOIN route r ON t.route_id = r.route_id
+        WHERE t.trip_id = %s
+        """
+        result = query_with_params(query, (trip_id,))
+        if not result:
+            return
+        trip = result[0]
+    search_cache.invalidate(trip['origin'], trip['destination'], trip['departure_datetime'])
+
+# Trip changes committed by other processes reach this process's search cache through the outbox
+def _invalidate_searches_for_events(events):
+    trip_ids = sorted({event.key for event in events})
+    for start in range(0, len(trip_ids), 500):
+        chunk = trip_ids[start:start + 500]
+        query = f"""
+        SELECT r.origin, r.destination, t.departure_datetime
+        FROM trip t
+        JOIN route r ON t.route_id = r.route_id
+        WHERE t.trip_id IN ({', '.join(['%s'] * len(chunk))})
+        """
+        for trip in query_with_params(query, tuple(chunk)):
+            search_cache.invalidate(trip['origin'], trip['destination'], trip['departure_datetime'])
+
+outbox.subscribe(_invalidate_searches_for_events, tables=["trip"])
+
+# execute_query for a single-statement change of one row: the row's change event is
+# appended in the same transaction; key defaults to the id of the inserted row
+def _execute_with_change(query, params, table, key=None):
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        execute_in_transaction(cursor, query, params)
+        row_id = cursor.lastrowid
+        outbox.record_changes(cursor, [(table, key if key is not None else row_id)])
+        conn.commit()
+        return True, row_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+# Trip booking functions
+def get_trip_details(trip_id):
+    query = """
+    SELECT 
+        t.trip_id, b.bus_id, b.bus_no, b.bus_type, b.capacity,
+        t.departure_datetime, t.arrival_datetime,
+        t.seats_available, t.status,                 
+        r.origin, r.destination, 
+        r.base_fare, r.route_id
+    FROM 
+        trip t
+    JOIN 
+        route r ON t.route_id = r.route_id
+    JOIN 
+        bus b ON t.bus_id = b.bus_id
+    WHERE 
+        t.trip_id = %s
+    """
+    
+    result = query_with_params(query, (trip_id,))
+    if result:
+        return result[0]
+    return None
+
+# Idempotency keys are stored on the booking row and looked up through a unique
+# index on (user_id, idempotency_key), so a repeated submit can never insert a
+# second booking and one user's key never matches another user's booking
+# (migrations 0002_booking_idempotency_key and 0011_idempotency_key_per_user)
+def get_booking_by_idempotency_key(user_id, idempotency_key):
+    """The user's booking made with idempotency_key, with its trip_id and num_seats, or None"""
+    query = """
+    SELECT b.booking_id, b.trip_id, COUNT(tk.ticket_id) as num_seats
+    FROM booking b
+    LEFT JOIN ticket tk ON tk.booking_id = b.booking_id
+    WHERE b.user_id = %s AND b.idempotency_key = %s
+    GROUP BY b.booking_id, b.trip_id
+    """
+    result = query_with_params(query, (user_id, idempotency_key))
+    if result:
+        return result[0]
+    return None
+
+# A repeat submit gets the original booking back only if it asks for the same booking
+def _answer_repeat_submit(existing_booking, trip_id, num_seats):
+    if existing_booking['trip_id'] != trip_id or existing_booking['num_seats'] != num_seats:
+        BOOKINGS.labels(result="key_reused").inc()
+        return False, "Idempotency key was already used for a different booking"
+    BOOKINGS.labels(result="duplicate").inc()
+    return True, existing_booking['booking_id']
+
+# Fare quotes: the price a booking is charged, fixed when the passenger is shown it
+def quote_fare(user_id, trip_id, num_seats, promo_code=None):
+    """
+    Price a booking and hold that price for busnexus.pricing.QUOTE_TTL.
+    
+    Args:
+        user_id (int): The user who may book at this price.
+        trip_id (int): The trip to price.
+        num_seats (int): Number of seats to price.
+        promo_code (str, optional): Promo code to apply.
+    
+    Returns:
+        tuple: (success: bool, quote dict or error message). The quote has quote_id,
+            trip_id, num_seats, fare_per_seat, total_fare, promo_code and expires_at.
+    """
+    trip_details = get_trip_details(trip_id)
+    if not trip_details:
+        return False, "Trip not found"
+    if trip_details['status'] != 'scheduled':
+        return False, "Trip is no longer open for booking"
+    promo = None
+    if promo_code:
+        promo = pricing.get_promo(promo_code)
+        if not promo:
+            return False, "Promo code is not valid"
+
+    now = datetime.now()
+    fare_per_seat = pricing.apply_promo(pricing.price_per_seat([trip_details], now)[0], promo)
+    quote = {
+        'trip_id': trip_id,
+        'num_seats': num_seats,
+        'fare_per_seat': fare_per_seat,
+        'total_fare': fare_per_seat * num_seats,
+        'promo_code': promo['code'] if promo else None,
+        'expires_at': (now + pricing.QUOTE_TTL).replace(microsecond=0),
+    }
+    query = """
+    INSERT INTO fare_quote (user_id, trip_id, num_seats, fare_per_seat, total_fare, promo_code, created_at, expires_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    success, quote['quote_id'] = execute_query(query, (
+        user_id, trip_id, num_seats, quote['fare_per_seat'], quote['total_fare'],
+        quote['promo_code'], now, quote['expires_at']
+    ))
+    return True, quote
+
+def get_fare_quote(quote_id):
+    query = """
+    SELECT quote_id, user_id, trip_id, num_seats, fare_per_seat, total_fare, promo_code, expires_at, booking_id
+    FROM fare_quote
+    WHERE quote_id = %s
+    """
+    result = query_with_params(query, (quote_id,))
+    if result:
+        return result[0]
+    return None
+
+@BOOKING_SECONDS.time()
+def add_booking(user_id, trip_id, num_seats, booking_date=None, status="booked", idempotency_key=None,
+                quote_id=None):
+    """
+    Add a new booking to the database and update the trip's available seats.
+    
+    Args:
+        user_id (int): The ID of the user making the booking (from session state).
+        trip_id (int): The ID of the trip being booked.
+        num_seats (int): Number of seats to book.
+        booking_date (str, optional): Date and time of booking in "YYYY-MM-DD HH:MM:SS" format.
+        status (str): Status of the booking (default: "booked").
+        idempotency_key (str, optional): Key identifying this booking submission, unique per user.
+            Submitting the same key again returns the original booking ID instead of booking a
+            second time; reusing it for another trip or number of seats fails.
+        quote_id (int, optional): Fare quote from quote_fare() for this user, trip and number of
+            seats; the booking is charged its total_fare, and fails once the quote has expired
+            or been used. Without one the booking is charged the current fare.
+    
+    Returns:
+        tuple: (success: bool, booking_id: int or None) - Success status and booking ID if successful.
+    """
+    # A repeat submit of an already committed booking is answered from the index
+    if idempotency_key:
+        existing_booking = get_booking_by_idempotency_key(user_id, idempotency_key)
+        if existing_booking:
+            return _answer_repeat_submit(existing_booking, trip_id, num_seats)
+
+    # Fare and route come from the trip; read them before borrowing the transaction's
+    # connection so a booking never holds two pooled connections at once
+    trip_details = get_trip_details(trip_id)
+    if not trip_details:
+        BOOKINGS.labels(result="trip_not_found").inc()
+        return False, "Trip not found"
+    # Sales close when boarding starts (busnexus.lifecycle)
+    if trip_details['status'] != 'scheduled':
+        BOOKINGS.labels(result="closed").inc()
+        return False, "Trip is no longer open for booking"
+
+    # Charge the quoted price, or the current one when the caller did not take a quote
+    if quote_id is not None:
+        quote = get_fare_quote(quote_id)
+        if (not quote or quote['user_id'] != user_id or quote['trip_id'] != trip_id
+                or quote['num_seats'] != num_seats):
+            BOOKINGS.labels(result="quote_mismatch").inc()
+            return False, "Fare quote does not match this booking"
+        total_fare = quote['total_fare']
+    else:
+        total_fare = pricing.price_per_seat([trip_details])[0] * num_seats
+
+    # Use current timestamp if booking_date is not provided
+    if not booking_date:
+        booking_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        booking_id, failure = _insert_booking(
+            user_id, trip_id, num_seats, total_fare, status, booking_date, idempotency_key,
+            trip_details['origin'], trip_details['destination'], quote_id
+        )
+    except DuplicateKeyError as e:
+        # A concurrent submit with the same key committed first and this attempt
+        # was rolled back, so hand back that booking instead of failing
+        existing_booking = get_booking_by_idempotency_key(user_id, idempotency_key) if idempotency_key else None
+        if existing_booking:
+            return _answer_repeat_submit(existing_booking, trip_id, num_seats)
+        BOOKINGS.labels(result="error").inc()
+        return False, str(e)
+    except Exception as e:
+        BOOKINGS.labels(result="error").inc()
+        return False, str(e)
+
+    if failure == "quote_expired":
+        BOOKINGS.labels(result="quote_expired").inc()
+        return False, "Fare quote has expired or was already used"
+    if failure:
+        BOOKINGS.labels(result="insufficient_seats").inc()
+        return False, "Insufficient seats available"
+    _invalidate_trip_searches(trip_id, trip_details)
+    BOOKINGS.labels(result="booked").inc()
+    BOOKED_SEATS.inc(num_seats)
+    return True, booking_id
+
+@retry_transaction
+def _insert_booking(user_id, trip_id, num_seats, total_fare, status, booking_date, idempotency_key,
+                    pickup_point, drop_point, quote_id=None):
+    """Run the booking transaction; returns (the new booking_id, None), or (None, "insufficient_seats")
+    if the trip lacks the seats and (None, "quote_expired") if the quote can no longer be used"""
+    conn = acquire_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Start a transaction
+        conn.start_transaction()
+
+        # Claim the seats with a conditional update instead of reading the count first:
+        # the row lock serialises concurrent bookings of the trip and the condition is
+        # checked against the latest count, so two bookings can never share the last seats
+        claim_seats_query = """
+        UPDATE trip SET seats_available = seats_available - %s
+        WHERE trip_id = %s AND seats_available >= %s AND status = 'scheduled'
+        """
+        execute_in_transaction(cursor, claim_seats_query, (num_seats, trip_id, num_seats))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return None, "insufficient_seats"
+
+        # Insert the new booking
+        insert_booking_query = """
+        INSERT INTO booking (user_id, trip_id, total_fare, payment_status, booking_status, booking_datetime, idempotency_key)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        execute_in_transaction(cursor, insert_booking_query, (user_id, trip_id, total_fare, 'unpaid', status, booking_date, idempotency_key))
+        booking_id = cursor.lastrowid
+
+        # Use up the quote. Two submits of one quote with different idempotency keys
+        # serialise on its row, and the second matches nothing
+        if quote_id is not None:
+            use_quote_query = """
+            UPDATE fare_quote SET booking_id = %s
+            WHERE quote_id = %s AND booking_id IS NULL AND expires_at > %s
+            """
+            execute_in_transaction(cursor, use_quote_query, (booking_id, quote_id, datetime.now()))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return None, "quote_expired"
+
+        # Insert ticket records with sequential seat numbers
+        for seat_num in range(1, num_seats + 1):
+            insert_ticket_query = """
+            INSERT INTO ticket (booking_id, seat_no, pickup_point, drop_point)
+            VALUES (%s, %s, %s, %s)
+            """
+            execute_in_transaction(cursor, insert_ticket_query, (booking_id, str(seat_num), pickup_point, drop_point))
+
+        outbox.record_changes(cursor, [("booking", booking_id), ("trip", trip_id)])
+
+        # Commit the transaction
+        conn.commit()
+        return booking_id, None
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+def create_booking(user_id, trip_id, seats, total_fare, pickup_point, drop_point):
+    # Note: This function is kept as is but may be redundant with add_booking
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Start a transaction
+        conn.start_transaction()
+
+        # Claim the seats first, with the same conditional update as _insert_booking, unless
+        # they are gone or boarding has closed sales (busnexus.lifecycle)
+        claim_seats_query = """
+        UPDATE trip SET seats_available = seats_available - %s
+        WHERE trip_id = %s AND seats_available >= %s AND status = 'scheduled'
+        """
+        execute_in_transaction(cursor, claim_seats_query, (len(seats), trip_id, len(seats)))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return False, "Insufficient seats available, or the trip is no longer open for booking"
+
+        # Insert booking record
+        booking_query = """
+        INSERT INTO booking (user_id, trip_id, total_fare, payment_status, booking_status, booking_datetime)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        
+        execute_in_transaction(cursor, booking_query, (
+            user_id, trip_id, total_fare, 
+            'unpaid', 'booked', datetime.now()
+        ))
+        
+        booking_id = cursor.lastrowid
+        
+        # Insert ticket records for each seat
+        ticket_query = """
+        INSERT INTO ticket (booking_id, seat_no, pickup_point, drop_point)
+        VALUES (%s, %s, %s, %s)
+        """
+        
+        for seat in seats:
+            execute_in_transaction(cursor, ticket_query, (booking_id, seat, pickup_point, drop_point))
+        
+        outbox.record_changes(cursor, [("booking", booking_id), ("trip", trip_id)])
+        
+        # Commit the transaction
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        cursor.close()
+        release_connection(conn)
+    
+    _invalidate_trip_searches(trip_id)
+    return True, booking_id
+
+def get_booking_history(user_id, before=None, limit=None, include_archived=False):
+    """
+    Fetch a user's bookings, newest first, one keyset page at a time.
+    
+    Args:
+        user_id (int): The ID of the user whose bookings are listed.
+        before (tuple, optional): (booking_datetime, booking_id) of the last booking on the previous page.
+        limit (int, optional): Maximum number of bookings to return; all bookings when omitted.
+        include_archived (bool): Also list bookings for trips of archived months.
+    
+    Returns:
+        list: Booking rows ordered by booking_datetime and booking_id, both descending.
+    """
+    query = """
+    SELECT 
+        b.booking_id, b.booking_datetime, b.total_fare, 
+        b.booking_status, b.payment_status,
+        t.departure_datetime, t.arrival_datetime,
+        r.origin, r.destination, 
+        bus.bus_no, bus.bus_type
+    FROM 
+        {booking} b
+    JOIN 
+        {trip} t ON b.trip_id = t.trip_id
+    JOIN 
+        route r ON t.route_id = r.route_id
+    JOIN 
+        bus ON t.bus_id = bus.bus_id
+    WHERE 
+        b.user_id = %s
+    """
+    params = [user_id]
+    
+    # Seek past the previous page on the (user_id, booking_datetime) index instead of using OFFSET
+    if before:
+        query += " AND (b.booking_datetime < %s OR (b.booking_datetime = %s AND b.booking_id < %s))"
+        params.extend([before[0], before[0], before[1]])
+    
+    query, params = _page_with_archive(
+        query, params, "b.booking_datetime DESC, b.booking_id DESC", limit, include_archived
+    )
+    return query_with_params(query, tuple(params), replica=True)
+
+def get_booking(booking_id):
+    query = """
+    SELECT 
+        b.booking_id, b.user_id, b.trip_id, b.booking_datetime, b.total_fare, 
+        b.booking_status, b.payment_status,
+        t.departure_datetime, t.arrival_datetime
+    FROM 
+        booking b
+    JOIN 
+        trip t ON b.trip_id = t.trip_id
+    WHERE 
+        b.booking_id = %s
+    """
+    
+    result = query_with_params(query, (booking_id,))
+    if result:
+        return result[0]
+    return None
+
+def get_booking_tickets(booking_id):
+    query = """
+    SELECT 
+        ticket_id, seat_no, pickup_point, drop_point
+    FROM 
+        ticket
+    WHERE 
+        booking_id = %s
+    """
+    
+    return query_with_params(query, (booking_id,))
+
+def get_tickets_for_bookings(booking_ids, include_archived=False):
+    """
+    Fetch the tickets of many bookings with a single query.
+    
+    Args:
+        booking_ids (iterable): Booking IDs whose tickets are needed, e.g. every booking shown on a page.
+        include_archived (bool): Also look in the archive, for a page of get_booking_history(include_archived=True).
+    
+    Returns:
+        dict: booking_id -> list of ticket rows; bookings without tickets map to an empty list.
+    """
+    booking_ids = list(dict.fromkeys(booking_ids))
+    tickets_by_booking = {booking_id: [] for booking_id in booking_ids}
+    if not booking_ids:
+        return tickets_by_booking
+    
+    placeholders = ", ".join(["%s"] * len(booking_ids))
+    query = f"""
+    SELECT 
+        booking_id, ticket_id, seat_no, pickup_point, drop_point
+    FROM 
+        {{ticket}}
+    WHERE 
+        booking_id IN ({placeholders})
+    """
+    
+    query, params = _with_archive(query, booking_ids, include_archived)
+    query += " ORDER BY booking_id, ticket_id"
+    results = query_with_params(query, tuple(params))
+    for ticket in results or []:
+        tickets_by_booking[ticket.pop('booking_id')].append(ticket)
+    return tickets_by_booking
+
+def cancel_booking(booking_id):
+    try:
+        trip, cancelled = _cancel_booking_transaction(booking_id)
+    except Exception as e:
+        CANCELLATIONS.labels(result="error").inc()
+        return False, str(e)
+    
+    if not trip:
+        CANCELLATIONS.labels(result="not_found").inc()
+        return False, "Booking not found"
+    if not cancelled:
+        CANCELLATIONS.labels(result="not_active").inc()
+        return False, "Only active bookings can be cancelled"
+    _invalidate_trip_searches(trip['trip_id'], trip)
+    CANCELLATIONS.labels(result="cancelled").inc()
+    return True, "Booking cancelled successfully"
+
+@retry_transaction
+def _cancel_booking_transaction(booking_id):
+    # Returns (the booking's trip: trip_id, origin, destination, departure_datetime, whether this call
+    # cancelled it); the trip is None if there is no such booking
+    ticket_query = "SELECT COUNT(*) as ticket_count FROM ticket WHERE booking_id = %s"
+    trip_query = """
+    SELECT b.trip_id, r.origin, r.destination, t.departure_datetime
+    FROM booking b
+    JOIN trip t ON b.trip_id = t.trip_id
+    JOIN route r ON t.route_id = r.route_id
+    WHERE b.booking_id = %s
+    """
+    
+    conn = acquire_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    try:
+        # Get trip_id
+        execute_in_transaction(cursor, trip_query, (booking_id,))
+        trip_result = cursor.fetchone()
+        if not trip_result:
+            return None, False
+        
+        trip_id = trip_result['trip_id']
+        
+        # Cancel only a booking that is still booked. The row lock makes a second cancel of
+        # the same booking wait for the first and then match nothing, so its seats are
+        # restored exactly once
+        update_booking_query = """
+        UPDATE booking
+        SET booking_status = 'cancelled'
+        WHERE booking_id = %s AND booking_status = 'booked'
+        """
+        
+        execute_in_transaction(cursor, update_booking_query, (booking_id,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return trip_result, False
+        
+        # Get ticket count
+        execute_in_transaction(cursor, ticket_query, (booking_id,))
+        ticket_result = cursor.fetchone()
+        ticket_count = ticket_result['ticket_count']
+        
+        # Restore seats
+        update_seats_query = """
+        UPDATE trip 
+        SET seats_available = seats_available + %s
+        WHERE trip_id = %s
+        """
+        
+        execute_in_transaction(cursor, update_seats_query, (ticket_count, trip_id))
+        outbox.record_changes(cursor, [("booking", booking_id), ("trip", trip_id)])
+        
+        conn.commit()
+        return trip_result, True
+        
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+# Coordinator dashboard functions
+def get_all_buses(after=None, limit=None):
+    # Keyset pagination by primary key: pass the last bus_id of the previous page as `after`
+    query = "SELECT bus_id, bus_no, bus_type, capacity, driver_id FROM bus"
+    params = []
+    
+    if after:
+        query += " WHERE bus_id > %s"
+        params.append(after)
+    
+    query += " ORDER BY bus_id"
+    
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    
+    return query_with_params(query, tuple(params) if params else None)
+
+def bus_no_exists(bus_no):
+    query = "SELECT bus_id FROM bus WHERE bus_no = %s"
+    result = query_with_params(query, (bus_no,))
+    return bool(result)
+
+def add_bus(bus_no, bus_type, capacity, driver_id=None):
+    query = """
+    INSERT INTO bus (bus_no, bus_type, capacity, driver_id)
+    VALUES (%s, %s, %s, %s)
+    """
+    
+    success, bus_id = _execute_with_change(query, (bus_no, bus_type, capacity, driver_id), "bus")
+    return success, bus_id
+
+def update_bus(bus_id, bus_no, bus_type, capacity, driver_id=None):
+    query = """
+    UPDATE bus
+    SET bus_no = %s, bus_type = %s, capacity = %s, driver_id = %s
+    WHERE bus_id = %s
+    """
+    
+    success, _ = _execute_with_change(query, (bus_no, bus_type, capacity, driver_id, bus_id), "bus", bus_id)
+    return success
+
+def delete_bus(bus_id):
+    # Check if bus is used in any trips
+    # Archived trips still show the bus in booking history
+    check_query, params = _with_archive("SELECT COUNT(*) as trip_count FROM {trip} WHERE bus_id = %s", [bus_id], True)
+    result = query_with_params(check_query, tuple(params))
+    
+    if any(row['trip_count'] > 0 for row in result):
+        return False, "Cannot delete bus that is used in trips"
+    
+    query = "DELETE FROM bus WHERE bus_id = %s"
+    success, _ = _execute_with_change(query, (bus_id,), "bus", bus_id)
+    return success, None
+
+# Route management functions
+def get_all_routes():
+    query = "SELECT route_id, origin, destination, distance, base_fare, route_desc FROM route"
+    return query_with_params(query)
+
+def add_route(origin, destination, distance, base_fare, origin_lat, origin_lon, destination_lat, destination_lon, route_desc=None):
+    query = """
+    INSERT INTO route (origin, destination, distance, base_fare, route_desc, origin_lat, origin_lon, destination_lat, destination_lon)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    
+    success, route_id = _execute_with_change(query, (
+        origin, destination, distance, base_fare,
+        route_desc, origin_lat, origin_lon, destination_lat, destination_lon
+    ), "route")
+    return success, route_id
+
+def update_route(route_id, origin, destination, distance, base_fare, origin_lat, origin_lon, destination_lat, destination_lon, route_desc=None):
+    query = """
+    UPDATE route
+    SET origin = %s, destination = %s, distance = %s, base_fare = %s, origin_lat = %s, origin_lon = %s, 
+        destination_lat = %s, destination_lon = %s, route_desc = %s
+    WHERE route_id = %s
+    """
+    
+    success, _ = _execute_with_change(query, (origin, destination, distance, base_fare,
+        origin_lat, origin_lon, destination_lat, destination_lon, route_desc, route_id), "route", route_id)
+    return success
+
+def delete_route(route_id):
+    # Check if route is used in any trips
+    # Archived trips still show the route in booking history
+    check_query, params = _with_archive("SELECT COUNT(*) as trip_count FROM {trip} WHERE route_id = %s", [route_id], True)
+    result = query_with_params(check_query, tuple(params))
+    
+    if any(row['trip_count'] > 0 for row in result):
+        return False, "Cannot delete route that is used in trips"
+    
+    query = "DELETE FROM route WHERE route_id = %s"
+    success, _ = _execute_with_change(query, (route_id,), "route", route_id)
+    return success, None
+
+# Trip management functions
+def get_all_trips(include_past=False, after=None, limit=None, include_archived=False):
+    """
+    Fetch trips in departure order, one keyset page at a time.
+    
+    Args:
+        include_past (bool): Include trips that departed before today.
+        after (tuple, optional): (departure_datetime, trip_id) of the last trip on the previous page.
+        limit (int, optional): Maximum number of trips to return; all trips when omitted.
+        include_archived (bool): With include_past, also list the trips of archived months.
+    
+    Returns:
+        list: Trip rows ordered by departure_datetime and trip_id.
+    """
+    query = """
+    SELECT 
+        t.trip_id, b.bus_no, r.origin, r.destination, 
+        t.departure_datetime, t.arrival_datetime, 
+        t.seats_available, t.status
+    FROM 
+        {trip} t
+    JOIN 
+        bus b ON t.bus_id = b.bus_id
+    JOIN 
+        route r ON t.route_id = r.route_id
+    """
+    
+    conditions = []
+    params = []
+    
+    if not include_past:
+        conditions.append("t.departure_datetime >= %s")
+        params.append(_day_start(datetime.now()))
+    
+    if after:
+        conditions.append("(t.departure_datetime > %s OR (t.departure_datetime = %s AND t.trip_id > %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    query, params = _page_with_archive(
+        query, params, "t.departure_datetime, t.trip_id", limit, include_past and include_archived
+    )
+    return query_with_params(query, tuple(params) if params else None)
+
+def add_trip(bus_id, route_id, departure_datetime, arrival_datetime, seats_available=None):
+    # If seats_available is not provided, get bus capacity
+    if not seats_available:
+        bus_query = "SELECT capacity FROM bus WHERE bus_id = %s"
+        result = query_with_params(bus_query, (bus_id,))
+        if result:
+            seats_available = result[0]['capacity']
+        else:
+            return False, "Bus not found"
+    
+    query = """
+    INSERT INTO trip (bus_id, route_id, departure_datetime, arrival_datetime, seats_available, status)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    
+    success, trip_id = _execute_with_change(
+        query, 
+        (bus_id, route_id, departure_datetime, arrival_datetime, seats_available, 'scheduled'),
+        "trip"
+    )
+    if success:
+        _invalidate_trip_searches(trip_id)
+    return success, trip_id
+
+# Dashboard statistics functions
+# Bookings count while booked and once their trip has completed (busnexus.lifecycle).
+# Without include_archived these cover the hot tables: trips of the last
+# archive.ARCHIVE_KEEP_MONTHS months and later. With it, each side is aggregated
+# on its own and the partial results are added up.
+def get_total_bookings(include_archived=False):
+    query, _ = _with_archive(
+        "SELECT COUNT(*) as total FROM {booking} WHERE booking_status IN ('booked', 'completed')", [], include_archived
+    )
+    result = query_with_params(query, replica=True)
+    return sum(row['total'] for row in result) if result else 0
+
+DAILY_REVENUE_DTYPES = {
+    'booking_date': 'datetime64[ns]',
+    'daily_revenue': 'float64',
+    'booking_count': 'int64'
+}
+
+def get_daily_revenue(start_date=None, end_date=None, as_frame=False, include_archived=None):
+    """
+    Revenue and number of bookings per day, newest day first.
+    
+    Args:
+        start_date (date or str, optional): First day; from the first booking when omitted.
+        end_date (date or str, optional): Last day, inclusive; up to the latest booking when omitted.
+        as_frame (bool): Return a pandas DataFrame instead of a list of rows.
+        include_archived (bool, optional): Also count archived bookings. By default they are
+            counted only when the range starts before the end of the archive.
+    """
+    query = """
+    SELECT 
+        DATE(booking_datetime) as booking_date,
+        SUM(total_fare) as daily_revenue,
+        COUNT(*) as booking_count
+    FROM 
+        {booking}
+    WHERE 
+        booking_status IN ('booked', 'completed')
+    """
+    
+    params = []
+    
+    if start_date:
+        query += " AND booking_datetime >= %s"
+        params.append(_day_start(start_date))
+    
+    if end_date:
+        query += " AND booking_datetime < %s"
+        params.append(_day_start(end_date) + timedelta(days=1))
+    
+    query += " GROUP BY DATE(booking_datetime)"
+    
+    if include_archived is None:
+        include_archived = archive.is_historical(_day_start(start_date) if start_date else None)
+    query, params = _with_archive(query, params, include_archived)
+    if include_archived:
+        # A day can have bookings on both sides
+        query = f"""
+        SELECT booking_date, SUM(daily_revenue) as daily_revenue, SUM(booking_count) as booking_count
+        FROM ({query}) AS days
+        GROUP BY booking_date
+        """
+    query += " ORDER BY booking_date DESC"
+    
+    if as_frame:
+        return query_dataframe(query, tuple(params) if params else None, dtypes=DAILY_REVENUE_DTYPES, replica=True)
+    return query_with_params(query, tuple(params) if params else None, replica=True)
+
+ROUTE_POPULARITY_DTYPES = {
+    'trip_count': 'int64'
+}
+
+def get_route_popularity(as_frame=False, include_archived=False):
+    query = """
+    SELECT 
+        r.origin, r.destination, COUNT(*) as trip_count
+    FROM 
+        {booking} b
+    JOIN 
+        {trip} t ON b.trip_id = t.trip_id
+    JOIN 
+        route r ON t.route_id = r.route_id
+    WHERE 
+        b.booking_status IN ('booked', 'completed')
+    GROUP BY 
+        r.origin, r.destination
+    """
+    
+    query, _ = _with_archive(query, [], include_archived)
+    if include_archived:
+        query = f"""
+        SELECT origin, destination, SUM(trip_count) as trip_count
+        FROM ({query}) AS corridors
+        GROUP BY origin, destination
+        """
+    query += " ORDER BY trip_count DESC LIMIT 10"
+    
+    if as_frame:
+        return query_dataframe(query, dtypes=ROUTE_POPULARITY_DTYPES, replica=True)
+    return query_with_params(query, replica=True)
+
+def get_popular_destinations(include_archived=False):
+    query = """
+    SELECT 
+        r.destination, COUNT(*) as count
+    FROM 
+        {booking} b
+    JOIN 
+        {trip} t ON b.trip_id = t.trip_id
+    JOIN 
+        route r ON t.route_id = r.route_id
+    WHERE 
+        b.booking_status IN ('booked', 'completed')
+    GROUP BY 
+        r.destination
+    """
+    
+    query, _ = _with_archive(query, [], include_archived)
+    if include_archived:
+        query = f"""
+        SELECT destination, SUM(count) as count
+        FROM ({query}) AS destinations
+        GROUP BY destination
+        """
+    query += " ORDER BY count DESC LIMIT 10"
+    
+    return query_with_params(query, replica=True)
+
+# Utility functions
+def get_distinct_origins():
+    query = "SELECT DISTINCT origin FROM route ORDER BY origin"
+    results = query_with_params(query)
+    return [result['origin'] for result in results] if results else []
+
+def get_distinct_destinations():
+    query = "SELECT DISTINCT destination FROM route ORDER BY destination"
+    results = query_with_params(query)
+    return [result['destination'] for result in results] if results else []
+
+def get_all_drivers(after=None, limit=None):
+    # Keyset pagination by primary key: pass the last driver_id of the previous page as `after`
+    query = "SELECT * FROM driver"
+    params = []
+    
+    if after:
+        query += " WHERE driver_id > %s"
+        params.append(after)
+    
+    query += " ORDER BY driver_id"
+    
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    
+    return query_with_params(query, tuple(params) if params else None)
+
+def add_driver(first_name, last_name, contact_no, license_no, hired_date):
+    query = """
+    INSERT INTO driver (first_name, last_name, contact_no, license_no, hired_date)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    return _execute_with_change(query, (first_name, last_name, contact_no, license_no, hired_date), "driver")
+
+def update_driver(driver_id, first_name, last_name, contact_no, license_no, hired_date):
+    query = """
+    UPDATE driver
+    SET first_name = %s, last_name = %s, contact_no = %s, license_no = %s, hired_date = %s
+    WHERE driver_id = %s
+    """
+    return _execute_with_change(
+        query, (first_name, last_name, contact_no, license_no, hired_date, driver_id), "driver", driver_id
+    )
+
+def delete_driver(driver_id):
+    # Check if driver is assigned to any bus
+    check_query = "SELECT COUNT(*) as bus_count FROM bus WHERE driver_id = %s"
+    result = query_with_params(check_query, (driver_id,))
+    if result[0]['bus_count'] > 0:
+        return False, "Cannot delete driver assigned to a bus"
+    query = "DELETE FROM driver WHERE driver_id = %s"
+    return _execute_with_change(query, (driver_id,), "driver", driver_id)
@@ -0,0 +1,19 @@
+class BusNexusError(Exception):
+    """Base class for errors raised by the busnexus package"""
+
+class ConfigurationError(BusNexusError):
+    """The database configuration is missing or invalid"""
+
+class DatabaseError(BusNexusError):
+    """A statement failed; the driver exception is chained as __cause__"""
+
+    def __init__(self, message, query=None, errno=None):
+        super().__init__(message)
+        self.query = query
+        self.errno = errno
+
+class DuplicateKeyError(DatabaseError):
+    """An insert or update violated a unique key"""
+
+class PoolTimeoutError(DatabaseError):
+    """No pooled connection became free within the pool timeout"""
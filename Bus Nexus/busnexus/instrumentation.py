@@ -0,0 +1,212 @@
+import logging
+import logging.handlers
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Statements slower than this (connection wait + execution) go to the slow-query log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("BUSNEXUS_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_FILE = os.getenv("BUSNEXUS_SLOW_QUERY_LOG", os.path.join("logs", "slow_queries.log"))
+
+logger = logging.getLogger("busnexus.queries")
+
+_slow_query_logger = None
+_slow_query_logger_lock = threading.Lock()
+
+def get_slow_query_logger():
+    """Return the logger writing the rotating slow-query log, creating it on first use"""
+    global _slow_query_logger
+    if _slow_query_logger is None:
+        with _slow_query_logger_lock:
+            if _slow_query_logger is None:
+                slow_logger = logging.getLogger("busnexus.slow_queries")
+                slow_logger.setLevel(logging.INFO)
+                slow_logger.propagate = False
+                log_dir = os.path.dirname(SLOW_QUERY_LOG_FILE)
+                if log_dir:
+                    os.makedirs(log_dir, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    SLOW_QUERY_LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                slow_logger.addHandler(handler)
+                _slow_query_logger = slow_logger
+    return _slow_query_logger
+
+# SQL normalization
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def fingerprint(query):
+    """Normalize a statement so every execution of the same query shape shares one key.
+
+    Literals and placeholders become ?, IN lists of any length collapse to (?+) and
+    whitespace is squeezed, e.g. "SELECT * FROM trip WHERE trip_id = %s" and
+    "SELECT *  FROM trip WHERE trip_id = 42" both become "SELECT * FROM trip WHERE trip_id = ?".
+    """
+    normalized = _COMMENT_RE.sub(" ", query)
+    normalized = _STRING_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _PLACEHOLDER_RE.sub("?", normalized)
+    normalized = _IN_LIST_RE.sub("(?+)", normalized)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+def redact_params(params):
+    """Describe query parameters by type only, so values never reach the logs"""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in params) + ")"
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram; percentiles are accurate to within about 5%."""
+
+    GROWTH = 1.1
+    MIN_MS = 0.01
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        index = 0 if ms <= self.MIN_MS else int(math.log(ms / self.MIN_MS, self.GROWTH)) + 1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * pct / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Report the midpoint of the bucket, capped by the largest sample seen
+                upper = self.MIN_MS * self.GROWTH ** index
+                lower = upper / self.GROWTH if index else 0.0
+                return min((lower + upper) / 2, self.max_ms)
+        return self.max_ms
+
+class QueryStats:
+    """Aggregated timings of one query fingerprint"""
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.latency = LatencyHistogram()
+        self.wait_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+    def as_dict(self):
+        calls = self.latency.count
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': calls,
+            'errors': self.errors,
+            'slow': self.slow,
+            'rows': self.rows,
+            'total_ms': round(self.latency.total_ms, 2),
+            'mean_ms': round(self.latency.total_ms / calls, 2) if calls else 0.0,
+            'p50_ms': round(self.latency.percentile(50), 2),
+            'p95_ms': round(self.latency.percentile(95), 2),
+            'p99_ms': round(self.latency.percentile(99), 2),
+            'max_ms': round(self.latency.max_ms, 2),
+            'mean_wait_ms': round(self.wait_ms / calls, 2) if calls else 0.0,
+        }
+
+class QueryRecord:
+    """Timing of a single statement execution"""
+
+    def __init__(self, query, params=None, wait_time=0.0):
+        self.query = query
+        self.params = params
+        self.wait_time = wait_time
+        self.exec_time = 0.0
+        self.rows = 0
+        self.error = None
+
+    @contextmanager
+    def timed(self):
+        """Add the time spent in the block to this statement's execution time"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.exec_time += time.perf_counter() - start
+
+_stats = {}
+_stats_lock = threading.Lock()
+_listeners = []
+
+def add_listener(listener):
+    """Call listener(record, fingerprint) after every recorded statement"""
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def record_query(record):
+    """Aggregate a finished statement and log it if it failed or was slow"""
+    key = fingerprint(record.query)
+    wait_ms = record.wait_time * 1000
+    exec_ms = record.exec_time * 1000
+    total_ms = wait_ms + exec_ms
+    slow = total_ms >= SLOW_QUERY_THRESHOLD_MS
+
+    with _stats_lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = QueryStats(key)
+        stats.latency.add(exec_ms)
+        stats.wait_ms += wait_ms
+        stats.rows += max(record.rows, 0)
+        stats.errors += record.error is not None
+        stats.slow += slow
+
+    if record.error is not None:
+        logger.error("Query failed: %s params=%s error=%s", key, redact_params(record.params), record.error)
+    if slow:
+        get_slow_query_logger().info(
+            "total_ms=%.1f wait_ms=%.1f exec_ms=%.1f rows=%d params=%s query=%s",
+            total_ms, wait_ms, exec_ms, max(record.rows, 0), redact_params(record.params), key
+        )
+
+    for listener in list(_listeners):
+        listener(record, key)
+
+@contextmanager
+def observe(query, params=None, wait_time=0.0):
+    """Time the statement executed in the block; set record.rows inside it"""
+    record = QueryRecord(query, params, wait_time)
+    try:
+        with record.timed():
+            yield record
+    except Exception as e:
+        record.error = e
+        raise
+    finally:
+        record_query(record)
+
+def get_query_stats():
+    """Return per-fingerprint statistics, most expensive first"""
+    with _stats_lock:
+        rows = [stats.as_dict() for stats in _stats.values()]
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
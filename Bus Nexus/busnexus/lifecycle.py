@@ -0,0 +1,231 @@
+"""Trip lifecycle: scheduled, boarding, departed, completed.
+
+add_trip creates trips as scheduled. advance_trips() moves every trip whose
+time has come to its next status, set-based: each transition reads the
+trips due for it from an index on (status, departure_datetime) or
+(status, arrival_datetime) (migration 0008_trip_status_indexes) and updates
+them in batches of LIFECYCLE_BATCH_SIZE, one transaction per batch. A tick
+costs a few index probes plus the rows that change, however long the
+trip table is.
+
+    scheduled -> boarding    BOARDING_WINDOW before departure
+    boarding  -> departed    at departure
+    departed  -> completed   at arrival; the trip's booked bookings become completed
+
+A trip whose arrival passed while nothing ran (a new deployment, an outage)
+goes straight to completed in one step. Only scheduled trips are searchable
+and bookable, so boarding closes sales. Every changed trip gets a change event
+(busnexus.outbox), which drops it from cached searches in every process.
+
+One worker per database owns the transitions; run it from the "Bus Nexus"
+directory:
+
+    python -m busnexus.lifecycle --every 30
+
+A single-process deployment can instead set BUSNEXUS_LIFECYCLE_SECONDS to run
+them from a daemon thread of the app (start_lifecycle()) every that many
+seconds. Each batch locks the trips still in the previous status and moves,
+completes bookings of and records events for only those, so overlapping
+runners do no harm.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import (
+    configure, get_backend, query_with_params, acquire_connection, release_connection, execute_in_transaction,
+    retry_transaction
+)
+from busnexus.errors import BusNexusError
+from busnexus.metrics import counter
+from busnexus import outbox
+
+logger = logging.getLogger("busnexus.lifecycle")
+
+# Boarding opens this long before departure, and with it sales close
+BOARDING_WINDOW = timedelta(minutes=int(os.getenv("BUSNEXUS_BOARDING_MINUTES", "30")))
+# Seconds between runs of the transitions in each app process; 0, the default, leaves them to the CLI
+LIFECYCLE_INTERVAL = float(os.getenv("BUSNEXUS_LIFECYCLE_SECONDS", "0"))
+# Trips updated per transaction
+LIFECYCLE_BATCH_SIZE = 500
+
+# (from status, to status, time column, how long before that time the move is due),
+# latest status first so an overdue trip moves straight to where it belongs
+TRANSITIONS = [
+    ("scheduled", "completed", "arrival_datetime", timedelta(0)),
+    ("boarding", "completed", "arrival_datetime", timedelta(0)),
+    ("departed", "completed", "arrival_datetime", timedelta(0)),
+    ("scheduled", "departed", "departure_datetime", timedelta(0)),
+    ("boarding", "departed", "departure_datetime", timedelta(0)),
+    ("scheduled", "boarding", "departure_datetime", BOARDING_WINDOW),
+]
+
+TRIP_TRANSITIONS = counter(
+    "busnexus_trip_transitions_total", "Trips moved to a new lifecycle status", ["from_status", "to_status"]
+)
+BOOKINGS_COMPLETED = counter("busnexus_bookings_completed_total", "Bookings completed with their trip")
+LIFECYCLE_ERRORS = counter("busnexus_lifecycle_errors_total", "Failed runs of the trip lifecycle transitions")
+
+def status_at(departure, arrival, now):
+    """The status a scheduled trip should have at now"""
+    if arrival <= now:
+        return "completed"
+    if departure <= now:
+        return "departed"
+    if departure - BOARDING_WINDOW <= now:
+        return "boarding"
+    return "scheduled"
+
+@retry_transaction
+def _move_trips(trip_ids, from_status, to_status):
+    """Move trips still in from_status to to_status in one transaction; (trips moved, bookings completed)"""
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        # Another runner may have moved some of them since they were read; the rest stay locked until commit
+        select_trips_query = f"""
+        SELECT trip_id FROM trip
+        WHERE trip_id IN ({", ".join(["%s"] * len(trip_ids))}) AND status = %s
+        {get_backend().lock_rows}
+        """
+        execute_in_transaction(cursor, select_trips_query, (*trip_ids, from_status))
+        moving = [row[0] for row in cursor.fetchall()]
+        if not moving:
+            conn.commit()
+            return 0, 0
+        placeholders = ", ".join(["%s"] * len(moving))
+
+        update_trips_query = f"""
+        UPDATE trip SET status = %s
+        WHERE trip_id IN ({placeholders}) AND status = %s
+        """
+        execute_in_transaction(cursor, update_trips_query, (to_status, *moving, from_status))
+        moved = cursor.rowcount
+
+        completed = 0
+        if to_status == "completed":
+            complete_bookings_query = f"""
+            UPDATE booking SET booking_status = 'completed'
+            WHERE trip_id IN ({placeholders}) AND booking_status = 'booked'
+            """
+            execute_in_transaction(cursor, complete_bookings_query, tuple(moving))
+            completed = cursor.rowcount
+
+        outbox.record_changes(cursor, [("trip", trip_id) for trip_id in moving])
+        conn.commit()
+        return moved, completed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+def advance_trips(now=None, batch_size=LIFECYCLE_BATCH_SIZE):
+    """
+    Move every trip that is due to its next lifecycle status.
+
+    Args:
+        now (datetime, optional): Time to advance to; the current time when omitted.
+        batch_size (int): Trips updated per transaction.
+
+    Returns:
+        dict: Trips moved by (from status, to status), for the transitions that moved any,
+            and 'bookings_completed'.
+    """
+    now = now or datetime.now()
+    counts = {}
+    bookings_completed = 0
+    for from_status, to_status, column, lead in TRANSITIONS:
+        query = f"""
+        SELECT trip_id
+        FROM trip
+        WHERE status = %s AND {column} <= %s
+        ORDER BY {column}
+        LIMIT %s
+        """
+        while True:
+            trips = query_with_params(query, (from_status, now + lead, batch_size))
+            if not trips:
+                break
+            moved, completed = _move_trips([trip['trip_id'] for trip in trips], from_status, to_status)
+            counts[(from_status, to_status)] = counts.get((from_status, to_status), 0) + moved
+            bookings_completed += completed
+            TRIP_TRANSITIONS.labels(from_status=from_status, to_status=to_status).inc(moved)
+            BOOKINGS_COMPLETED.inc(completed)
+            if len(trips) < batch_size:
+                break
+    counts['bookings_completed'] = bookings_completed
+    return counts
+
+class TripLifecycle:
+    """Runs advance_trips() every interval seconds on a daemon thread"""
+
+    def __init__(self, interval=LIFECYCLE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                advance_trips()
+            except Exception as e:
+                LIFECYCLE_ERRORS.inc()
+                logger.warning("Advancing trip statuses failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="busnexus-lifecycle", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+_lifecycle = None
+_lifecycle_lock = threading.Lock()
+
+def start_lifecycle():
+    """Advance trip statuses from a daemon thread when BUSNEXUS_LIFECYCLE_SECONDS is set; safe to call
+    on every rerun, only the first call starts it"""
+    global _lifecycle
+    with _lifecycle_lock:
+        if _lifecycle is None and LIFECYCLE_INTERVAL > 0:
+            _lifecycle = TripLifecycle()
+            _lifecycle.start()
+        return _lifecycle
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--batch-size", type=int, default=LIFECYCLE_BATCH_SIZE, help="Trips updated per transaction")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="Keep running, advancing again after this long")
+    args = parser.parse_args(argv)
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    while True:
+        try:
+            counts = advance_trips(batch_size=args.batch_size)
+            moved = ", ".join(f"{count} {key[0]} -> {key[1]}"
+                              for key, count in counts.items() if key != 'bookings_completed')
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} trips moved: {moved or 'none'}; "
+                  f"bookings completed: {counts['bookings_completed']}")
+        except BusNexusError as e:
+            print(f"error: {e}", file=sys.stderr)
+            if not args.every:
+                return 1
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("busnexus.metrics")
+
+# Writers are spread over independently locked stripes so concurrent reruns rarely
+# contend on the same lock; a scrape sums the stripes
+STRIPES = 16
+
+_stripe_ids = itertools.count()
+_thread_stripe = threading.local()
+
+def _stripe_index():
+    index = getattr(_thread_stripe, "index", None)
+    if index is None:
+        index = _thread_stripe.index = next(_stripe_ids) % STRIPES
+    return index
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _CounterValue:
+    def __init__(self):
+        self._stripes = [[0] for _ in range(STRIPES)]
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+
+    def inc(self, amount=1):
+        index = _stripe_index()
+        with self._locks[index]:
+            self._stripes[index][0] += amount
+
+    def get(self):
+        return sum(stripe[0] for stripe in self._stripes)
+
+class _GaugeValue:
+    def __init__(self):
+        self._value = 0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Report function() at scrape time instead of a stored value"""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call keeps concurrent calls from sharing a start time
+        return _Timer(self._histogram)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Per stripe: one count per bucket, then the sum and the total count
+        self._stripes = [[0] * len(buckets) + [0.0, 0] for _ in range(STRIPES)]
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+
+    def observe(self, value):
+        bucket = len(self._buckets) - 1
+        for position, bound in enumerate(self._buckets):
+            if value <= bound:
+                bucket = position
+                break
+        index = _stripe_index()
+        stripe = self._stripes[index]
+        with self._locks[index]:
+            stripe[bucket] += 1
+            stripe[-2] += value
+            stripe[-1] += 1
+
+    def time(self):
+        """Observe the duration of a block or decorated function, in seconds"""
+        return _Timer(self)
+
+    def get(self):
+        totals = [0] * len(self._buckets) + [0.0, 0]
+        for stripe in self._stripes:
+            for position, value in enumerate(stripe):
+                totals[position] += value
+        cumulative = list(itertools.accumulate(totals[:len(self._buckets)]))
+        return cumulative, totals[-2], totals[-1]
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_value()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_value())
+        return child
+
+    def __getattr__(self, attribute):
+        # Metrics without labels proxy inc/set/observe/time to their single value
+        if attribute.startswith("_") or self.labelnames:
+            raise AttributeError(attribute)
+        return getattr(self._children[()], attribute)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            yield list(zip(self.labelnames, key)), child.get()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue()
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) if buckets[-1] == float("inf") else tuple(buckets) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (cumulative, total, count) in self.samples():
+            for bound, bucket_count in zip(self.buckets, cumulative):
+                bucket_labels = labels + [("le", _format_value(bound))]
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class Registry:
+    """Named metrics of this process; creating a metric that exists returns the existing one"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY._get_or_create(Counter, name, documentation, labelnames)
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY._get_or_create(Gauge, name, documentation, labelnames)
+
+def histogram(name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+    return REGISTRY._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+# Prometheus endpoint
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to log
+        pass
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics from a daemon thread; safe to call on every rerun, only the first call starts it"""
+    global _server, _server_started
+    with _server_lock:
+        if _server_started:
+            return _server
+        _server_started = True
+        port = int(port or os.getenv("BUSNEXUS_METRICS_PORT", "9108"))
+        host = host or os.getenv("BUSNEXUS_METRICS_HOST", "0.0.0.0")
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+            return None
+        _server.daemon_threads = True
+        thread = threading.Thread(target=_server.serve_forever, name="busnexus-metrics", daemon=True)
+        thread.start()
+        logger.info("Serving Prometheus metrics on %s:%s/metrics", host, port)
+        return _server
@@ -0,0 +1,70 @@
+"""Apply, revert and inspect schema migrations.
+
+Run from the "Bus Nexus" directory against the database in BUSNEXUS_DATABASE_URL
+(or BUSNEXUS_DB_*), or pass --database-url:
+
+    python -m busnexus.migrate status
+    python -m busnexus.migrate up                    # everything pending
+    python -m busnexus.migrate up --to 0002
+    python -m busnexus.migrate up --online           # build indexes without blocking writes
+    python -m busnexus.migrate up --dry-run          # print the DDL for review instead
+    python -m busnexus.migrate down                  # revert the newest migration
+    python -m busnexus.migrate down --to 0001
+    python -m busnexus.migrate fake 0001             # existing database: baseline is already there
+"""
+import argparse
+import sys
+
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure
+from busnexus.errors import BusNexusError
+from busnexus.migrations import status, migrate, rollback, fake
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="List migrations and whether each is applied")
+
+    up = commands.add_parser("up", help="Apply pending migrations")
+    up.add_argument("--to", metavar="VERSION", help="Stop after this version")
+
+    down = commands.add_parser("down", help="Revert applied migrations")
+    down.add_argument("--to", metavar="VERSION", help="Revert everything newer than this version (0000 for all)")
+    down.add_argument("--steps", type=int, default=1, help="Migrations to revert when --to is not given")
+
+    for command in (up, down):
+        command.add_argument("--online", action="store_true",
+                             help="Change indexes without blocking writes (MySQL INPLACE/LOCK=NONE) "
+                                  "and retry when a metadata lock is not granted quickly")
+        command.add_argument("--dry-run", action="store_true", help="Print the statements without running them")
+
+    fake_parser = commands.add_parser("fake", help="Mark migrations up to VERSION as applied without running them")
+    fake_parser.add_argument("version")
+
+    args = parser.parse_args(argv)
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    try:
+        if args.command == "status":
+            for migration, applied in status():
+                print(f"[{'x' if applied else ' '}] {migration.version}_{migration.name}  {migration.description}")
+        elif args.command == "up":
+            applied = migrate(args.to, online=args.online, dry_run=args.dry_run, log=print)
+            print(f"{len(applied)} migration(s) {'to apply' if args.dry_run else 'applied'}")
+        elif args.command == "down":
+            reverted = rollback(args.to, args.steps, online=args.online, dry_run=args.dry_run, log=print)
+            print(f"{len(reverted)} migration(s) {'to revert' if args.dry_run else 'reverted'}")
+        else:
+            marked = fake(args.version)
+            print(f"Marked {', '.join(migration.version for migration in marked)} as applied")
+    except BusNexusError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
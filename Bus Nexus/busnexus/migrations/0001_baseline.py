@@ -0,0 +1,16 @@
+"""Baseline schema: users, driver, bus, route, trip, booking and ticket"""
+import re
+
+from busnexus.schema import TABLES, INDEXES
+
+def _table_name(statement):
+    return re.search(r"CREATE TABLE (\w+)", statement).group(1)
+
+def up(ctx):
+    for statement in TABLES + INDEXES:
+        ctx.execute(statement)
+
+def down(ctx):
+    # Children before parents, so no foreign key is left dangling
+    for statement in reversed(TABLES):
+        ctx.execute(f"DROP TABLE {_table_name(statement)}")
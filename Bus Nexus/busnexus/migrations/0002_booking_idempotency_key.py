@@ -0,0 +1,10 @@
+"""Idempotency key on booking, so a repeated submit returns the original booking"""
+
+def up(ctx):
+    # Databases that already ran the ALTER TABLE by hand keep their column and index
+    ctx.add_column_if_missing("booking", "idempotency_key", "VARCHAR(64) NULL")
+    ctx.create_index_if_missing("uq_booking_idempotency_key", "booking", ["idempotency_key"], unique=True)
+
+def down(ctx):
+    ctx.drop_index_if_exists("uq_booking_idempotency_key", "booking")
+    ctx.drop_column_if_exists("booking", "idempotency_key")
@@ -0,0 +1,24 @@
+"""Indexes for booking history, ticket lookups, trip search and seat bookkeeping"""
+
+INDEXES = [
+    # get_booking_history: WHERE user_id = ? ORDER BY booking_datetime DESC with keyset seeks
+    ("idx_booking_user_datetime", "booking", ["user_id", "booking_datetime"]),
+    # Bookings of a trip: route popularity joins, seat reconciliation
+    ("idx_booking_trip", "booking", ["trip_id"]),
+    # get_booking_tickets, get_tickets_for_bookings, cancel_booking's ticket count
+    ("idx_ticket_booking", "ticket", ["booking_id"]),
+    # get_search_results: route, status and a departure range on one index
+    ("idx_trip_route_status_departure", "trip", ["route_id", "status", "departure_datetime"]),
+]
+
+def up(ctx):
+    for name, table, columns in INDEXES:
+        ctx.create_index_if_missing(name, table, columns)
+
+def down(ctx):
+    for name, table, columns in reversed(INDEXES):
+        if ctx.backend.name == "mysql":
+            # InnoDB dropped its implicit foreign key index when this one took over and
+            # refuses to drop the last index on a foreign key column, so put one back first
+            ctx.create_index_if_missing(f"fk_{table}_{columns[0]}", table, columns[:1])
+        ctx.drop_index_if_exists(name, table)
@@ -0,0 +1,23 @@
+"""Indexes for the coordinator's trip list and the bus delete check"""
+
+INDEXES = [
+    # get_all_trips: departure range, ORDER BY departure_datetime, trip_id and keyset seeks
+    ("idx_trip_departure", "trip", ["departure_datetime"]),
+    # delete_bus: counting a bus's trips scanned the whole trip table
+    ("idx_trip_bus", "trip", ["bus_id"]),
+]
+
+def up(ctx):
+    for name, table, columns in INDEXES:
+        ctx.create_index_if_missing(name, table, columns)
+    if ctx.backend.name == "sqlite":
+        # SQLite has no statistics for a new index until ANALYZE runs and meanwhile drives
+        # get_all_trips from bus, sorting every upcoming trip; InnoDB samples new indexes itself
+        ctx.execute("ANALYZE trip")
+
+def down(ctx):
+    if ctx.backend.name == "mysql":
+        # InnoDB refuses to drop the last index on a foreign key column, so trip.bus_id gets a plain one back
+        ctx.create_index_if_missing("fk_trip_bus_id", "trip", ["bus_id"])
+    for name, table, columns in reversed(INDEXES):
+        ctx.drop_index_if_exists(name, table)
@@ -0,0 +1,20 @@
+"""Outbox of row changes, read by every process to invalidate its caches"""
+
+CHANGE_EVENT_TABLE = """
+CREATE TABLE change_event (
+    event_id {pk},
+    table_name VARCHAR(30) NOT NULL,
+    row_key INT NOT NULL,
+    created_at DATETIME NOT NULL
+) {table_options}
+"""
+
+def up(ctx):
+    if not ctx.table_exists("change_event"):
+        ctx.execute(CHANGE_EVENT_TABLE)
+    # busnexus.outbox.purge deletes by age
+    ctx.create_index_if_missing("idx_change_event_created", "change_event", ["created_at"])
+
+def down(ctx):
+    if ctx.table_exists("change_event"):
+        ctx.execute("DROP TABLE change_event")
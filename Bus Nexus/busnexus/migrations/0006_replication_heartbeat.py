@@ -0,0 +1,18 @@
+"""Heartbeat row the primary keeps rewriting, so replica lag can be read on the replica"""
+from datetime import datetime
+
+HEARTBEAT_TABLE = """
+CREATE TABLE replication_heartbeat (
+    heartbeat_id INT NOT NULL PRIMARY KEY,
+    beat_at DATETIME NOT NULL
+) {table_options}
+"""
+
+def up(ctx):
+    if not ctx.table_exists("replication_heartbeat"):
+        ctx.execute(HEARTBEAT_TABLE)
+        ctx.execute("INSERT INTO replication_heartbeat (heartbeat_id, beat_at) VALUES (1, %s)", (datetime.now(),))
+
+def down(ctx):
+    if ctx.table_exists("replication_heartbeat"):
+        ctx.execute("DROP TABLE replication_heartbeat")
@@ -0,0 +1,76 @@
+"""Archive tables for trips, bookings and tickets of closed months (see busnexus.archive)"""
+
+# Same columns as the hot tables. Rows keep the ids they had there, so the keys are
+# plain INTs. There are no foreign keys: rows only arrive from the hot tables, whose
+# keys were checked when they were written, and delete_bus and delete_route check the
+# archive themselves.
+ARCHIVE_TABLES = {
+    "trip_archive": """
+    CREATE TABLE trip_archive (
+        trip_id INT NOT NULL PRIMARY KEY,
+        bus_id INT NOT NULL,
+        route_id INT NOT NULL,
+        departure_datetime DATETIME NOT NULL,
+        arrival_datetime DATETIME NOT NULL,
+        seats_available INT NOT NULL,
+        status VARCHAR(20) NOT NULL
+    ) {table_options}
+    """,
+    "booking_archive": """
+    CREATE TABLE booking_archive (
+        booking_id INT NOT NULL PRIMARY KEY,
+        user_id INT NOT NULL,
+        trip_id INT NOT NULL,
+        total_fare DECIMAL(10,2) NOT NULL,
+        payment_status VARCHAR(20) NOT NULL,
+        booking_status VARCHAR(20) NOT NULL,
+        booking_datetime DATETIME NOT NULL,
+        idempotency_key VARCHAR(64) NULL
+    ) {table_options}
+    """,
+    "ticket_archive": """
+    CREATE TABLE ticket_archive (
+        ticket_id INT NOT NULL PRIMARY KEY,
+        booking_id INT NOT NULL,
+        seat_no VARCHAR(10) NOT NULL,
+        pickup_point VARCHAR(100),
+        drop_point VARCHAR(100)
+    ) {table_options}
+    """,
+    # One row per month moved out of the hot tables; the newest marks where the archive ends
+    "archive_month": """
+    CREATE TABLE archive_month (
+        month DATE NOT NULL PRIMARY KEY,
+        trips INT NOT NULL,
+        bookings INT NOT NULL,
+        tickets INT NOT NULL,
+        archived_at DATETIME NOT NULL
+    ) {table_options}
+    """,
+}
+
+INDEXES = [
+    # get_all_trips(include_archived=True): departure order and keyset seeks
+    ("idx_trip_archive_departure", "trip_archive", ["departure_datetime"]),
+    # delete_bus and delete_route refuse while archived trips still name the row
+    ("idx_trip_archive_bus", "trip_archive", ["bus_id"]),
+    ("idx_trip_archive_route", "trip_archive", ["route_id"]),
+    # get_booking_history(include_archived=True)
+    ("idx_booking_archive_user_datetime", "booking_archive", ["user_id", "booking_datetime"]),
+    # Joins from archived trips; revenue over historical date ranges
+    ("idx_booking_archive_trip", "booking_archive", ["trip_id"]),
+    ("idx_booking_archive_datetime", "booking_archive", ["booking_datetime"]),
+    ("idx_ticket_archive_booking", "ticket_archive", ["booking_id"]),
+]
+
+def up(ctx):
+    for table, statement in ARCHIVE_TABLES.items():
+        if not ctx.table_exists(table):
+            ctx.execute(statement)
+    for name, table, columns in INDEXES:
+        ctx.create_index_if_missing(name, table, columns)
+
+def down(ctx):
+    for table in reversed(list(ARCHIVE_TABLES)):
+        if ctx.table_exists(table):
+            ctx.execute(f"DROP TABLE {table}")
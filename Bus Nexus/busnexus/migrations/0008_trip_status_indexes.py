@@ -0,0 +1,19 @@
+"""Indexes for the trip lifecycle transitions on status and departure or arrival time"""
+
+INDEXES = [
+    # busnexus.lifecycle: scheduled trips due for boarding, boarding trips due to depart
+    ("idx_trip_status_departure", "trip", ["status", "departure_datetime"]),
+    # busnexus.lifecycle: trips due to complete
+    ("idx_trip_status_arrival", "trip", ["status", "arrival_datetime"]),
+]
+
+def up(ctx):
+    for name, table, columns in INDEXES:
+        ctx.create_index_if_missing(name, table, columns)
+    if ctx.backend.name == "sqlite":
+        # Without statistics for the new indexes SQLite may prefer them to idx_trip_departure (see 0004)
+        ctx.execute("ANALYZE trip")
+
+def down(ctx):
+    for name, table, columns in reversed(INDEXES):
+        ctx.drop_index_if_exists(name, table)
@@ -0,0 +1,37 @@
+"""Queue of outgoing notifications, at most one of each kind per booking"""
+
+NOTIFICATION_TABLE = """
+CREATE TABLE notification (
+    notification_id {pk},
+    booking_id INT NOT NULL,
+    kind VARCHAR(30) NOT NULL,
+    recipient VARCHAR(100) NOT NULL,
+    subject VARCHAR(200) NOT NULL,
+    body TEXT NOT NULL,
+    due_at DATETIME NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL,
+    sent_at DATETIME NULL
+) {table_options}
+"""
+
+INDEXES = [
+    # Enqueueing the same reminder twice is a no-op (INSERT IGNORE)
+    ("uq_notification_booking_kind", "notification", ["booking_id", "kind"], True),
+    # The sender takes pending notifications in id order
+    ("idx_notification_status", "notification", ["status", "notification_id"], False),
+    # Purging by age
+    ("idx_notification_due", "notification", ["due_at"], False),
+]
+
+def up(ctx):
+    # No foreign key to booking: notifications outlive the move of their booking to booking_archive
+    if not ctx.table_exists("notification"):
+        ctx.execute(NOTIFICATION_TABLE)
+    for name, table, columns, unique in INDEXES:
+        ctx.create_index_if_missing(name, table, columns, unique=unique)
+
+def down(ctx):
+    if ctx.table_exists("notification"):
+        ctx.execute("DROP TABLE notification")
@@ -0,0 +1,39 @@
+"""Fare quotes, which lock a dynamic price until booking, and promo codes (see busnexus.pricing)"""
+
+TABLES = {
+    # booking_id is set by the booking that used the quote; a quote is used at most once
+    "fare_quote": """
+    CREATE TABLE fare_quote (
+        quote_id {pk},
+        user_id INT NOT NULL,
+        trip_id INT NOT NULL,
+        num_seats INT NOT NULL,
+        fare_per_seat DECIMAL(10,2) NOT NULL,
+        total_fare DECIMAL(10,2) NOT NULL,
+        promo_code VARCHAR(30) NULL,
+        created_at DATETIME NOT NULL,
+        expires_at DATETIME NOT NULL,
+        booking_id INT NULL
+    ) {table_options}
+    """,
+    "promo_code": """
+    CREATE TABLE promo_code (
+        code VARCHAR(30) NOT NULL PRIMARY KEY,
+        percent_off DECIMAL(5,2) NOT NULL,
+        valid_from DATETIME NOT NULL,
+        valid_until DATETIME NOT NULL
+    ) {table_options}
+    """,
+}
+
+def up(ctx):
+    for table, ddl in TABLES.items():
+        if not ctx.table_exists(table):
+            ctx.execute(ddl)
+    # Purging expired quotes
+    ctx.create_index_if_missing("idx_fare_quote_expires", "fare_quote", ["expires_at"])
+
+def down(ctx):
+    for table in reversed(list(TABLES)):
+        if ctx.table_exists(table):
+            ctx.execute(f"DROP TABLE {table}")
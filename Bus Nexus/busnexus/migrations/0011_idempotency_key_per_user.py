@@ -0,0 +1,11 @@
+"""Idempotency keys unique per user rather than across all bookings"""
+
+def up(ctx):
+    # One user's key must never match, or reveal, another user's booking
+    ctx.create_index_if_missing("uq_booking_user_idempotency_key", "booking", ["user_id", "idempotency_key"], unique=True)
+    ctx.drop_index_if_exists("uq_booking_idempotency_key", "booking")
+
+def down(ctx):
+    # Fails if two users have since used the same key
+    ctx.create_index_if_missing("uq_booking_idempotency_key", "booking", ["idempotency_key"], unique=True)
+    ctx.drop_index_if_exists("uq_booking_user_idempotency_key", "booking")
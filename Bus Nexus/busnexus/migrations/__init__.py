@@ -0,0 +1,247 @@
+"""Versioned schema migrations.
+
+Each module in this package named NNNN_description.py is one migration with
+an up(ctx) and a down(ctx) function; ctx is a MigrationContext. Applied
+versions are recorded in the schema_migrations table. Run them with
+
+    python -m busnexus.migrate up|down|status|fake
+
+MySQL commits DDL implicitly, so a migration that fails halfway is not rolled
+back there. Migrations use the *_if_missing / *_if_exists helpers so that
+running them again after fixing the cause picks up where they stopped.
+"""
+import importlib
+import pkgutil
+import re
+import time
+from datetime import datetime
+
+from busnexus.connection import get_backend, pooled_connection, execute_in_transaction
+from busnexus.errors import BusNexusError, DatabaseError
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(4) NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at DATETIME NOT NULL
+)
+"""
+
+# Online mode: seconds DDL may wait for a metadata lock, and how often to retry
+ONLINE_LOCK_WAIT_TIMEOUT = 5
+ONLINE_DDL_ATTEMPTS = 10
+
+_MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+class MigrationError(BusNexusError):
+    """A migration could not be found or applied"""
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+    def __repr__(self):
+        return f"Migration({self.version}_{self.name})"
+
+def discover():
+    """All migrations in this package, oldest first"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(module_info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{module_info.name}")
+            migrations.append(Migration(match.group(1), match.group(2), module))
+    migrations.sort(key=lambda migration: migration.version)
+    return migrations
+
+class MigrationContext:
+    """What a migration's up() and down() use to change the schema"""
+
+    def __init__(self, cursor, backend, online=False, dry_run=False, log=print):
+        self.cursor = cursor
+        self.backend = backend
+        self.online = online
+        self.dry_run = dry_run
+        self.log = log
+
+    def execute(self, statement, params=None):
+        statement = self.backend.render_ddl(statement).strip()
+        if self.dry_run:
+            self.log(f"    {statement};")
+            return
+        execute_in_transaction(self.cursor, statement, params)
+
+    def _exists(self, query, params):
+        execute_in_transaction(self.cursor, query, params)
+        return self.cursor.fetchone() is not None
+
+    def table_exists(self, table):
+        return self._exists(self.backend.table_exists_query, (table,))
+
+    def column_exists(self, table, column):
+        return self._exists(self.backend.column_exists_query, (table, column))
+
+    def index_exists(self, table, index):
+        return self._exists(self.backend.index_exists_query, (table, index))
+
+    def _execute_online(self, statement):
+        # An online DDL that times out waiting for its metadata lock has changed nothing,
+        # so back off and try again rather than wait behind a long transaction
+        for attempt in range(1, ONLINE_DDL_ATTEMPTS + 1):
+            try:
+                self.execute(statement)
+                return
+            except DatabaseError as e:
+                if e.errno != self.backend.lock_timeout_errno or attempt == ONLINE_DDL_ATTEMPTS:
+                    raise
+                self.log(f"    lock wait timed out, retrying ({attempt}/{ONLINE_DDL_ATTEMPTS})")
+                time.sleep(min(2 ** attempt, 30))
+
+    def add_column_if_missing(self, table, column, definition):
+        if not self.column_exists(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def drop_column_if_exists(self, table, column):
+        if self.column_exists(table, column):
+            self.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    def create_index_if_missing(self, name, table, columns, unique=False):
+        if not self.index_exists(table, name):
+            self._execute_online(self.backend.create_index_sql(name, table, columns, unique, self.online))
+
+    def drop_index_if_exists(self, name, table):
+        if self.index_exists(table, name):
+            self._execute_online(self.backend.drop_index_sql(name, table, self.online))
+
+def _applied_versions(cursor):
+    execute_in_transaction(cursor, MIGRATIONS_TABLE)
+    execute_in_transaction(cursor, "SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def _run(direction, migrations, online, dry_run, log):
+    backend = get_backend()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if online:
+                for statement in backend.online_ddl_session(ONLINE_LOCK_WAIT_TIMEOUT):
+                    execute_in_transaction(cursor, statement)
+            for migration in migrations:
+                log(f"{direction} {migration.version}_{migration.name}: {migration.description}")
+                ctx = MigrationContext(cursor, backend, online, dry_run, log)
+                conn.start_transaction()
+                try:
+                    getattr(migration.module, direction)(ctx)
+                    if dry_run:
+                        conn.rollback()
+                        continue
+                    if direction == "up":
+                        execute_in_transaction(
+                            cursor,
+                            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                            (migration.version, migration.name, datetime.now())
+                        )
+                    else:
+                        execute_in_transaction(
+                            cursor, "DELETE FROM schema_migrations WHERE version = %s", (migration.version,)
+                        )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        finally:
+            cursor.close()
+
+def _find(migrations, version):
+    for migration in migrations:
+        if migration.version == version:
+            return migration
+    raise MigrationError(f"No migration with version {version}")
+
+def status():
+    """List of (migration, applied) pairs, oldest first"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            applied = _applied_versions(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+    return [(migration, migration.version in applied) for migration in discover()]
+
+def migrate(target=None, online=False, dry_run=False, log=lambda message: None):
+    """
+    Apply pending migrations in version order.
+
+    Args:
+        target (str, optional): Last version to apply; all pending migrations when omitted.
+        online (bool): Build and drop indexes without blocking writes where the engine
+            supports it (MySQL ALGORITHM=INPLACE, LOCK=NONE), retrying metadata lock timeouts.
+        dry_run (bool): Log the statements instead of running them.
+        log (callable): Receives one progress line per migration and statement.
+
+    Returns:
+        list: The migrations that were applied.
+    """
+    migrations = discover()
+    if target is not None:
+        _find(migrations, target)
+    pending = [
+        migration for migration, applied in status()
+        if not applied and (target is None or migration.version <= target)
+    ]
+    _run("up", pending, online, dry_run, log)
+    return pending
+
+def rollback(target=None, steps=1, online=False, dry_run=False, log=lambda message: None):
+    """
+    Revert applied migrations, newest first.
+
+    Args:
+        target (str, optional): Revert every migration newer than this version ("0000" for all).
+            When omitted, the newest `steps` applied migrations are reverted.
+        steps (int): Number of migrations to revert when no target is given.
+
+    Returns:
+        list: The migrations that were reverted.
+    """
+    applied = [migration for migration, is_applied in status() if is_applied]
+    applied.reverse()
+    if target is not None:
+        if target != "0000":
+            _find(discover(), target)
+        reverting = [migration for migration in applied if migration.version > target]
+    else:
+        reverting = applied[:steps]
+    _run("down", reverting, online, dry_run, log)
+    return reverting
+
+def fake(version):
+    """Record every migration up to version as applied without running it.
+
+    For databases created before migrations existed: `fake 0001` marks the
+    baseline as present so that `up` only runs the later migrations.
+    """
+    migrations = [migration for migration in discover() if migration.version <= version]
+    _find(migrations, version)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            applied = _applied_versions(cursor)
+            for migration in migrations:
+                if migration.version not in applied:
+                    execute_in_transaction(
+                        cursor,
+                        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                        (migration.version, migration.name, datetime.now())
+                    )
+            conn.commit()
+        finally:
+            cursor.close()
+    return migrations
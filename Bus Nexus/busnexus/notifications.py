@@ -0,0 +1,205 @@
+"""Outgoing email notifications: a queue table and a batched SMTP sender.
+
+enqueue() adds rendered messages to the notification table (migration
+0009_notification_queue) in multi-row INSERT IGNORE batches (backend.insert_ignore); the unique
+(booking_id, kind) index drops any message that was already queued, so
+producers can enqueue the same reminder more than once without it being sent
+twice. send_pending() takes pending messages in id order and sends a batch
+over one SMTP connection, then marks the whole batch in one UPDATE. Each call
+makes one pass over the queue, so a message the server refused stays pending
+until the next call (the next reminders tick) rather than being retried
+straight away.
+
+Delivery is at least once: a sender that dies after the SMTP server accepted
+a batch but before marking it sends that batch again. Run one sender per
+database (busnexus.reminders runs it).
+
+SMTP settings come from the environment, as for the booking confirmation:
+
+    BUSNEXUS_SMTP_HOST / BUSNEXUS_SMTP_PORT   default smtp.gmail.com:587
+    BUSNEXUS_SMTP_STARTTLS                    0 for a plain connection (a local stand-in)
+    EMAIL_USER / EMAIL_PASSWORD               login and sender; no login when unset
+    BUSNEXUS_EMAIL_FROM                       sender when it differs from EMAIL_USER
+"""
+import logging
+import os
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from busnexus.connection import (
+    get_backend, query_with_params, execute_query, acquire_connection, release_connection, execute_in_transaction
+)
+from busnexus.metrics import counter, gauge
+
+logger = logging.getLogger("busnexus.notifications")
+
+SMTP_HOST = os.getenv("BUSNEXUS_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("BUSNEXUS_SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("BUSNEXUS_SMTP_STARTTLS", "1") != "0"
+SMTP_USER = os.getenv("EMAIL_USER")
+SMTP_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("BUSNEXUS_EMAIL_FROM") or SMTP_USER or "noreply@busnexus.com"
+SMTP_TIMEOUT = 30
+
+# Rows per INSERT when enqueueing, messages per SMTP connection when sending
+ENQUEUE_BATCH_SIZE = 500
+SEND_BATCH_SIZE = 200
+# A message the SMTP server refuses this many times is given up on
+MAX_ATTEMPTS = 5
+# Notifications are purged this long after they were due
+NOTIFICATION_RETENTION = timedelta(days=30)
+
+NOTIFICATIONS_ENQUEUED = counter(
+    "busnexus_notifications_enqueued_total", "Notifications added to the queue by kind (duplicates excluded)", ["kind"]
+)
+NOTIFICATIONS_SENT = counter(
+    "busnexus_notifications_sent_total", "Notification delivery attempts by result (sent, retried, failed)", ["result"]
+)
+NOTIFICATION_BACKLOG = gauge("busnexus_notification_backlog", "Pending notifications left after the last send")
+
+class Notification:
+    """One message to queue: kind is unique per booking, e.g. "reminder_24h" """
+
+    def __init__(self, booking_id, kind, recipient, subject, body, due_at):
+        self.booking_id = booking_id
+        self.kind = kind
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.due_at = due_at
+
+# Queue
+def _insert_batch(batch, created_at):
+    """INSERT IGNORE one batch in its own transaction; the rows actually added"""
+    columns = "(booking_id, kind, recipient, subject, body, due_at, status, attempts, created_at)"
+    params = []
+    for item in batch:
+        params.extend([item.booking_id, item.kind, item.recipient, item.subject, item.body, item.due_at,
+                       'pending', 0, created_at])
+    query = (f"{get_backend().insert_ignore} notification {columns} VALUES "
+             + ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch)))
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        execute_in_transaction(cursor, query, tuple(params))
+        # Rows skipped as duplicates are not counted
+        added = cursor.rowcount
+        conn.commit()
+        return added
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+def enqueue(notifications, batch_size=ENQUEUE_BATCH_SIZE):
+    """Queue notifications, skipping any already queued for the same booking and kind; how many were new"""
+    by_kind = {}
+    for item in notifications:
+        by_kind.setdefault(item.kind, []).append(item)
+    added = 0
+    now = datetime.now()
+    for kind, items in by_kind.items():
+        for start in range(0, len(items), batch_size):
+            batch_added = _insert_batch(items[start:start + batch_size], now)
+            NOTIFICATIONS_ENQUEUED.labels(kind=kind).inc(batch_added)
+            added += batch_added
+    return added
+
+def pending(limit=SEND_BATCH_SIZE, after=0):
+    """Pending messages with notification_id above after, in id order"""
+    query = """
+    SELECT notification_id, recipient, subject, body, attempts
+    FROM notification
+    WHERE status = 'pending' AND notification_id > %s
+    ORDER BY notification_id
+    LIMIT %s
+    """
+    return query_with_params(query, (after, limit))
+
+def _mark(notification_ids, status):
+    if not notification_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(notification_ids))
+    query = f"""
+    UPDATE notification
+    SET status = %s, attempts = attempts + 1, sent_at = %s
+    WHERE notification_id IN ({placeholders})
+    """
+    execute_query(query, (status, datetime.now() if status == 'sent' else None, *notification_ids))
+
+def purge(older_than=NOTIFICATION_RETENTION):
+    """Delete notifications that were due longer ago than older_than"""
+    success, _ = execute_query("DELETE FROM notification WHERE due_at < %s", (datetime.now() - older_than,))
+    return success
+
+# Sending
+def connect_smtp():
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        server.starttls()
+    if SMTP_USER and SMTP_PASSWORD:
+        server.login(SMTP_USER, SMTP_PASSWORD)
+    return server
+
+def send_pending(batch_size=SEND_BATCH_SIZE, max_batches=None, connect=connect_smtp):
+    """
+    Send pending notifications, one SMTP connection per batch, in one pass over the queue.
+
+    Batches continue after the last id of the previous one, so refused messages put back
+    to pending are not taken again before the next call.
+
+    Args:
+        batch_size (int): Messages taken from the queue and sent per connection.
+        max_batches (int, optional): Stop after this many batches.
+        connect (callable): Returns a connected smtplib.SMTP; replaceable for tests.
+
+    Returns:
+        int: Messages the SMTP server accepted.
+    """
+    sent_total = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        batch = pending(batch_size, last_id)
+        if not batch:
+            break
+        batches += 1
+        last_id = batch[-1]['notification_id']
+        sent, refused, retry = [], [], []
+        server = connect()
+        try:
+            for row in batch:
+                message = EmailMessage()
+                message['From'] = EMAIL_FROM
+                message['To'] = row['recipient']
+                message['Subject'] = row['subject']
+                message.set_content(row['body'])
+                try:
+                    server.send_message(message)
+                    sent.append(row['notification_id'])
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                    # This message was refused; the connection is still good for the rest
+                    logger.warning("Notification %s to %s refused: %s", row['notification_id'], row['recipient'], e)
+                    if row['attempts'] + 1 >= MAX_ATTEMPTS:
+                        refused.append(row['notification_id'])
+                    else:
+                        retry.append(row['notification_id'])
+        finally:
+            # Whatever was accepted before a dropped connection is still marked sent
+            _mark(sent, 'sent')
+            _mark(refused, 'failed')
+            _mark(retry, 'pending')
+            NOTIFICATIONS_SENT.labels(result="sent").inc(len(sent))
+            NOTIFICATIONS_SENT.labels(result="retried").inc(len(retry))
+            NOTIFICATIONS_SENT.labels(result="failed").inc(len(refused))
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                pass
+        sent_total += len(sent)
+    remaining = query_with_params("SELECT COUNT(*) as backlog FROM notification WHERE status = 'pending'")
+    NOTIFICATION_BACKLOG.set(remaining[0]['backlog'] if remaining else 0)
+    return sent_total
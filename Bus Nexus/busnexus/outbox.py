@@ -0,0 +1,213 @@
+"""Change-event outbox: which route, bus, trip, booking and driver rows changed.
+
+Every mutating function in busnexus.database appends one event per changed
+row, (table, key), to the change_event table in the same transaction as the
+change, so an event exists exactly when its change committed. event_id
+increases with every event and serves as the row's version: a cache that
+remembers the event_id it last saw for a key knows whether it is behind.
+
+Each process runs one OutboxTailer thread (start_tailer()). It reads new
+events by event_id from that one table, an indexed range read, and hands them
+to the callbacks registered with subscribe(). The tailer's reads run on a
+pooled connection outside busnexus.instrumentation, like the replica
+heartbeat, so a poll every OUTBOX_POLL_INTERVAL in every process does not
+fill the query statistics. Events older than OUTBOX_RETENTION are purged by
+the tailers.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from busnexus.connection import get_backend, pooled_connection, execute_query, execute_in_transaction
+from busnexus.metrics import counter, gauge
+
+logger = logging.getLogger("busnexus.outbox")
+
+# Seconds between reads of new events
+OUTBOX_POLL_INTERVAL = float(os.getenv("BUSNEXUS_OUTBOX_POLL_SECONDS", "0.5"))
+# Events read per query; a tailer that is behind reads again straight away
+OUTBOX_BATCH_SIZE = 1000
+# A missing event_id may belong to a transaction that has not committed yet;
+# it is looked for again until it is this many seconds old
+OUTBOX_GAP_TIMEOUT = 10.0
+# Events are kept this long, then purged
+OUTBOX_RETENTION = timedelta(hours=1)
+OUTBOX_PURGE_INTERVAL = 300.0
+
+OUTBOX_EVENTS = counter("busnexus_outbox_events_total", "Change events delivered to subscribers by table", ["table"])
+OUTBOX_ERRORS = counter("busnexus_outbox_errors_total", "Failed outbox reads and subscriber calls", ["stage"])
+OUTBOX_LAG_SECONDS = gauge("busnexus_outbox_lag_seconds", "Age of the newest change event delivered")
+
+class ChangeEvent:
+    """One committed change: row `key` of `table`, at version `event_id`"""
+
+    def __init__(self, event_id, table, key, created_at):
+        self.event_id = event_id
+        self.table = table
+        self.key = key
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f"ChangeEvent({self.event_id}, {self.table}, {self.key})"
+
+# Writing events
+def record_changes(cursor, changes):
+    """Append (table, key) events inside the caller's transaction, before it commits"""
+    if not changes:
+        return
+    now = datetime.now()
+    params = []
+    for table, key in changes:
+        params.extend([table, key, now])
+    query = ("INSERT INTO change_event (table_name, row_key, created_at) VALUES "
+             + ", ".join(["(%s, %s, %s)"] * len(changes)))
+    execute_in_transaction(cursor, query, tuple(params))
+
+# Reading events
+def _read_unobserved(query, params=None):
+    """Rows of a query as dicts, run on a pooled connection without query instrumentation"""
+    backend = get_backend()
+    with pooled_connection(backend) as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            # Ends the read so the next poll sees transactions committed since
+            conn.commit()
+            return rows
+        except backend.Error as e:
+            conn.rollback()
+            raise backend.database_error(e, query) from e
+        finally:
+            cursor.close()
+
+def latest_event_id():
+    result = _read_unobserved("SELECT MAX(event_id) AS event_id FROM change_event")
+    return (result[0]['event_id'] or 0) if result else 0
+
+def read_events(after, limit=OUTBOX_BATCH_SIZE, missing=()):
+    """Events with event_id above `after`, plus any of the `missing` ids that have appeared, by event_id"""
+    query = """
+    SELECT event_id, table_name, row_key, created_at
+    FROM change_event
+    WHERE event_id > %s
+    """
+    params = [after]
+    if missing:
+        query += f" OR event_id IN ({', '.join(['%s'] * len(missing))})"
+        params.extend(missing)
+    query += " ORDER BY event_id LIMIT %s"
+    params.append(limit + len(missing))
+    rows = _read_unobserved(query, tuple(params))
+    return [ChangeEvent(row['event_id'], row['table_name'], row['row_key'], row['created_at']) for row in rows]
+
+def purge(older_than=OUTBOX_RETENTION):
+    """Delete events older than older_than; returns True on success"""
+    success, _ = execute_query("DELETE FROM change_event WHERE created_at < %s", (datetime.now() - older_than,))
+    return success
+
+# Subscribers
+_subscribers = []
+
+def subscribe(callback, tables=None):
+    """Call callback(events) with each batch of new events, limited to the given tables if set"""
+    _subscribers.append((callback, set(tables) if tables else None))
+
+def unsubscribe(callback):
+    _subscribers[:] = [entry for entry in _subscribers if entry[0] is not callback]
+
+def publish(events):
+    """Hand events to every subscriber; a failing subscriber does not stop the others"""
+    for callback, tables in list(_subscribers):
+        selected = [event for event in events if tables is None or event.table in tables]
+        if not selected:
+            continue
+        try:
+            callback(selected)
+        except Exception:
+            OUTBOX_ERRORS.labels(stage="subscriber").inc()
+            logger.exception("Outbox subscriber %r failed", callback)
+
+class OutboxTailer:
+    """
+    Reads new change events by event_id and publishes them to the subscribers.
+
+    Auto-increment ids are handed out when a row is inserted but become visible
+    only when its transaction commits, so a later id can be read first. Ids
+    skipped that way are remembered and looked for again for OUTBOX_GAP_TIMEOUT
+    seconds; an id that never shows up belonged to a rolled back transaction.
+    """
+
+    def __init__(self, start_after=None):
+        self.last_id = start_after
+        self.missing = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = time.monotonic()
+
+    def poll(self):
+        """Read and publish one batch; returns the number of events published"""
+        if self.last_id is None:
+            # A new process has no cached data to invalidate, so history is skipped
+            self.last_id = latest_event_id()
+            return 0
+        events = read_events(self.last_id, OUTBOX_BATCH_SIZE, sorted(self.missing))
+        now = time.monotonic()
+        fresh = []
+        for event in events:
+            if event.event_id in self.missing:
+                del self.missing[event.event_id]
+            elif event.event_id > self.last_id:
+                # A jump wider than a batch is more likely an id range lost to rollbacks
+                # than that many transactions still open, so only the nearest ids are tracked
+                for skipped in range(max(self.last_id + 1, event.event_id - OUTBOX_BATCH_SIZE), event.event_id):
+                    self.missing[skipped] = now
+                self.last_id = event.event_id
+            else:
+                continue
+            fresh.append(event)
+        self.missing = {event_id: seen for event_id, seen in self.missing.items()
+                        if now - seen < OUTBOX_GAP_TIMEOUT}
+        if fresh:
+            publish(fresh)
+            for event in fresh:
+                OUTBOX_EVENTS.labels(table=event.table).inc()
+            OUTBOX_LAG_SECONDS.set(max((datetime.now() - fresh[-1].created_at).total_seconds(), 0))
+        return len(fresh)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                published = self.poll()
+                if time.monotonic() - self._last_purge >= OUTBOX_PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    purge()
+            except Exception as e:
+                OUTBOX_ERRORS.labels(stage="read").inc()
+                logger.warning("Reading the change outbox failed: %s", e)
+                published = 0
+            if published < OUTBOX_BATCH_SIZE:
+                self._stop.wait(OUTBOX_POLL_INTERVAL)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="busnexus-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+_tailer = None
+_tailer_lock = threading.Lock()
+
+def start_tailer():
+    """Tail the outbox from a daemon thread; safe to call on every rerun, only the first call starts it"""
+    global _tailer
+    with _tailer_lock:
+        if _tailer is None:
+            _tailer = OutboxTailer()
+            _tailer.start()
+        return _tailer
@@ -0,0 +1,203 @@
+"""Dynamic fares: route base fare adjusted by load, days to departure, bus type and weekday.
+
+The fare per seat of a trip is its route's base_fare times one multiplier per
+rule, kept between PRICE_FLOOR and PRICE_CAP times the base fare and rounded
+half up to cents:
+
+    load factor          share of the bus already sold       LOAD_FACTOR_STEPS
+    days to departure    seconds left, in days               DAYS_OUT_STEPS
+    bus type             bus.bus_type                        BUS_TYPE_MULTIPLIERS
+    day of week          weekday of departure                DAY_OF_WEEK_MULTIPLIERS
+
+A promo code (a row of promo_code, migration 0010_fare_quotes) then takes
+its percent_off off the fare per seat.
+
+price_per_seat() picks the step of every rule for a whole search result in
+one pass over numpy arrays, then multiplies in Decimal so the rounding is
+exact. Search results keep a per-process price table of trip -> fare that an
+entry leaves as soon as the trip's seats_available differs from the one it was
+priced at, on another day, when a change event for the trip arrives
+(busnexus.outbox) or after PRICE_TABLE_SECONDS, so days-to-departure steps are
+picked up as well.
+
+A displayed fare is not a promise. Booking charges a fare quote: quote_fare()
+in busnexus.database prices the trip from its current row, stores the result
+in fare_quote and the booking that uses the quote before it expires is charged
+exactly its total_fare. Expired quotes are deleted by busnexus.archive.
+BUSNEXUS_DYNAMIC_PRICING=0 charges the plain base fare.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from busnexus.connection import query_with_params, execute_query
+from busnexus.metrics import counter
+from busnexus import outbox
+
+logger = logging.getLogger("busnexus.pricing")
+
+DYNAMIC_PRICING = os.getenv("BUSNEXUS_DYNAMIC_PRICING", "1") != "0"
+# Minutes a fare quote can be booked at
+QUOTE_TTL = timedelta(minutes=int(os.getenv("BUSNEXUS_QUOTE_MINUTES", "15")))
+# Seconds a price table entry is used while its trip's seats do not change
+PRICE_TABLE_SECONDS = 60.0
+# Entries held by the price table; it starts over when full
+PRICE_TABLE_SIZE = 100000
+
+# Rules. Steps are (lower bound, multiplier), ascending; a value takes the last step it reaches
+LOAD_FACTOR_STEPS = [(0.0, 1.00), (0.5, 1.10), (0.75, 1.25), (0.9, 1.50)]
+DAYS_OUT_STEPS = [(0, 1.30), (2, 1.15), (7, 1.00), (21, 0.90)]
+BUS_TYPE_MULTIPLIERS = {'AC': 1.10, 'Non-AC': 0.90, 'Sleeper': 1.25, 'Deluxe': 1.35}
+# Monday .. Sunday
+DAY_OF_WEEK_MULTIPLIERS = [1.00, 0.95, 0.95, 1.00, 1.15, 1.05, 1.15]
+PRICE_FLOOR = 0.7
+PRICE_CAP = 2.5
+
+CENT = Decimal("0.01")
+
+PRICE_TABLE_LOOKUPS = counter("busnexus_price_table_lookups_total", "Search fares by price table result (hit, miss)", ["result"])
+
+# Pricing
+def _step_index(steps, values):
+    import numpy as np
+    bounds = np.array([bound for bound, _ in steps], dtype=float)
+    # Values below the first bound take the first step
+    return np.maximum(np.searchsorted(bounds, values, side="right") - 1, 0)
+
+def _decimal(value):
+    # Through str, so 1.1 is 1.1 and not the binary float nearest to it
+    return Decimal(str(value))
+
+def price_per_seat(trips, now=None):
+    """
+    Price several trips in one vectorized pass.
+
+    Args:
+        trips (list): Rows with base_fare, capacity, seats_available, departure_datetime and bus_type.
+        now (datetime, optional): Time of pricing; the current time when omitted.
+
+    Returns:
+        list: Fare per seat of each trip, as a Decimal rounded to cents, in the order given.
+    """
+    if not trips:
+        return []
+    if not DYNAMIC_PRICING:
+        return [Decimal(str(trip['base_fare'])).quantize(CENT, ROUND_HALF_UP) for trip in trips]
+
+    import numpy as np
+    now = now or datetime.now()
+    capacity = np.array([trip['capacity'] for trip in trips], dtype=float)
+    seats = np.array([trip['seats_available'] for trip in trips], dtype=float)
+    departure = np.array([trip['departure_datetime'] for trip in trips], dtype="datetime64[s]")
+
+    load = 1.0 - seats / np.maximum(capacity, 1.0)
+    # From the total seconds left, not whole days, so a step is reached at the exact time it is due
+    days_out = np.maximum((departure - np.datetime64(now, "s")) / np.timedelta64(1, "D"), 0.0)
+    # 1970-01-01 was a Thursday, weekday 3
+    weekday = (departure.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+    load_multipliers = [_decimal(multiplier) for _, multiplier in LOAD_FACTOR_STEPS]
+    days_out_multipliers = [_decimal(multiplier) for _, multiplier in DAYS_OUT_STEPS]
+    bus_type_multipliers = {bus_type: _decimal(multiplier) for bus_type, multiplier in BUS_TYPE_MULTIPLIERS.items()}
+    weekday_multipliers = [_decimal(multiplier) for multiplier in DAY_OF_WEEK_MULTIPLIERS]
+    floor, cap = _decimal(PRICE_FLOOR), _decimal(PRICE_CAP)
+
+    fares = []
+    rules = zip(trips, _step_index(LOAD_FACTOR_STEPS, load).tolist(),
+                _step_index(DAYS_OUT_STEPS, days_out).tolist(), weekday.tolist())
+    for trip, load_step, days_out_step, day in rules:
+        base = _decimal(trip['base_fare'])
+        fare = (base
+                * load_multipliers[load_step]
+                * days_out_multipliers[days_out_step]
+                * bus_type_multipliers.get(trip['bus_type'], Decimal(1))
+                * weekday_multipliers[day])
+        fare = min(max(fare, base * floor), base * cap)
+        fares.append(fare.quantize(CENT, ROUND_HALF_UP))
+    return fares
+
+def apply_promo(fare, promo):
+    """Fare per seat after a promo_code row's discount; the fare itself without one"""
+    if not promo:
+        return fare
+    return (fare * (100 - Decimal(str(promo['percent_off']))) / 100).quantize(CENT, ROUND_HALF_UP)
+
+def get_promo(code, now=None):
+    """The promo_code row for code while it is valid, or None"""
+    query = """
+    SELECT code, percent_off
+    FROM promo_code
+    WHERE code = %s AND valid_from <= %s AND valid_until > %s
+    """
+    now = now or datetime.now()
+    result = query_with_params(query, (code.strip().upper(), now, now))
+    return result[0] if result else None
+
+def purge_expired_quotes(now=None):
+    """Delete quotes that expired without being booked"""
+    success, _ = execute_query("DELETE FROM fare_quote WHERE expires_at < %s AND booking_id IS NULL",
+                               (now or datetime.now(),))
+    return success
+
+# Price table for search results
+class PriceTable:
+    """trip_id -> (seats_available priced at, day priced on, time priced, fare per seat)"""
+
+    def __init__(self, max_age=PRICE_TABLE_SECONDS, max_entries=PRICE_TABLE_SIZE):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, trips, day):
+        """Fare per seat for each trip as priced on day, None where the table has no current price"""
+        now = time.monotonic()
+        with self._lock:
+            fares = []
+            for trip in trips:
+                entry = self._entries.get(trip['trip_id'])
+                if (entry is None or entry[0] != trip['seats_available'] or entry[1] != day
+                        or now - entry[2] >= self.max_age):
+                    fares.append(None)
+                else:
+                    fares.append(entry[3])
+            return fares
+
+    def store(self, trips, fares, day):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) + len(trips) > self.max_entries:
+                self._entries.clear()
+            for trip, fare in zip(trips, fares):
+                self._entries[trip['trip_id']] = (trip['seats_available'], day, now, fare)
+
+    def drop(self, trip_ids):
+        with self._lock:
+            for trip_id in trip_ids:
+                self._entries.pop(trip_id, None)
+
+_price_table = PriceTable()
+
+def _drop_changed_trips(events):
+    _price_table.drop({event.key for event in events})
+
+outbox.subscribe(_drop_changed_trips, tables=["trip"])
+
+def apply_prices(rows, now=None):
+    """Set 'fare', the current fare per seat, on each search result row; prices missing from the table in one pass"""
+    now = now or datetime.now()
+    fares = _price_table.lookup(rows, now.date())
+    missing = [index for index, fare in enumerate(fares) if fare is None]
+    PRICE_TABLE_LOOKUPS.labels(result="hit").inc(len(rows) - len(missing))
+    PRICE_TABLE_LOOKUPS.labels(result="miss").inc(len(missing))
+    if missing:
+        priced = price_per_seat([rows[index] for index in missing], now)
+        _price_table.store([rows[index] for index in missing], priced, now.date())
+        for index, fare in zip(missing, priced):
+            fares[index] = fare
+    for row, fare in zip(rows, fares):
+        row['fare'] = fare
+    return rows
@@ -0,0 +1,182 @@
+"""Seat-count reconciliation: trip.seats_available against the tickets actually sold.
+
+seats_available is a counter kept by the booking and cancellation
+transactions. It should always equal the bus capacity minus the tickets of
+the trip's booked and completed bookings. find_drift() recomputes that for
+every trip with one grouped query per range of RECONCILE_CHUNK_SIZE trip ids:
+the range is read from the trip primary key and the bookings of those trips
+from idx_booking_trip, so a run over millions of trips is a series of short
+range reads that never hold locks.
+
+repair() writes the expected count back. Each write is conditional on the
+counter still holding the value the check read; bookings and cancellations
+change the counter together with the tickets, so a trip that changed in
+between is skipped and looked at again on the next run. An oversold trip gets a
+negative count, which keeps it closed to sales until enough bookings are
+cancelled. Archived trips are not checked; they no longer change.
+
+Run it hourly from cron in the "Bus Nexus" directory:
+
+    python -m busnexus.reconcile                 # report drift, exit status 1 if any
+    python -m busnexus.reconcile --repair        # and fix it
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import (
+    configure, query_with_params, acquire_connection, release_connection, execute_in_transaction
+)
+from busnexus.errors import BusNexusError
+from busnexus.metrics import counter, gauge
+from busnexus import outbox
+
+logger = logging.getLogger("busnexus.reconcile")
+
+# Trip ids per grouped query
+RECONCILE_CHUNK_SIZE = int(os.getenv("BUSNEXUS_RECONCILE_CHUNK_SIZE", "10000"))
+# Drifted trips printed by the CLI; the counts cover all of them
+MAX_REPORTED_DRIFT = 20
+
+SEAT_DRIFT_TRIPS = gauge("busnexus_seat_drift_trips", "Trips whose seats_available disagreed with their tickets at the last check")
+SEAT_DRIFT_REPAIRED = counter("busnexus_seat_drift_repaired_total", "Trips whose seats_available was corrected")
+
+class SeatDrift:
+    """A trip whose counter disagrees with its live tickets"""
+
+    def __init__(self, trip_id, seats_available, capacity, live_tickets):
+        self.trip_id = trip_id
+        self.seats_available = seats_available
+        self.capacity = capacity
+        self.live_tickets = live_tickets
+
+    @property
+    def expected(self):
+        return self.capacity - self.live_tickets
+
+    @property
+    def oversold(self):
+        return self.live_tickets > self.capacity
+
+    def as_dict(self):
+        return {'trip_id': self.trip_id, 'seats_available': self.seats_available, 'capacity': self.capacity,
+                'live_tickets': self.live_tickets, 'expected': self.expected, 'oversold': self.oversold}
+
+def _drift_in_range(first_id, last_id):
+    query = """
+    SELECT
+        t.trip_id, t.seats_available, b.capacity, COALESCE(live.tickets, 0) as live_tickets
+    FROM
+        trip t
+    JOIN
+        bus b ON t.bus_id = b.bus_id
+    LEFT JOIN (
+        SELECT bk.trip_id, COUNT(*) as tickets
+        FROM booking bk
+        JOIN ticket tk ON tk.booking_id = bk.booking_id
+        WHERE bk.trip_id BETWEEN %s AND %s AND bk.booking_status IN ('booked', 'completed')
+        GROUP BY bk.trip_id
+    ) live ON live.trip_id = t.trip_id
+    WHERE
+        t.trip_id BETWEEN %s AND %s
+        AND t.seats_available <> b.capacity - COALESCE(live.tickets, 0)
+    """
+    rows = query_with_params(query, (first_id, last_id, first_id, last_id))
+    return [SeatDrift(row['trip_id'], row['seats_available'], row['capacity'], row['live_tickets']) for row in rows]
+
+def find_drift(chunk_size=RECONCILE_CHUNK_SIZE, first_id=None, last_id=None):
+    """
+    Every trip whose seats_available differs from its bus capacity minus its live tickets.
+
+    Args:
+        chunk_size (int): Trip ids covered by each grouped query.
+        first_id (int, optional): Lowest trip id to check; the lowest in the table when omitted.
+        last_id (int, optional): Highest trip id to check; the highest in the table when omitted.
+
+    Returns:
+        list: SeatDrift objects ordered by trip id.
+    """
+    bounds = query_with_params("SELECT MIN(trip_id) as first_id, MAX(trip_id) as last_id FROM trip")[0]
+    first_id = first_id if first_id is not None else bounds['first_id']
+    last_id = last_id if last_id is not None else bounds['last_id']
+    drift = []
+    if first_id is None:
+        return drift
+    for start in range(first_id, last_id + 1, chunk_size):
+        drift.extend(_drift_in_range(start, min(start + chunk_size - 1, last_id)))
+    SEAT_DRIFT_TRIPS.set(len(drift))
+    return drift
+
+def repair(drift):
+    """Set each drifted trip's seats_available to the expected count; the trips that were corrected"""
+    query = """
+    UPDATE trip
+    SET seats_available = %s
+    WHERE trip_id = %s AND seats_available = %s
+    """
+    repaired = []
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        for item in drift:
+            # One short transaction per trip, so booking traffic never waits on the whole run
+            execute_in_transaction(cursor, query, (item.expected, item.trip_id, item.seats_available))
+            if cursor.rowcount == 1:
+                outbox.record_changes(cursor, [("trip", item.trip_id)])
+                repaired.append(item)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_connection(conn)
+    SEAT_DRIFT_REPAIRED.inc(len(repaired))
+    for item in repaired:
+        logger.warning("Trip %s: seats_available %s corrected to %s", item.trip_id, item.seats_available, item.expected)
+    return repaired
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--repair", action="store_true", help="Correct the drifted counters")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE, help="Trip ids per grouped query")
+    parser.add_argument("--first-id", type=int, help="Lowest trip id to check")
+    parser.add_argument("--last-id", type=int, help="Highest trip id to check")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    try:
+        start = time.perf_counter()
+        drift = find_drift(args.chunk_size, args.first_id, args.last_id)
+        elapsed = time.perf_counter() - start
+        repaired = repair(drift) if args.repair else []
+    except BusNexusError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    oversold = sum(item.oversold for item in drift)
+    if args.json:
+        print(json.dumps({'drifted': len(drift), 'oversold': oversold, 'repaired': len(repaired),
+                          'seconds': round(elapsed, 3),
+                          'trips': [item.as_dict() for item in drift[:MAX_REPORTED_DRIFT]]}, indent=2))
+    else:
+        for item in drift[:MAX_REPORTED_DRIFT]:
+            print(f"trip {item.trip_id}: seats_available {item.seats_available}, expected {item.expected} "
+                  f"(capacity {item.capacity}, {item.live_tickets} live tickets)"
+                  f"{', OVERSOLD' if item.oversold else ''}")
+        if len(drift) > MAX_REPORTED_DRIFT:
+            print(f"... and {len(drift) - MAX_REPORTED_DRIFT} more")
+        print(f"{len(drift)} drifted trip(s), {oversold} oversold, checked in {elapsed:.1f}s"
+              + (f"; {len(repaired)} repaired" if args.repair else ""))
+    # Drift left behind fails the run, so cron can alert on it
+    return 1 if len(drift) > len(repaired) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
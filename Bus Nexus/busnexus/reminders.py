@@ -0,0 +1,177 @@
+"""Departure reminders, queued at fixed offsets before each trip departs.
+
+Every tick, for each offset in REMINDER_OFFSETS (24 hours and 2 hours by
+default), the scheduler reads the booked bookings whose trip departs in the
+slice of time that came within that offset since the previous tick: one range
+query on idx_trip_departure joined to booking, users, route and bus. The
+reminders are rendered here and queued with busnexus.notifications.enqueue(),
+whose unique (booking_id, kind) index makes queueing the same reminder twice
+a no-op. After a restart the first tick looks back REMINDER_CATCHUP, so
+reminders that came due while nothing ran still go out, and none go out twice.
+
+Trips leave the window as they board; a booking cancelled before its tick
+gets no reminder. Run one worker per database, from the "Bus Nexus" directory:
+
+    python -m busnexus.reminders --every 60     # queue due reminders, then send the queue
+
+BUSNEXUS_REMINDER_OFFSETS takes a comma-separated list of durations such as
+"24h,2h" or "90m".
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure, query_with_params
+from busnexus.errors import BusNexusError, ConfigurationError
+from busnexus.metrics import counter, histogram
+from busnexus import notifications
+from busnexus.notifications import Notification
+
+logger = logging.getLogger("busnexus.reminders")
+
+DURATION_UNITS = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+
+def parse_offsets(value):
+    """(label, timedelta) for each duration in a list like "24h,2h", longest first"""
+    offsets = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if item[-1] not in DURATION_UNITS or not item[:-1].isdigit():
+            raise ConfigurationError(f"Bad reminder offset {item!r}; use a number followed by d, h or m")
+        offsets.append((item, timedelta(**{DURATION_UNITS[item[-1]]: int(item[:-1])})))
+    return sorted(offsets, key=lambda offset: offset[1], reverse=True)
+
+REMINDER_OFFSETS = parse_offsets(os.getenv("BUSNEXUS_REMINDER_OFFSETS", "24h,2h"))
+# How far back the first tick after a start looks for reminders that came due meanwhile
+REMINDER_CATCHUP = timedelta(minutes=int(os.getenv("BUSNEXUS_REMINDER_CATCHUP_MINUTES", "60")))
+
+REMINDERS_DUE = counter("busnexus_reminders_due_total", "Bookings found due for a reminder by offset", ["offset"])
+REMINDER_TICK_SECONDS = histogram(
+    "busnexus_reminder_tick_duration_seconds", "Time to find and queue the due reminders of one tick"
+)
+
+def reminder_kind(label):
+    return f"reminder_{label}"
+
+def due_bookings(start, end):
+    """Booked bookings whose trip departs after start and no later than end, with what the reminder shows"""
+    query = """
+    SELECT
+        b.booking_id, u.email, u.first_name, t.departure_datetime, t.arrival_datetime,
+        r.origin, r.destination, bu.bus_no,
+        (SELECT COUNT(*) FROM ticket tk WHERE tk.booking_id = b.booking_id) as seats
+    FROM
+        trip t
+    JOIN
+        booking b ON b.trip_id = t.trip_id
+    JOIN
+        users u ON b.user_id = u.user_id
+    JOIN
+        route r ON t.route_id = r.route_id
+    JOIN
+        bus bu ON t.bus_id = bu.bus_id
+    WHERE
+        t.departure_datetime > %s AND t.departure_datetime <= %s
+        AND t.status = 'scheduled'
+        AND b.booking_status = 'booked'
+    """
+    return query_with_params(query, (start, end))
+
+def render_reminder(row, label, offset):
+    """The Notification reminding one booking that its trip departs in offset"""
+    subject = f"BusNexus - Your trip to {row['destination']} departs in {label}"
+    body = f"""
+    Dear {row['first_name']},
+
+    This is a reminder that your BusNexus trip departs soon:
+
+    Booking ID: {row['booking_id']}
+    - Bus No: {row['bus_no']}
+    - Route: {row['origin']} to {row['destination']}
+    - Departure: {row['departure_datetime']}
+    - Arrival: {row['arrival_datetime']}
+    - Number of Seats: {row['seats']}
+
+    Please arrive at the boarding point before boarding closes. For any queries,
+    contact us at support@busnexus.com.
+
+    Best regards,
+    The BusNexus Team
+    """
+    return Notification(row['booking_id'], reminder_kind(label), row['email'], subject, body,
+                        row['departure_datetime'] - offset)
+
+class ReminderScheduler:
+    """Queues the reminders due since its previous tick, for each offset"""
+
+    def __init__(self, offsets=REMINDER_OFFSETS, catchup=REMINDER_CATCHUP):
+        self.offsets = offsets
+        self.catchup = catchup
+        # Departure time up to which each offset has been queued
+        self._scanned_until = {}
+
+    def tick(self, now=None):
+        """
+        Queue the reminders that came due since the previous tick.
+
+        Args:
+            now (datetime, optional): Current time; the clock when omitted.
+
+        Returns:
+            dict: For each offset label, (bookings due, reminders newly queued).
+        """
+        now = now or datetime.now()
+        counts = {}
+        with REMINDER_TICK_SECONDS.time():
+            for label, offset in self.offsets:
+                end = now + offset
+                start = self._scanned_until.get(label, end - self.catchup)
+                if end <= start:
+                    continue
+                rows = due_bookings(start, end)
+                queued = notifications.enqueue(render_reminder(row, label, offset) for row in rows)
+                # Only advanced once queued, so a failed tick is retried over the same slice
+                self._scanned_until[label] = end
+                REMINDERS_DUE.labels(offset=label).inc(len(rows))
+                counts[label] = (len(rows), queued)
+        return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Overrides BUSNEXUS_DATABASE_URL")
+    parser.add_argument("--no-send", action="store_true", help="Only queue reminders; leave sending to another worker")
+    parser.add_argument("--batch-size", type=int, default=notifications.SEND_BATCH_SIZE,
+                        help="Messages sent per SMTP connection")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="Keep running, ticking again after this long")
+    args = parser.parse_args(argv)
+    if args.database_url:
+        configure(DatabaseConfig.from_dsn(args.database_url))
+
+    scheduler = ReminderScheduler()
+    last_purge = None
+    while True:
+        try:
+            counts = scheduler.tick()
+            queued = ", ".join(f"{label}: {due} due, {added} queued" for label, (due, added) in counts.items())
+            sent = 0 if args.no_send else notifications.send_pending(args.batch_size)
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} reminders {queued or 'none due'}; {sent} sent")
+            if last_purge is None or time.monotonic() - last_purge >= 3600:
+                notifications.purge()
+                last_purge = time.monotonic()
+        except (BusNexusError, OSError) as e:
+            # OSError covers an unreachable SMTP server; the queue keeps what was not sent
+            print(f"error: {e}", file=sys.stderr)
+            if not args.every:
+                return 1
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Baseline tables and indexes of the BusNexus database, in DDL both engines accept.
+
+This is the schema as it stood before versioned migrations; later changes live
+in busnexus/migrations and are applied on top of it by create_schema().
+
+{pk} and {table_options} are filled in by the backend (see Backend.ddl_tokens):
+an AUTO_INCREMENT INT with InnoDB on MySQL, an INTEGER PRIMARY KEY AUTOINCREMENT
+on SQLite. Indexes are separate CREATE INDEX statements because SQLite has no
+inline KEY clause.
+"""
+from busnexus.connection import get_backend
+
+TABLES = [
+    """
+    CREATE TABLE users (
+        user_id {pk},
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        email VARCHAR(100) NOT NULL,
+        phone VARCHAR(20),
+        role VARCHAR(20) NOT NULL DEFAULT 'passenger',
+        password VARCHAR(255) NOT NULL
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE driver (
+        driver_id {pk},
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        contact_no VARCHAR(20),
+        license_no VARCHAR(50),
+        hired_date DATE
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE bus (
+        bus_id {pk},
+        bus_no VARCHAR(20) NOT NULL,
+        bus_type VARCHAR(50) NOT NULL,
+        capacity INT NOT NULL,
+        driver_id INT,
+        FOREIGN KEY (driver_id) REFERENCES driver (driver_id)
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE route (
+        route_id {pk},
+        origin VARCHAR(100) NOT NULL,
+        destination VARCHAR(100) NOT NULL,
+        distance DECIMAL(10,2),
+        base_fare DECIMAL(10,2) NOT NULL,
+        route_desc TEXT,
+        origin_lat DOUBLE,
+        origin_lon DOUBLE,
+        destination_lat DOUBLE,
+        destination_lon DOUBLE
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE trip (
+        trip_id {pk},
+        bus_id INT NOT NULL,
+        route_id INT NOT NULL,
+        departure_datetime DATETIME NOT NULL,
+        arrival_datetime DATETIME NOT NULL,
+        seats_available INT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'scheduled',
+        FOREIGN KEY (bus_id) REFERENCES bus (bus_id),
+        FOREIGN KEY (route_id) REFERENCES route (route_id)
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE booking (
+        booking_id {pk},
+        user_id INT NOT NULL,
+        trip_id INT NOT NULL,
+        total_fare DECIMAL(10,2) NOT NULL,
+        payment_status VARCHAR(20) NOT NULL DEFAULT 'unpaid',
+        booking_status VARCHAR(20) NOT NULL DEFAULT 'booked',
+        booking_datetime DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (user_id),
+        FOREIGN KEY (trip_id) REFERENCES trip (trip_id)
+    ) {table_options}
+    """,
+    """
+    CREATE TABLE ticket (
+        ticket_id {pk},
+        booking_id INT NOT NULL,
+        seat_no VARCHAR(10) NOT NULL,
+        pickup_point VARCHAR(100),
+        drop_point VARCHAR(100),
+        FOREIGN KEY (booking_id) REFERENCES booking (booking_id)
+    ) {table_options}
+    """,
+]
+
+INDEXES = [
+    "CREATE UNIQUE INDEX uq_users_email ON users (email)",
+    "CREATE UNIQUE INDEX uq_bus_bus_no ON bus (bus_no)",
+]
+
+def schema_statements(backend=None):
+    """The baseline CREATE statements for backend (default: the configured one), in dependency order"""
+    backend = backend or get_backend()
+    return [backend.render_ddl(statement).strip() for statement in TABLES + INDEXES]
+
+def create_schema():
+    """Bring an empty database up to the latest schema version"""
+    # Imported here because the baseline migration itself imports this module
+    from busnexus.migrations import migrate
+    migrate()
@@ -0,0 +1,272 @@
+"""Cache of bus search results, shared between processes through Redis.
+
+Entries are keyed by corridor (origin, destination, travel date) and the
+search filters. Every corridor-day has a version token and an entry is only
+served while it was stored under the current token, so a booking,
+cancellation or new trip invalidates every filter variant of its
+corridor-day at once by replacing the token. A search that read the database
+just before the change stores its result under the old token, where it is
+never found again. TTLs bound how long anything the invalidation does not
+cover (a route or bus edited on the coordinator dashboard) stays visible.
+Searches may be answered by a read replica up to REPLICA_MAX_LAG behind, so
+a result loaded that soon after its corridor-day changed is not cached.
+
+BUSNEXUS_SEARCH_CACHE picks the store:
+
+    local                   in-process LRU (default); other processes only see
+                            their own invalidations, so use it with one process
+    redis://host:6379/0     shared by every process (needs the redis package)
+    off                     no caching
+
+Tests can pass any redis-py compatible client, e.g. fakeredis.FakeRedis(),
+to RedisStore and configure_search_cache().
+"""
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from busnexus.connection import get_config, REPLICA_MAX_LAG
+from busnexus.errors import ConfigurationError
+from busnexus.metrics import counter, histogram
+
+logger = logging.getLogger("busnexus.search_cache")
+
+SEARCH_CACHE_URL = os.getenv("BUSNEXUS_SEARCH_CACHE", "local")
+# Seconds a cached result may be served; changes outside the invalidated paths show up after this
+SEARCH_CACHE_TTL = int(os.getenv("BUSNEXUS_SEARCH_CACHE_TTL", "30"))
+# Entries held by the in-process store
+SEARCH_CACHE_SIZE = int(os.getenv("BUSNEXUS_SEARCH_CACHE_SIZE", "10000"))
+# Share of hits that are also run against the database to measure staleness
+SEARCH_CACHE_VERIFY_RATE = float(os.getenv("BUSNEXUS_SEARCH_CACHE_VERIFY_RATE", "0.01"))
+
+KEY_PREFIX = "busnexus:search"
+
+SEARCH_CACHE_LOOKUPS = counter(
+    "busnexus_search_cache_lookups_total", "Search cache lookups by result (hit, miss, error)", ["result"]
+)
+SEARCH_CACHE_INVALIDATIONS = counter(
+    "busnexus_search_cache_invalidations_total", "Corridor-days invalidated by a booking, cancellation or new trip"
+)
+SEARCH_CACHE_AGE_SECONDS = histogram(
+    "busnexus_search_cache_age_seconds", "Age of cached search results when served",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"))
+)
+SEARCH_CACHE_VERIFICATIONS = counter(
+    "busnexus_search_cache_verifications_total",
+    "Sampled cache hits compared with the database, by whether they still matched (fresh or stale)", ["result"]
+)
+
+# Stores
+class LocalStore:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return [self._get(key, now) for key in keys]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; True when it was set"""
+        with self._lock:
+            if self._get(key, time.monotonic()) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+def _json_object(obj):
+    if len(obj) == 1:
+        if '$datetime' in obj:
+            return datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return date.fromisoformat(obj['$date'])
+        if '$decimal' in obj:
+            return Decimal(obj['$decimal'])
+    return obj
+
+class RedisStore:
+    """Store in Redis, shared by every process; values are JSON with dates and decimals tagged"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError:
+            raise ConfigurationError("BUSNEXUS_SEARCH_CACHE is a Redis URL but the redis package is not installed")
+        return cls(redis.Redis.from_url(url))
+
+    def get_many(self, keys):
+        return [None if raw is None else json.loads(raw, object_hook=_json_object)
+                for raw in self.client.mget(keys)]
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value, default=_json_default), ex=ttl)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, json.dumps(value, default=_json_default), ex=ttl, nx=True))
+
+# Store shared by every thread in this process
+_store = None
+_store_configured = False
+_store_lock = threading.Lock()
+
+def create_store(url):
+    """Store for a BUSNEXUS_SEARCH_CACHE value; None for "off" """
+    if not url or url == "off":
+        return None
+    if url == "local":
+        return LocalStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore.from_url(url)
+    raise ConfigurationError(f"Unknown search cache {url!r}; use local, off or a redis:// URL")
+
+def configure_search_cache(store=None):
+    """Use store (a LocalStore, a RedisStore or None for no caching) instead of BUSNEXUS_SEARCH_CACHE"""
+    global _store, _store_configured
+    with _store_lock:
+        _store = store
+        _store_configured = True
+
+def get_store():
+    global _store, _store_configured
+    if not _store_configured:
+        with _store_lock:
+            if not _store_configured:
+                _store = create_store(SEARCH_CACHE_URL)
+                _store_configured = True
+    return _store
+
+# Keys
+def _corridor(origin, destination, travel_date):
+    return f"{origin}|{destination}|{travel_date.isoformat()}"
+
+def _version_key(corridor):
+    return f"{KEY_PREFIX}:version:{corridor}"
+
+def _entry_key(corridor, version, filters):
+    return f"{KEY_PREFIX}:{version}:{corridor}|{json.dumps(filters, default=str)}"
+
+# Tokens are "<time of the change>:<random>"; the time is 0 for a token made on a read
+def _new_version(changed_at=0.0):
+    return f"{changed_at:.3f}:{secrets.token_hex(6)}"
+
+def _current_version(store, corridor):
+    # A missing token (never set, expired or evicted) is replaced by a fresh one,
+    # which orphans whatever was stored under the previous one
+    version_key = _version_key(corridor)
+    version = store.get_many([version_key])[0]
+    if version is None:
+        store.add(version_key, _new_version(), SEARCH_CACHE_TTL * 2)
+        version = store.get_many([version_key])[0]
+    return version
+
+def _settled(version):
+    """False while a replica may not have caught up with the change that made version"""
+    if not get_config().replicas:
+        return True
+    changed_at = float(version.split(":", 1)[0])
+    return time.time() >= changed_at + REPLICA_MAX_LAG
+
+def cached_search(origin, destination, travel_date, filters, load):
+    """
+    Return the results of a search, from the cache when a current entry exists.
+
+    Args:
+        origin (str): Origin city.
+        destination (str): Destination city.
+        travel_date (date): Day of departure.
+        filters (list): The remaining search arguments; each combination is cached separately.
+        load (callable): Runs the search against the database and returns its rows.
+
+    Returns:
+        list: Result rows, copied so callers may change them.
+    """
+    store = get_store()
+    if store is None:
+        return load()
+
+    corridor = _corridor(origin, destination, travel_date)
+    try:
+        version = _current_version(store, corridor)
+        entry_key = _entry_key(corridor, version, filters)
+        entry = store.get_many([entry_key])[0]
+    except Exception as e:
+        # The cache is an optimisation; an unreachable store must not fail the search
+        SEARCH_CACHE_LOOKUPS.labels(result="error").inc()
+        logger.warning("Search cache lookup failed: %s", e)
+        return load()
+
+    if entry is not None:
+        SEARCH_CACHE_LOOKUPS.labels(result="hit").inc()
+        SEARCH_CACHE_AGE_SECONDS.observe(max(time.time() - entry['cached_at'], 0))
+        if random.random() < SEARCH_CACHE_VERIFY_RATE:
+            rows = load()
+            SEARCH_CACHE_VERIFICATIONS.labels(result="fresh" if rows == entry['rows'] else "stale").inc()
+            return rows
+        return [dict(row) for row in entry['rows']]
+
+    SEARCH_CACHE_LOOKUPS.labels(result="miss").inc()
+    rows = load()
+    try:
+        if _settled(version):
+            store.set(entry_key, {'cached_at': time.time(), 'rows': rows}, SEARCH_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Search cache store failed: %s", e)
+    return [dict(row) for row in rows]
+
+def invalidate(origin, destination, departure):
+    """Drop every cached search for the corridor on the day of departure; call after the change commits"""
+    store = get_store()
+    if store is None:
+        return
+    corridor = _corridor(origin, destination, departure.date() if isinstance(departure, datetime) else departure)
+    try:
+        store.set(_version_key(corridor), _new_version(time.time()), SEARCH_CACHE_TTL * 2)
+        SEARCH_CACHE_INVALIDATIONS.inc()
+    except Exception as e:
+        # Entries of this corridor-day can now be served until they expire
+        logger.error("Search cache invalidation failed for %s: %s", corridor, e)
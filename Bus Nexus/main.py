@@ -1,13 +1,28 @@
 import streamlit as st
 from datetime import datetime, timedelta
 from pages.utils.helpers import inject_custom_css, show_navigation, show_footer
+from pages.utils.profiler import profile_page
 from pages.utils.database import get_distinct_origins, get_distinct_destinations, login_user
+from busnexus.metrics import start_metrics_server
+from busnexus.capture import start_capture
+from busnexus.outbox import start_tailer
+from busnexus.lifecycle import start_lifecycle
 
 
     
+@profile_page("Home")
 def main():
     # Set page configuration
     st.set_page_config(page_title="BusNexus - Home", layout="wide")    
+    # Serve Prometheus metrics from a sidecar thread (started once per server process)
+    start_metrics_server()
+    # Record query traffic for benchmarks/replay.py when BUSNEXUS_QUERY_CAPTURE is set
+    start_capture()
+    # Follow other processes' changes so this process's caches are invalidated
+    start_tailer()
+    # Move trips through boarding, departed and completed when BUSNEXUS_LIFECYCLE_SECONDS is set;
+    # otherwise python -m busnexus.lifecycle does
+    start_lifecycle()
     # Inject custom CSS for consistent styling
     inject_custom_css()
     
@@ -5,13 +5,15 @@ import folium
 from streamlit_folium import folium_static
 from geopy.geocoders import Nominatim
 from pages.utils.database import (
-    get_all_buses, add_bus, update_bus, delete_bus,
+    get_all_buses, bus_no_exists, add_bus, update_bus, delete_bus,
     get_all_routes, add_route, update_route, delete_route,
     get_all_trips, add_trip,
     get_total_bookings, get_daily_revenue, get_route_popularity,
     get_all_drivers, add_driver, update_driver, delete_driver
 )
-from pages.utils.helpers import inject_custom_css, show_navigation, show_footer
+from busnexus.instrumentation import get_query_stats, reset_query_stats, SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_FILE
+from pages.utils.helpers import inject_custom_css, show_navigation, show_footer, fetch_page, show_page_controls
+from pages.utils.profiler import profile_page, profile_section
 
 # Initialize geolocator for geocoding
 geolocator = Nominatim(user_agent="busnexus_app")
@@ -29,6 +31,7 @@ def get_coords_from_place(place):
         st.error(f"Geocoding error for '{place}': {str(e)}")
         return None
 
+@profile_page("CoordinatorDashboard")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Coordinator Dashboard - BusNexus", layout="wide")
@@ -51,7 +54,7 @@ def main():
     st.title(f"Coordinator Dashboard - Welcome, {user['first_name']}!")
     
     # Create tabs for different sections
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Overview", "Bus Management", "Route Management", "Trip Scheduling", "Driver Management"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Overview", "Bus Management", "Route Management", "Trip Scheduling", "Driver Management", "Diagnostics"])
     
     with tab1:
         display_overview()
@@ -68,25 +71,29 @@ def main():
     with tab5:
         display_driver_management()
     
+    with tab6:
+        display_diagnostics()
+    
     # Display footer
     show_footer()
 
+@profile_section
 def display_overview():
     """Display key metrics and charts in the overview tab."""
     st.subheader("Dashboard Overview")
     
     # Fetch key metrics
     total_bookings = get_total_bookings()
-    daily_revenue = get_daily_revenue(start_date=(datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d"))
-    route_popularity = get_route_popularity()
+    df_revenue = get_daily_revenue(start_date=(datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d"), as_frame=True)
+    df_routes = get_route_popularity(as_frame=True)
     
     # Display metrics in columns
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Total Bookings", total_bookings)
     with col2:
-        if daily_revenue:
-            st.metric("Revenue (Last 7 Days)", f"${sum(row['daily_revenue'] for row in daily_revenue):,.2f}")
+        if df_revenue is not None and not df_revenue.empty:
+            st.metric("Revenue (Last 7 Days)", f"${df_revenue['daily_revenue'].sum():,.2f}")
         else:
             st.metric("Revenue (Last 7 Days)", "$0.00")
     with col3:
@@ -95,15 +102,13 @@ def display_overview():
     
     # Display charts
     st.subheader("Booking Trends")
-    if daily_revenue:
-        df_revenue = pd.DataFrame(daily_revenue)
+    if df_revenue is not None and not df_revenue.empty:
         st.line_chart(df_revenue.set_index('booking_date')['daily_revenue'])
     else:
         st.info("No revenue data available for the last 7 days.")
     
     st.subheader("Route Popularity")
-    if route_popularity:
-        df_routes = pd.DataFrame(route_popularity)
+    if df_routes is not None and not df_routes.empty:
         st.bar_chart(df_routes.set_index('origin')['trip_count'])
     else:
         st.info("No route popularity data available.")
@@ -121,12 +126,17 @@ def display_overview():
         if st.button("Schedule Trip"):
             st.switch_page("pages/CoordinatorDashboard.py#trip_scheduling")
 
+@profile_section
 def display_bus_management():
     """Display bus management interface with CRUD operations."""
     st.subheader("Bus Management")
     
-    # Fetch all buses and drivers
-    buses = get_all_buses()
+    # Fetch the current page of buses and all drivers
+    buses = fetch_page(
+        "bus_page",
+        lambda after, limit: get_all_buses(after=after, limit=limit),
+        lambda bus: bus['bus_id']
+    )
     drivers = get_all_drivers()
     
     if not buses:
@@ -135,6 +145,7 @@ def display_bus_management():
         # Display buses in a table
         df_buses = pd.DataFrame(buses)
         st.dataframe(df_buses[['bus_no', 'bus_type', 'capacity', 'driver_id']])
+        show_page_controls("bus_page")
     
     # Add new bus form
     with st.expander("Add New Bus"):
@@ -151,7 +162,7 @@ def display_bus_management():
             if submit:
                 if not bus_no:
                     st.error("Bus number is required.")
-                elif any(bus['bus_no'] == bus_no for bus in buses):
+                elif bus_no_exists(bus_no):
                     st.error("Bus number must be unique.")
                 else:
                     success, bus_id = add_bus(bus_no, bus_type, capacity, driver_id)
@@ -181,7 +192,7 @@ def display_bus_management():
             if update_submit:
                 if not new_bus_no:
                     st.error("Bus number is required.")
-                elif new_bus_no != selected_bus['bus_no'] and any(bus['bus_no'] == new_bus_no for bus in buses):
+                elif new_bus_no != selected_bus['bus_no'] and bus_no_exists(new_bus_no):
                     st.error("Bus number must be unique.")
                 else:
                     success = update_bus(selected_bus['bus_id'], new_bus_no, new_bus_type, new_capacity, new_driver_id)
@@ -200,6 +211,7 @@ def display_bus_management():
                     else:
                         st.error(message)
 
+@profile_section
 def display_route_management():
     """Display route management interface with map visualization and CRUD operations."""
     st.subheader("Route Management")
@@ -344,12 +356,22 @@ def display_route_management():
                     else:
                         st.error(message)
 
+@profile_section
 def display_trip_scheduling():
     """Display trip scheduling interface with add functionality."""
     st.subheader("Trip Scheduling")
     
-    # Fetch all trips (upcoming only)
-    trips = get_all_trips(include_past=False)
+    # Fetch the current page of trips (upcoming only unless past trips are requested)
+    include_past = st.checkbox("Include past trips", key="include_past_trips")
+    include_archived = include_past and st.checkbox("Include archived months", key="include_archived_trips")
+    page_key = "trip_page_archived" if include_archived else ("trip_page_all" if include_past else "trip_page_upcoming")
+    trips = fetch_page(
+        page_key,
+        lambda after, limit: get_all_trips(
+            include_past=include_past, after=after, limit=limit, include_archived=include_archived
+        ),
+        lambda trip: (trip['departure_datetime'], trip['trip_id'])
+    )
     
     if not trips:
         st.info("No upcoming trips found. Schedule a new trip to get started.")
@@ -357,6 +379,7 @@ def display_trip_scheduling():
         # Display trips in a table
         df_trips = pd.DataFrame(trips)
         st.dataframe(df_trips[['bus_no', 'origin', 'destination', 'departure_datetime', 'arrival_datetime', 'seats_available', 'status']])
+        show_page_controls(page_key)
     
     # Schedule new trip form
     with st.expander("Schedule New Trip"):
@@ -403,12 +426,17 @@ def display_trip_scheduling():
                         else:
                             st.error("Failed to schedule trip.")
 
+@profile_section
 def display_driver_management():
     """Display driver management interface with CRUD operations."""
     st.subheader("Driver Management")
     
-    # Fetch all drivers
-    drivers = get_all_drivers()
+    # Fetch the current page of drivers
+    drivers = fetch_page(
+        "driver_page",
+        lambda after, limit: get_all_drivers(after=after, limit=limit),
+        lambda driver: driver['driver_id']
+    )
     
     if not drivers:
         st.info("No drivers found. Add a new driver to get started.")
@@ -416,6 +444,7 @@ def display_driver_management():
         # Display drivers in a table
         df_drivers = pd.DataFrame(drivers)
         st.dataframe(df_drivers[['driver_id', 'first_name', 'last_name', 'contact_no', 'license_no', 'hired_date']])
+        show_page_controls("driver_page")
     
     # Add new driver form
     with st.expander("Add New Driver"):
@@ -472,5 +501,24 @@ def display_driver_management():
                     else:
                         st.error(message)
 
+@profile_section
+def display_diagnostics():
+    """Display per-query latency statistics collected by this server process."""
+    st.subheader("Query Diagnostics")
+    st.caption(f"Statements slower than {SLOW_QUERY_THRESHOLD_MS:.0f} ms are written to {SLOW_QUERY_LOG_FILE}. "
+               "Statistics cover this server process since it started or was last reset.")
+    
+    stats = get_query_stats()
+    if not stats:
+        st.info("No queries recorded yet.")
+    else:
+        df_stats = pd.DataFrame(stats)
+        st.dataframe(df_stats[['fingerprint', 'calls', 'errors', 'slow', 'rows', 'total_ms', 'mean_ms',
+                               'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'mean_wait_ms']])
+    
+    if st.button("Reset Statistics"):
+        reset_query_stats()
+        st.rerun()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
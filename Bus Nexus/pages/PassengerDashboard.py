@@ -1,8 +1,10 @@
 import streamlit as st
 from datetime import datetime, timedelta
-from pages.utils.database import get_booking_history, cancel_booking, get_distinct_origins, get_distinct_destinations
-from pages.utils.helpers import inject_custom_css, show_navigation, show_footer, format_datetime
+from pages.utils.database import get_booking_history, get_tickets_for_bookings, cancel_booking, get_distinct_origins, get_distinct_destinations
+from pages.utils.helpers import inject_custom_css, show_navigation, show_footer, format_datetime, fetch_page, show_page_controls
+from pages.utils.profiler import profile_page, profile_section
 
+@profile_page("PassengerDashboard")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Passenger Dashboard - BusNexus", layout="wide")
@@ -33,6 +35,7 @@ def main():
     # Display footer
     show_footer()
 
+@profile_section
 def display_search_form():
     """Display the bus search form and handle search submissions."""
     st.subheader("Search Buses")
@@ -89,17 +92,30 @@ def display_search_form():
             # Redirect to search results page
             st.switch_page("pages/SearchBuses.py")
 
+@profile_section
 def display_booking_history(user_id):
     """Fetch and display the user's booking history with cancellation options."""
     st.subheader("Your Bookings")
     
-    # Fetch user's bookings from the database
-    bookings = get_booking_history(user_id)
+    # Fetch the current page of the user's bookings from the database; trips of
+    # archived months are only read when asked for
+    include_archived = st.checkbox("Show older bookings", key=f"booking_history_archived_{user_id}")
+    page_key = f"booking_history_page_{user_id}" + ("_archived" if include_archived else "")
+    bookings = fetch_page(
+        page_key,
+        lambda before, limit: get_booking_history(user_id, before=before, limit=limit, include_archived=include_archived),
+        lambda booking: (booking['booking_datetime'], booking['booking_id'])
+    )
     
     if not bookings:
         st.info("You have no bookings yet.")
         return
     
+    # Load the seats of every booking on the page in one query
+    tickets_by_booking = get_tickets_for_bookings(
+        (booking['booking_id'] for booking in bookings), include_archived=include_archived
+    )
+    
     # Display each booking in an expander
     for booking in bookings:
         with st.expander(f"Booking ID: {booking['booking_id']} - {booking['booking_status'].capitalize()}"):
@@ -109,6 +125,8 @@ def display_booking_history(user_id):
                 st.write(f"**Trip:** {booking['origin']} to {booking['destination']}")
                 st.write(f"**Departure:** {format_datetime(booking['departure_datetime'])}")
                 st.write(f"**Bus:** {booking['bus_no']} ({booking['bus_type']})")
+                seats = [str(ticket['seat_no']) for ticket in tickets_by_booking.get(booking['booking_id'], [])]
+                st.write(f"**Seats:** {', '.join(seats) if seats else 'N/A'}")
             
             with col2:
                 st.write(f"**Fare:** ${booking['total_fare']:.2f}")
@@ -124,6 +142,8 @@ def display_booking_history(user_id):
                                 st.rerun()  # Refresh page to reflect changes
                             else:
                                 st.error(message)
+    
+    show_page_controls(page_key)
 
 def is_cancellable(booking):
     """Check if a booking can be cancelled based on departure time."""
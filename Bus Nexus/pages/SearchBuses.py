@@ -1,8 +1,13 @@
 import streamlit as st
 from datetime import datetime
-from pages.utils.database import get_search_results
+from pages.utils.database import get_search_results, get_fare_calendar
 from pages.utils.helpers import inject_custom_css, show_navigation, show_footer, format_datetime
+from pages.utils.profiler import profile_page
 
+# Days either side of the search date shown in the fare calendar
+CALENDAR_DAYS = 3
+
+@profile_page("SearchBuses")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Search Buses - BusNexus", layout="wide")
@@ -30,20 +35,33 @@ def main():
     # Page title with search criteria
     st.title(f"Available Buses from {origin} to {destination} on {travel_date.strftime('%B %d, %Y')}")
     
-    # Fetch search results from the database
-    results = get_search_results(
+    # Fare calendar: picking another day reruns the search for it
+    fare_calendar = get_fare_calendar(
+        origin, destination, travel_date.strftime("%Y-%m-%d"), days=CALENDAR_DAYS, bus_type=bus_type
+    )
+    if fare_calendar:
+        for column, day in zip(st.columns(len(fare_calendar)), fare_calendar):
+            with column:
+                if day['lowest_fare'] is not None:
+                    label = f"{day['date'].strftime('%a %d %b')}\n\nfrom ${day['lowest_fare']:.2f}\n\n{day['departures']} buses, {day['seats_available']} seats"
+                else:
+                    label = f"{day['date'].strftime('%a %d %b')}\n\nNo buses"
+                selected = day['date'] == travel_date
+                if st.button(label, key=f"fare_calendar_{day['date']}", type="primary" if selected else "secondary",
+                             disabled=selected, use_container_width=True):
+                    st.session_state["search_params"] = {**search_params, "travel_date": day['date']}
+                    st.rerun()
+    
+    # Fetch search results; the filters are part of the query and of its cache key
+    filtered_results = get_search_results(
         origin=origin,
         destination=destination,
-        travel_date=travel_date.strftime("%Y-%m-%d")
+        travel_date=travel_date.strftime("%Y-%m-%d"),
+        bus_type=bus_type,
+        min_fare=min_price,
+        max_fare=max_price
     )
     
-    # Filter results based on additional parameters
-    filtered_results = [
-        result for result in results
-        if (not bus_type or result["bus_type"] == bus_type) and
-        (min_price <= result["base_fare"] <= max_price)
-    ] if results else []
-    
     # Display search results
     if not filtered_results:
         st.warning("No buses found for the selected criteria.")
@@ -65,7 +83,7 @@ def main():
                     st.write(f"**Duration:** {calculate_duration(result['departure_datetime'], result['arrival_datetime'])}")
                 
                 with col4:
-                    st.write(f"**Fare:** ${result['base_fare']:.2f}")
+                    st.write(f"**Fare:** ${result['fare']:.2f}")
                     if st.button("Book Now", key=f"book_{result['trip_id']}"):
                         # Store full trip details in session state
                         st.session_state['selected_trip'] = result
@@ -1,24 +1,33 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from pages.utils.database import get_trip_details, add_booking, get_booking_history
-from pages.utils.helpers import inject_custom_css, show_navigation, show_footer
+from pages.utils.database import get_trip_details, quote_fare, add_booking, get_booking_history
+from pages.utils.helpers import inject_custom_css, show_navigation, show_footer, fetch_page, show_page_controls
+from pages.utils.profiler import profile_page, profile_section
+from busnexus.metrics import counter, gauge, histogram
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 import os
+import uuid
 
 # Load environment variables
 load_dotenv()
 
-def send_booking_confirmation_email(user_email, booking_id, trip_details, num_seats):
+EMAILS = counter("busnexus_emails_total", "Booking confirmation emails by result", ["result"])
+EMAIL_SECONDS = histogram("busnexus_email_send_duration_seconds", "Time to send a confirmation email")
+EMAIL_QUEUE_DEPTH = gauge("busnexus_email_queue_depth", "Confirmation emails waiting on or being sent to SMTP")
+
+@profile_section
+def send_booking_confirmation_email(user_email, booking_id, trip_details, num_seats, total_fare):
     """Send a confirmation email to the user after booking."""
     # Email configuration
     sender_email = os.getenv("EMAIL_USER")
     password = os.getenv("EMAIL_PASSWORD")
 
     if not sender_email or not password:
+        EMAILS.labels(result="not_configured").inc()
         st.error("Email configuration is missing. Please check your .env file.")
         return False
 
@@ -36,7 +45,7 @@ def send_booking_confirmation_email(user_email, booking_id, trip_details, num_se
     - Departure: {trip_details['departure_datetime']}
     - Arrival: {trip_details['arrival_datetime']}
     - Number of Seats: {num_seats}
-    - Total Fare: ${trip_details['base_fare'] * num_seats:.2f}
+    - Total Fare: ${total_fare:.2f}
 
     Please keep this email for your records. For any queries, contact us at support@busnexus.com.
 
@@ -50,18 +59,25 @@ def send_booking_confirmation_email(user_email, booking_id, trip_details, num_se
     msg['Subject'] = subject
     msg.attach(MIMEText(body, 'plain'))
 
+    EMAIL_QUEUE_DEPTH.inc()
     try:
-        # Connect to Gmail SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, password)
-        server.send_message(msg)
-        server.quit()
+        with EMAIL_SECONDS.time():
+            # Connect to Gmail SMTP server
+            server = smtplib.SMTP('smtp.gmail.com', 587)
+            server.starttls()
+            server.login(sender_email, password)
+            server.send_message(msg)
+            server.quit()
+        EMAILS.labels(result="sent").inc()
         return True
     except Exception as e:
+        EMAILS.labels(result="failed").inc()
         st.error(f"Failed to send email: {e}")
         return False
+    finally:
+        EMAIL_QUEUE_DEPTH.dec()
 
+@profile_page("Booking")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Booking - BusNexus", layout="wide")
@@ -112,52 +128,86 @@ def main():
     st.write(f"**Arrival:** {selected_trip['arrival_datetime']}")
     st.write(f"**Seats Available:** {selected_trip['seats_available']}")
 
-    # Booking form
+    # One idempotency key per rendered booking form, kept until the booking succeeds,
+    # so a double-click or rerun re-submits the same key instead of booking twice
+    if st.session_state.get('booking_form_trip_id') != selected_trip['trip_id']:
+        st.session_state['booking_form_trip_id'] = selected_trip['trip_id']
+        st.session_state['booking_idempotency_key'] = uuid.uuid4().hex
+        st.session_state.pop('fare_quote', None)
+
+    # Booking form: the fare is quoted first and the booking is charged exactly the quote
     st.subheader("Booking Information")
     with st.form("booking_form"):
         num_seats = st.number_input("Number of Seats", min_value=1, max_value=selected_trip['seats_available'], step=1, value=1)
-        submit = st.form_submit_button("Confirm Booking")
+        promo_code = st.text_input("Promo Code (optional)")
+        get_fare = st.form_submit_button("Get Fare")
         
-        if submit:
+        if get_fare:
             if num_seats > selected_trip['seats_available']:
                 st.error("Requested seats exceed available seats.")
             else:
-                # Prepare booking data
-                booking_data = {
-                    "user_id": user['user_id'],
-                    "trip_id": selected_trip['trip_id'],
-                    "num_seats": num_seats,
-                    "booking_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                
-                # Call database function to add booking
-                success, booking_id = add_booking(**booking_data)
+                success, quote = quote_fare(user['user_id'], selected_trip['trip_id'], num_seats, promo_code.strip() or None)
                 if success:
-                    # Send confirmation email
-                    email_success = send_booking_confirmation_email(
-                        user_email=user['email'],
-                        booking_id=booking_id,
-                        trip_details=selected_trip,
-                        num_seats=num_seats
-                    )
-                    if email_success:
-                        st.success(f"Booking confirmed! Your booking ID is {booking_id}. A confirmation email has been sent to {user['email']}.")
-                    else:
-                        st.success(f"Booking confirmed! Your booking ID is {booking_id}. Failed to send confirmation email.")
-                    # Clear selected trip from session state
-                    del st.session_state['selected_trip']
-                    if 'selected_trip_id' in st.session_state:
-                        del st.session_state['selected_trip_id']
-                    st.rerun()
+                    st.session_state['fare_quote'] = quote
                 else:
-                    st.error("Failed to confirm booking. Please try again.")
+                    st.session_state.pop('fare_quote', None)
+                    st.error(quote)
+    
+    quote = st.session_state.get('fare_quote')
+    if quote:
+        st.write(f"**Fare per Seat:** ${quote['fare_per_seat']:.2f}"
+                 + (f" (promo {quote['promo_code']} applied)" if quote['promo_code'] else ""))
+        st.write(f"**Total Fare:** ${quote['total_fare']:.2f} for {quote['num_seats']} seat(s), "
+                 f"held until {quote['expires_at'].strftime('%H:%M')}")
+        if st.button("Confirm Booking"):
+            # Prepare booking data
+            booking_data = {
+                "user_id": user['user_id'],
+                "trip_id": selected_trip['trip_id'],
+                "num_seats": quote['num_seats'],
+                "booking_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "idempotency_key": st.session_state['booking_idempotency_key'],
+                "quote_id": quote['quote_id'],
+            }
+            
+            # Call database function to add booking
+            success, booking_id = add_booking(**booking_data)
+            if success:
+                # Send confirmation email
+                email_success = send_booking_confirmation_email(
+                    user_email=user['email'],
+                    booking_id=booking_id,
+                    trip_details=selected_trip,
+                    num_seats=quote['num_seats'],
+                    total_fare=quote['total_fare']
+                )
+                if email_success:
+                    st.success(f"Booking confirmed! Your booking ID is {booking_id}. A confirmation email has been sent to {user['email']}.")
+                else:
+                    st.success(f"Booking confirmed! Your booking ID is {booking_id}. Failed to send confirmation email.")
+                # Clear selected trip from session state
+                del st.session_state['selected_trip']
+                if 'selected_trip_id' in st.session_state:
+                    del st.session_state['selected_trip_id']
+                del st.session_state['booking_form_trip_id']
+                del st.session_state['booking_idempotency_key']
+                del st.session_state['fare_quote']
+                st.rerun()
+            else:
+                st.error(f"Failed to confirm booking: {booking_id}")
     
     # Display booking history
     st.subheader("Your Bookings")
-    bookings = get_booking_history(user['user_id'])
+    page_key = f"booking_history_page_{user['user_id']}"
+    bookings = fetch_page(
+        page_key,
+        lambda before, limit: get_booking_history(user['user_id'], before=before, limit=limit),
+        lambda booking: (booking['booking_datetime'], booking['booking_id'])
+    )
     if bookings:
         df_bookings = pd.DataFrame(bookings)
         st.dataframe(df_bookings[['booking_id', 'booking_datetime', 'total_fare', 'booking_status', 'payment_status']])
+        show_page_controls(page_key)
     else:
         st.info("No bookings found.")
     
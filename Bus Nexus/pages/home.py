@@ -1,8 +1,10 @@
 import streamlit as st
 from datetime import datetime, timedelta
 from utils.helpers import inject_custom_css, show_navigation, show_footer
+from utils.profiler import profile_page
 from utils.database import get_distinct_origins, get_distinct_destinations, get_search_results
 
+@profile_page("Home")
 def main():
     st.set_page_config(
         page_title="BusNexus - Home",
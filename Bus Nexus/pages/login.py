@@ -1,7 +1,9 @@
 import streamlit as st
 from pages.utils.database import login_user
 from pages.utils.helpers import inject_custom_css, show_navigation, show_footer
+from pages.utils.profiler import profile_page
 
+@profile_page("Login")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Login - BusNexus", layout="centered")
@@ -2,7 +2,9 @@ import streamlit as st
 import re
 from pages.utils.database import register_user
 from pages.utils.helpers import inject_custom_css, show_navigation, show_footer
+from pages.utils.profiler import profile_page
 
+@profile_page("Register")
 def main():
     # Set page configuration
     st.set_page_config(page_title="Register - BusNexus", layout="centered")
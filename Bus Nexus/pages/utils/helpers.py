@@ -23,6 +23,46 @@ def calculate_trip_duration(departure, arrival):
     else:
         return f"{hours}h {minutes}m"
 
+# Rows shown per page in paginated lists and tables
+PAGE_SIZE = 20
+
+def fetch_page(state_key, fetch, cursor_of, page_size=PAGE_SIZE):
+    """Fetch the current keyset page of a list.
+
+    fetch(cursor, limit) returns the rows that follow cursor (None for the first page)
+    and cursor_of(row) returns the cursor a page ending on that row continues from.
+    """
+    state = st.session_state.setdefault(state_key, {'cursors': [None], 'next': None})
+    
+    # Ask for one extra row to learn whether a next page exists
+    rows = fetch(state['cursors'][-1], page_size + 1) or []
+    state['next'] = cursor_of(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size]
+
+def _next_page(state_key):
+    state = st.session_state[state_key]
+    state['cursors'].append(state['next'])
+
+def _previous_page(state_key):
+    state = st.session_state[state_key]
+    state['cursors'].pop()
+
+def show_page_controls(state_key):
+    """Display Previous/Next buttons for a list fetched with fetch_page"""
+    state = st.session_state.get(state_key)
+    if not state or (len(state['cursors']) == 1 and state['next'] is None):
+        return
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("Previous", key=f"{state_key}_previous", disabled=len(state['cursors']) == 1,
+                  on_click=_previous_page, args=(state_key,))
+    with col2:
+        st.markdown(f"<div class='center-text'>Page {len(state['cursors'])}</div>", unsafe_allow_html=True)
+    with col3:
+        st.button("Next", key=f"{state_key}_next", disabled=state['next'] is None,
+                  on_click=_next_page, args=(state_key,))
+
 def inject_custom_css():
     """Inject custom CSS for styling"""
     st.markdown("""
@@ -0,0 +1,169 @@
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import pandas as pd
+import streamlit as st
+
+from busnexus.instrumentation import add_listener
+
+# Profiling is opt-in: BUSNEXUS_PROFILE=1 for every rerun, or ?profile=1 on a page URL
+PROFILE_ENV_VAR = "BUSNEXUS_PROFILE"
+PROFILE_QUERY_PARAM = "profile"
+# When set, each profiled rerun also dumps a profile of the whole page to this directory
+PROFILE_DIR = os.getenv("BUSNEXUS_PROFILE_DIR")
+# "cprofile" (default, .prof files for pstats/snakeviz) or "pyinstrument" (.html, if installed)
+PROFILER = os.getenv("BUSNEXUS_PROFILER", "cprofile")
+
+# Streamlit runs each rerun on its own thread, so the active profile is per thread
+_active = threading.local()
+
+def profiling_enabled():
+    if os.getenv(PROFILE_ENV_VAR) == "1":
+        return True
+    try:
+        return st.query_params.get(PROFILE_QUERY_PARAM) == "1"
+    except Exception:
+        return False
+
+class SectionStats:
+    """Inclusive costs of one profiled function during a rerun"""
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.wall_time = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.allocated = 0
+
+    def as_dict(self):
+        return {
+            'section': "    " * self.depth + self.name,
+            'wall_ms': round(self.wall_time * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'other_ms': round(max(self.wall_time - self.db_time, 0) * 1000, 1),
+            'queries': self.queries,
+            'allocated_kb': round(self.allocated / 1024, 1),
+        }
+
+class PageProfile:
+    def __init__(self, page):
+        self.page = page
+        self.sections = []
+        self._open = []
+
+    @contextmanager
+    def section(self, name):
+        stats = SectionStats(name, len(self._open))
+        self.sections.append(stats)
+        self._open.append(stats)
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall_time = time.perf_counter() - start
+            stats.allocated = tracemalloc.get_traced_memory()[0] - start_memory
+            self._open.pop()
+
+    def add_query(self, record):
+        # Every open section includes the statement, like wall time does
+        for stats in self._open:
+            stats.db_time += record.wait_time + record.exec_time
+            stats.queries += 1
+
+def _record_query(record, fingerprint):
+    profile = getattr(_active, "profile", None)
+    if profile is not None:
+        profile.add_query(record)
+
+add_listener(_record_query)
+
+def _start_profiler():
+    if not PROFILE_DIR:
+        return None
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            pass
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _dump_profiler(profiler, page):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path = os.path.join(PROFILE_DIR, f"{page}-{stamp}.prof")
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = os.path.join(PROFILE_DIR, f"{page}-{stamp}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    return path
+
+def show_profile(profile, dump_path=None):
+    """Display the collected section timings in a collapsible panel"""
+    page_stats = profile.sections[0]
+    with st.expander(f"Render profile: {page_stats.wall_time * 1000:.0f} ms, "
+                     f"{page_stats.queries} queries, {page_stats.db_time * 1000:.0f} ms in the database"):
+        st.dataframe(pd.DataFrame([stats.as_dict() for stats in profile.sections]), hide_index=True)
+        st.caption("Times are inclusive of nested sections. Allocations are net traced Python memory "
+                   "and include other sessions rendering at the same time.")
+        if dump_path:
+            st.caption(f"Profile written to {dump_path}")
+
+def profile_page(page):
+    """Decorator for a page's main(): profile the rerun when profiling is enabled"""
+    def decorator(page_main):
+        @wraps(page_main)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled():
+                return page_main(*args, **kwargs)
+
+            profile = PageProfile(page)
+            _active.profile = profile
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            profiler = _start_profiler()
+            dump_path = None
+            try:
+                with profile.section(page):
+                    result = page_main(*args, **kwargs)
+            finally:
+                _active.profile = None
+                if profiler is not None:
+                    dump_path = _dump_profiler(profiler, page)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            # Only reached when the page finished normally, not on st.rerun or st.switch_page
+            show_profile(profile, dump_path)
+            return result
+        return wrapper
+    return decorator
+
+def profile_section(section_function):
+    """Decorator for a page's display_* functions: time them as a section of the page profile"""
+    @wraps(section_function)
+    def wrapper(*args, **kwargs):
+        profile = getattr(_active, "profile", None)
+        if profile is None:
+            return section_function(*args, **kwargs)
+        with profile.section(section_function.__name__):
+            return section_function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,32 @@
+"""Fixtures: a fresh file-backed SQLite database per test, through the busnexus data layer."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from busnexus import database
+from busnexus.config import DatabaseConfig
+from busnexus.connection import configure
+from busnexus.schema import create_schema
+from busnexus.search_cache import configure_search_cache
+
+@pytest.fixture
+def db(tmp_path):
+    """A migrated database; a file rather than :memory: so the pool has one connection per thread"""
+    configure(DatabaseConfig.from_dsn(f"sqlite:///{tmp_path / 'busnexus.db'}"))
+    configure_search_cache(None)
+    create_schema()
+    yield
+    configure(None)
+
+@pytest.fixture
+def trip(db):
+    """A passenger and a scheduled trip two days out on a 40-seat bus"""
+    database.register_user("Test", "Passenger", "passenger@example.com", "0000000000", "password")
+    _, user = database.login_user("passenger@example.com", "password")
+    _, driver_id = database.add_driver("Test", "Driver", "0000000000", "TEST-1", "2020-01-01")
+    _, route_id = database.add_route("Boston", "New York", 300, 25, 0, 0, 0, 0)
+    _, bus_id = database.add_bus("T-1", "AC", 40, driver_id)
+    departure = datetime.now().replace(microsecond=0) + timedelta(days=2)
+    success, trip_id = database.add_trip(bus_id, route_id, departure, departure + timedelta(hours=5))
+    assert success
+    return {'trip_id': trip_id, 'user_id': user['user_id'], 'capacity': 40}
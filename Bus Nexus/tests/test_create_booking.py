@@ -0,0 +1,21 @@
+"""create_booking claims seats with the same guard as add_booking and never oversells."""
+from busnexus import database
+from busnexus.connection import query_with_params
+
+def seats_left(trip_id):
+    return query_with_params("SELECT seats_available FROM trip WHERE trip_id = %s", (trip_id,))[0]['seats_available']
+
+def test_more_seats_than_are_left_books_nothing(trip):
+    seats = [f"S{number}" for number in range(1, trip['capacity'] + 2)]
+
+    success, message = database.create_booking(trip['user_id'], trip['trip_id'], seats, 0, "Depot", "Terminal")
+
+    assert not success, message
+    assert seats_left(trip['trip_id']) == trip['capacity']
+    assert query_with_params("SELECT booking_id FROM booking WHERE trip_id = %s", (trip['trip_id'],)) == []
+
+def test_seats_that_are_left_are_booked(trip):
+    success, booking_id = database.create_booking(trip['user_id'], trip['trip_id'], ["A1", "A2"], 50, "Depot", "Terminal")
+
+    assert success, booking_id
+    assert seats_left(trip['trip_id']) == trip['capacity'] - 2
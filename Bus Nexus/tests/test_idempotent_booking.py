@@ -0,0 +1,54 @@
+"""add_booking with an idempotency key books exactly once, however many submits race."""
+import threading
+
+from busnexus import database
+from busnexus.connection import query_with_params
+
+SUBMITS = 8
+
+def test_concurrent_submits_with_one_key_book_once(trip):
+    barrier = threading.Barrier(SUBMITS)
+    results = [None] * SUBMITS
+
+    def submit(index):
+        barrier.wait()
+        results[index] = database.add_booking(trip['user_id'], trip['trip_id'], 2, idempotency_key="double-click")
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(SUBMITS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(success for success, _ in results), results
+    booking_ids = {booking_id for _, booking_id in results}
+    assert len(booking_ids) == 1
+
+    bookings = query_with_params("SELECT booking_id FROM booking WHERE trip_id = %s", (trip['trip_id'],))
+    assert [row['booking_id'] for row in bookings] == list(booking_ids)
+    tickets = query_with_params("SELECT COUNT(*) as tickets FROM ticket WHERE booking_id = %s", tuple(booking_ids))
+    assert tickets[0]['tickets'] == 2
+    # Seats were taken once, by the one booking
+    assert database.get_trip_details(trip['trip_id'])['seats_available'] == trip['capacity'] - 2
+
+def test_repeat_submit_after_commit_returns_the_booking(trip):
+    first = database.add_booking(trip['user_id'], trip['trip_id'], 1, idempotency_key="retry")
+    second = database.add_booking(trip['user_id'], trip['trip_id'], 1, idempotency_key="retry")
+    assert first == second and first[0]
+    assert database.get_trip_details(trip['trip_id'])['seats_available'] == trip['capacity'] - 1
+
+def test_key_is_per_user(trip):
+    database.register_user("Other", "Passenger", "other@example.com", "0000000000", "password")
+    _, other = database.login_user("other@example.com", "password")
+    success, first_id = database.add_booking(trip['user_id'], trip['trip_id'], 1, idempotency_key="shared")
+    success_other, other_id = database.add_booking(other['user_id'], trip['trip_id'], 1, idempotency_key="shared")
+    assert success and success_other
+    assert other_id != first_id
+    assert database.get_trip_details(trip['trip_id'])['seats_available'] == trip['capacity'] - 2
+
+def test_key_reused_for_a_different_booking_fails(trip):
+    success, _ = database.add_booking(trip['user_id'], trip['trip_id'], 1, idempotency_key="reused")
+    assert success
+    success, message = database.add_booking(trip['user_id'], trip['trip_id'], 3, idempotency_key="reused")
+    assert not success and "different booking" in message
+    assert database.get_trip_details(trip['trip_id'])['seats_available'] == trip['capacity'] - 1
@@ -0,0 +1,27 @@
+"""_move_trips touches only the trips it actually moves."""
+from busnexus import database, lifecycle
+from busnexus.connection import query_with_params, execute_query
+
+def events_for(trip_ids):
+    placeholders = ", ".join(["%s"] * len(trip_ids))
+    rows = query_with_params(f"SELECT row_key FROM change_event WHERE table_name = 'trip' AND row_key IN ({placeholders})",
+                             tuple(trip_ids))
+    return sorted(int(row['row_key']) for row in rows)
+
+def test_trips_moved_elsewhere_get_no_event_and_keep_their_bookings(trip):
+    # A second trip on the same bus and route, with a booking, that another runner already moved
+    other = query_with_params("SELECT bus_id, route_id, departure_datetime, arrival_datetime FROM trip WHERE trip_id = %s",
+                              (trip['trip_id'],))[0]
+    _, other_id = database.add_trip(other['bus_id'], other['route_id'], other['departure_datetime'],
+                                    other['arrival_datetime'])
+    success, booking_id = database.add_booking(trip['user_id'], other_id, 1)
+    assert success
+    execute_query("UPDATE trip SET status = 'departed' WHERE trip_id = %s", (other_id,))
+    execute_query("DELETE FROM change_event")
+
+    moved, completed = lifecycle._move_trips([trip['trip_id'], other_id], "scheduled", "completed")
+
+    assert (moved, completed) == (1, 0)
+    assert events_for([trip['trip_id'], other_id]) == [trip['trip_id']]
+    booking = query_with_params("SELECT booking_status FROM booking WHERE booking_id = %s", (booking_id,))
+    assert booking[0]['booking_status'] == 'booked'
@@ -0,0 +1,50 @@
+"""send_pending makes one pass over the queue; refused messages wait for the next call."""
+import smtplib
+from datetime import datetime
+
+from busnexus import notifications
+from busnexus.connection import query_with_params
+from busnexus.notifications import Notification
+
+class FakeSMTP:
+    """Accepts every message except those to `refuse`"""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.attempts = []
+
+    def send_message(self, message):
+        self.attempts.append(message['To'])
+        if message['To'] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({message['To']: (550, b"mailbox unavailable")})
+
+    def quit(self):
+        pass
+
+def queue(count):
+    notifications.enqueue(Notification(booking_id, "reminder_2h", f"user{booking_id}@example.com",
+                                       "Reminder", "Your trip departs soon", datetime.now())
+                          for booking_id in range(1, count + 1))
+
+def status_of(recipient):
+    return query_with_params("SELECT status, attempts FROM notification WHERE recipient = %s", (recipient,))[0]
+
+def test_refused_message_is_not_retried_in_the_same_call(db):
+    queue(5)
+    server = FakeSMTP(refuse=["user2@example.com"])
+
+    sent = notifications.send_pending(batch_size=2, connect=lambda: server)
+
+    assert sent == 4
+    assert server.attempts.count("user2@example.com") == 1
+    assert status_of("user2@example.com") == {'status': 'pending', 'attempts': 1}
+
+def test_refused_message_is_retried_by_the_next_call_until_it_fails(db):
+    queue(1)
+    server = FakeSMTP(refuse=["user1@example.com"])
+
+    for _ in range(notifications.MAX_ATTEMPTS):
+        assert notifications.send_pending(connect=lambda: server) == 0
+
+    assert server.attempts == ["user1@example.com"] * notifications.MAX_ATTEMPTS
+    assert status_of("user1@example.com") == {'status': 'failed', 'attempts': notifications.MAX_ATTEMPTS}
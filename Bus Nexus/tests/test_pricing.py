@@ -0,0 +1,32 @@
+"""Dynamic fares round half up to the cent, step at the exact time and are repriced each day."""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from busnexus import pricing
+
+# A Monday, whose day-of-week multiplier is 1.00
+DEPARTURE = datetime(2026, 11, 2, 9, 0)
+
+def make_trip(base_fare=Decimal("12.50"), bus_type="Non-AC", capacity=40, seats_available=40, trip_id=1):
+    return {'trip_id': trip_id, 'base_fare': base_fare, 'bus_type': bus_type, 'capacity': capacity,
+            'seats_available': seats_available, 'departure_datetime': DEPARTURE}
+
+def test_half_cent_rounds_up():
+    # 12.50 x 0.90 (Non-AC) x 0.90 (21+ days out) is exactly 10.125, which binary floats hold as 10.12499...
+    assert pricing.price_per_seat([make_trip()], now=DEPARTURE - timedelta(days=30)) == [Decimal("10.13")]
+
+def test_days_out_step_is_reached_at_the_exact_time():
+    trip = make_trip(base_fare=Decimal("100.00"), bus_type="Deluxe")
+    # 100 x 1.35 (Deluxe) x 1.15 (2 to 7 days out) = 155.25; under 2 days the 1.30 step applies
+    assert pricing.price_per_seat([trip], now=DEPARTURE - timedelta(days=2)) == [Decimal("155.25")]
+    assert pricing.price_per_seat([trip], now=DEPARTURE - timedelta(days=2) + timedelta(seconds=1)) == [
+        Decimal("175.50")
+    ]
+
+def test_price_table_reprices_on_a_new_day(monkeypatch):
+    monkeypatch.setattr(pricing, "_price_table", pricing.PriceTable())
+    # 21 days 10 hours out the evening before, 20 days 23 hours out the next morning
+    evening, morning = datetime(2026, 10, 11, 23, 0), datetime(2026, 10, 12, 10, 0)
+    assert pricing.apply_prices([make_trip()], now=evening)[0]['fare'] == Decimal("10.13")
+    # 12.50 x 0.90 x 1.00 (7 to 21 days out)
+    assert pricing.apply_prices([make_trip()], now=morning)[0]['fare'] == Decimal("11.25")